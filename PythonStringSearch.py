@@ -1,11 +1,41 @@
+import io
 import os
+import sys
 import re
+import errno
+import struct
+import ctypes
+import ctypes.util
+import asyncio
+import bz2
+import lzma
+import zlib
+import sqlite3
+import json
+import hashlib
+import fnmatch
+import argparse
+import time
 import datetime
 import gzip
+import mmap
+import queue
+import threading
 import traceback
+import glob
+import heapq
+import cProfile
+import pstats
 import concurrent.futures
+import multiprocessing.util
+from collections import deque
 from tqdm import tqdm # Import tqdm
 
+try:
+    import zstandard  # Optional: enables searching zstd-compressed files (pip install zstandard).
+except ImportError:
+    zstandard = None
+
 # --- Configuration ---
 # Directory to search for files.
 target_directory = r"C:\Your\Log\Directory" # CHANGE THIS to the root directory you want to search.
@@ -14,159 +44,2649 @@ output_file_path = r"C:\Your\Output\found_strings_with_context.txt" # CHANGE THI
 # Set to True to search subdirectories recursively, False for just the top-level target_directory.
 include_subdirectories = True
 
-# Define file extensions to IGNORE.
-# Files with these extensions will be skipped entirely.
-# Ensure extensions start with a dot and are in lowercase (e.g., ".exe", ".tmp").
-ignore_extensions = [
-    ".cur",       # Example: Windows cursor files (typically binary)
-    ".exe",       # Example: Executable files
-    ".dll",       # Example: Library files
-    ".journal",   # Example: If these are binary systemd journals on your system
-]
+# Define file extensions to IGNORE.
+# Files with these extensions will be skipped entirely.
+# Ensure extensions start with a dot and are in lowercase (e.g., ".exe", ".tmp").
+ignore_extensions = [
+    ".cur",       # Example: Windows cursor files (typically binary)
+    ".exe",       # Example: Executable files
+    ".dll",       # Example: Library files
+    ".journal",   # Example: If these are binary systemd journals on your system
+]
+
+# Files whose first BINARY_SNIFF_BYTES (after decompression) look like binary data - a NUL byte, or more
+# than BINARY_NON_TEXT_RATIO of control characters - are handled according to BINARY_FILE_HANDLING, whatever
+# their extension. Bytes that are not valid UTF-8 do not count: logs in cp1251, Shift-JIS etc. are text.
+#   "skip" - not searched, and listed in the skipped files log with the reason.
+#   "raw"  - searched anyway, but each hit's context is cut down to a short, printable excerpt around the hit.
+#   "text" - no check; every file is searched as text.
+BINARY_FILE_HANDLING = "skip"
+BINARY_SNIFF_BYTES = 8192
+BINARY_NON_TEXT_RATIO = 0.3
+# In "raw" mode, how many characters of context are kept on each side of a hit.
+BINARY_CONTEXT_CHARS = 60
+
+# Optional glob patterns (fnmatch syntax, e.g. "*.log") that narrow down which files are searched.
+# A pattern without a "/" is matched against the file or directory name, one with a "/" against the
+# path relative to target_directory, written with "/" (e.g. "archive/2023*/*.gz").
+# If include_file_globs is not empty, only files matching one of its patterns are searched.
+include_file_globs = []
+# Files matching one of these patterns are not searched.
+exclude_file_globs = []
+# Directories matching one of these patterns are not entered at all (e.g. ".git", "node_modules").
+exclude_directory_globs = []
+# Only search files of at least / at most this many bytes. None means no limit.
+min_file_size_bytes = None
+max_file_size_bytes = None
+# Only search files last modified after / before this moment, e.g. datetime.datetime(2024, 5, 1).
+# None means no limit.
+modified_after = None
+modified_before = None
+
+# List of specific strings to search for in the files.
+strings_to_search = [
+    "edge-services-qa.stgedge.com", 
+    "ERROR_CODE_XYZ",               
+    "UserLoginFailedEvent",         
+    "critical system alert",
+    "testtest.com"                  
+]
+
+# Size of the raw byte blocks read from each file (in bytes). Files of any size are scanned
+# block by block, so memory use stays around this size no matter how big the file is.
+SCAN_BLOCK_SIZE_BYTES = 8 * 1024 * 1024
+# Set to True to memory-map plain (uncompressed) files instead of reading them into a buffer.
+USE_MMAP_FOR_PLAIN_FILES = False
+
+# Uncompressed files at least this big (in bytes) are split into line-aligned byte ranges that
+# several workers search at once, so one huge log does not keep a single core busy while the others idle.
+MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES = 500 * 1024 * 1024
+# Approximate size of each of those byte ranges (in bytes).
+PLAIN_TEXT_SHARD_SIZE_BYTES = 128 * 1024 * 1024
+
+# Compressed files (gzip, bz2, xz and, with the optional 'zstandard' package, zstd) are recognised
+# by their leading magic bytes, whatever their extension.
+# Compressed files at least this big are split across several workers when their format allows
+# it (BGZF-style blocked gzip and multi-frame zstd); others are always searched by one worker.
+COMPRESSED_SPLIT_THRESHOLD_BYTES = 1024 * 1024 * 1024
+# Approximate compressed size of each piece such a file is split into (in bytes).
+COMPRESSED_SPLIT_TARGET_BYTES = 256 * 1024 * 1024
+
+# Results are streamed to output_file_path by a background writer as each file finishes.
+# Maximum number of per-file result batches waiting for the writer before the search pauses.
+RESULT_WRITER_QUEUE_MAX_BATCHES = 64
+# Size of the output file's write buffer (in bytes).
+RESULT_WRITER_BUFFER_BYTES = 1024 * 1024
+# Set to True to write results in the order the files were found instead of the order they finish.
+# Output is then the same on every run, but files that finish early wait in memory for earlier ones.
+WRITE_RESULTS_IN_FILE_ORDER = False
+# What is written for each file searched:
+#   "lines" - every hit, with its line number and the line as context.
+#   "count" - only the number of hits of each string in the file. Workers just count, without decoding
+#             lines or building any context, so this is much faster on files with many hits.
+#   "files" - only the path of each file with at least one hit. A file is read no further than its first hit
+#             (except files split into parts, whose parts are always read whole).
+OUTPUT_MODE = "lines"
+# Format of output_file_path:
+#   "text"   - one readable line per result, as shown under "Output File Structure" in the README.
+#   "jsonl"  - one JSON object per line, e.g. {"path": ..., "line": 12, "string": ..., "context": ...}.
+#   "binary" - a compact file of numbered paths and length-prefixed records, without a timestamp on every
+#              record; read it back with iter_binary_results().
+# With "jsonl" and "binary" the skipped files log goes to output_file_path + ".skipped.txt" instead.
+OUTPUT_FORMAT = "text"
+# Set to True to write each file path only once in "jsonl" output, as {"path_id": 0, "path": ...} before
+# the file's first result, and to give results a "path_id" instead of the path. "binary" always does this.
+OUTPUT_PATH_DICTIONARY = False
+
+# Files are listed by a background thread while the workers already search the first ones found.
+# Maximum number of directory listings waiting to be planned before the listing pauses.
+FILE_WALKER_QUEUE_MAX_DIRECTORIES = 256
+
+# Number of worker processes that search (and build the content index). None uses all but two of the CPU cores.
+WORKER_PROCESS_COUNT = None
+
+# Work is handed to the worker processes in batches; at most this many batches per worker are
+# submitted at a time, so memory use does not grow with the number of files.
+SCHEDULER_BATCHES_IN_FLIGHT_PER_WORKER = 4
+# Small files are packed into one batch until it holds about this many bytes or this many files.
+SCHEDULER_BATCH_TARGET_BYTES = 32 * 1024 * 1024
+SCHEDULER_BATCH_MAX_FILES = 256
+# Set to True to start with the largest files and parts, so that no big file is left running alone at the end.
+SCHEDULER_LARGEST_FIRST = True
+# Compressed data is counted as this many times its size when estimating work (roughly its compression ratio).
+SCHEDULER_COMPRESSED_SIZE_FACTOR = 4
+# Set to True to print how busy each worker process was after the search.
+SCHEDULER_REPORT_UTILISATION = True
+
+# Set to True to have the workers measure every file they search (bytes read, lines, time spent reading
+# and decompressing versus scanning, hits) and print where the time went after the search, with the
+# slowest files and folders. When False, nothing is measured and the search runs at full speed.
+COLLECT_FILE_METRICS = False
+# How many of the slowest files and folders that report lists.
+METRICS_SLOWEST_COUNT = 10
+# Path of a JSON file to save that report to, e.g. r"C:\Your\Output\metrics.json" (turns COLLECT_FILE_METRICS on).
+METRICS_OUTPUT_PATH = None
+# Path of a cProfile file covering the whole search, the main process and all workers together, to be read
+# with pstats or a viewer such as snakeviz. None disables profiling.
+PROFILE_OUTPUT_PATH = None
+
+# Path of an SQLite file that remembers what earlier runs searched and found, e.g. r"C:\Your\Output\scan_state.sqlite".
+# A repeat run with the same strings_to_search then only searches new files and data appended to files
+# since the last run, and copies the earlier hits into the output. None searches everything every time.
+INCREMENTAL_STATE_PATH = None
+
+# Path of an SQLite content index, built or brought up to date with "python PythonStringSearch.py build-index".
+# While it exists, searches only read the blocks of indexed files that can contain one of strings_to_search,
+# whatever the strings are. None disables it.
+CONTENT_INDEX_PATH = None
+# Plain files are indexed in line-aligned blocks of about this many bytes; a search reads whole blocks.
+CONTENT_INDEX_BLOCK_SIZE_BYTES = 1024 * 1024
+
+# Follow mode ("python PythonStringSearch.py follow ...") keeps watching target_directory and searches the
+# lines added to its files as they are written. Changes are picked up through inotify on Linux; elsewhere
+# (or if inotify runs out of watches) the tree is checked for changes every FOLLOW_POLL_INTERVAL_SECONDS.
+FOLLOW_POLL_INTERVAL_SECONDS = 1.0
+# Set to True to also search what the files already hold when following starts, instead of only new lines.
+FOLLOW_FROM_START = False
+# At most this many bytes of one file are read at a time, so one fast-growing file cannot hold up the others.
+FOLLOW_MAX_READ_BYTES = 64 * 1024 * 1024
+
+
+# --- Multi-Pattern Matching ---
+# Characters that re.IGNORECASE treats as equal to an ASCII letter but that str.lower()
+# either leaves alone or expands to more than one character.
+_IGNORECASE_ASCII_ALIASES = {
+    "\u0130": "i",  # LATIN CAPITAL LETTER I WITH DOT ABOVE
+    "\u0131": "i",  # LATIN SMALL LETTER DOTLESS I
+    "\u017f": "s",  # LATIN SMALL LETTER LONG S
+    "\u212a": "k",  # KELVIN SIGN
+}
+_IGNORECASE_FOLD_TABLE = str.maketrans(_IGNORECASE_ASCII_ALIASES)
+
+
+def fold_case_for_matching(text):
+    """
+    Lower-cases text so that a plain substring search for a lower-cased ASCII pattern
+    finds exactly what re.IGNORECASE would. The result always has the same length as
+    the input, so positions found in it are valid positions in the original text.
+    """
+    if text.isascii():
+        return text.lower()
+    return text.translate(_IGNORECASE_FOLD_TABLE).lower()
+
+
+def _render_folded_char_as_utf8(char):
+    """Regex source matching the UTF-8 bytes of every character that folds to this ASCII char."""
+    aliases = [alias for alias, letter in _IGNORECASE_ASCII_ALIASES.items() if letter == char]
+    if not aliases:
+        return re.escape(char)
+    alias_sources = ["".join(f"\\x{byte:02x}" for byte in alias.encode("utf-8")) for alias in aliases]
+    return "(?:" + "|".join([re.escape(char)] + alias_sources) + ")"
+
+
+def _build_trie_regex(words, render_char=re.escape):
+    """
+    Builds a regex source string matching any of the given (already folded) words.
+    Shared prefixes are merged, so the regex engine follows one branch per position
+    instead of trying every word in turn like a flat 'a|b|c' alternation does.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = None  # End-of-word marker.
+
+    def render(node):
+        parts = []
+        while True:
+            is_word_end = "" in node
+            branches = [(char, child) for char, child in node.items() if char != ""]
+            if len(branches) == 1 and not is_word_end:
+                # Collapse single-child chains without recursing.
+                char, node = branches[0]
+                parts.append(render_char(char))
+                continue
+            if branches:
+                alternatives = "|".join(render_char(char) + render(child) for char, child in sorted(branches))
+                parts.append(f"(?:{alternatives})" + ("?" if is_word_end else ""))
+            return "".join(parts)
+
+    return render(trie)
+
+
+class MultiPatternMatcher:
+    """
+    Reports every configured string found in a line while scanning the line only once.
+
+    A trie-shaped regex over all case-folded patterns cheaply rejects the (usual) lines
+    without any hit; lines that pass are run through an Aho-Corasick automaton to find
+    every pattern they contain, including patterns that overlap or contain each other.
+    Matching is equivalent to running each re.compile(re.escape(s), re.IGNORECASE)
+    pattern separately, and indices come back in strings_to_search order.
+    Patterns that do not fold to ASCII are rare enough that they are simply checked
+    one by one with their own compiled regex.
+
+    bytes_prefilter is the same trie as a bytes regex for use on bytes.lower()'d UTF-8
+    data, so raw file blocks can be searched without decoding them first. It is None
+    when some pattern can only be checked on decoded text.
+    """
+
+    def __init__(self, compiled_patterns_with_originals):
+        self.patterns = list(compiled_patterns_with_originals)
+        self.originals = [original for original, _ in self.patterns]
+
+        automaton_words = []
+        self._fallback_patterns = []
+        for pattern_index, (original_string, compiled_pattern) in enumerate(self.patterns):
+            folded = fold_case_for_matching(original_string)
+            if folded and folded.isascii():
+                automaton_words.append((pattern_index, folded))
+            else:
+                self._fallback_patterns.append((pattern_index, compiled_pattern))
+
+        self._goto, self._fail, self._output = self._build_automaton(automaton_words)
+        self._prefilter = None
+        self.bytes_prefilter = None
+        if automaton_words:
+            unique_words = {word for _, word in automaton_words}
+            self._prefilter = re.compile(_build_trie_regex(unique_words))
+            if not self._fallback_patterns:
+                self.bytes_prefilter = re.compile(
+                    _build_trie_regex(unique_words, _render_folded_char_as_utf8).encode("ascii"))
+
+    @staticmethod
+    def _build_automaton(indexed_words):
+        goto = [{}]
+        fail = [0]
+        output = [()]
+        for pattern_index, word in indexed_words:
+            state = 0
+            for char in word:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                    goto[state][char] = next_state
+                state = next_state
+            output[state] += (pattern_index,)
+
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail_target = goto[fallback].get(char, 0)
+                fail[next_state] = fail_target if fail_target != next_state else 0
+                output[next_state] += output[fail[next_state]]
+        return goto, fail, output
+
+    def _automaton_matches(self, folded_text):
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in folded_text:
+            while True:
+                next_state = goto[state].get(char)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def match_line(self, line):
+        """Returns the sorted indices of every pattern that occurs in line."""
+        found = None
+        if self._prefilter is not None:
+            folded_line = line.lower() if line.isascii() else fold_case_for_matching(line)
+            if self._prefilter.search(folded_line):
+                found = self._automaton_matches(folded_line)
+        for pattern_index, compiled_pattern in self._fallback_patterns:
+            if compiled_pattern.search(line):
+                if found is None:
+                    found = set()
+                found.add(pattern_index)
+        return sorted(found) if found else []
+
+
+# --- Block Scanning ---
+_LINE_BREAK_BYTES_RE = re.compile(rb"\r\n|\r|\n")
+
+
+def _count_line_breaks(data, start, end):
+    """Counts line breaks the way text mode does: '\r\n', '\r' and '\n' each end one line."""
+    return data.count(b"\n", start, end) + data.count(b"\r", start, end) - data.count(b"\r\n", start, end)
+
+
+def _line_aligned_cut(data, start, end):
+    """
+    Returns the position just after the last complete line break in data[start:end], or start
+    if there is none. A trailing '\r' is not treated as complete, since a '\n' may follow it.
+    """
+    return max(data.rfind(b"\n", start, end), data.rfind(b"\r", start, end - 1), start - 1) + 1
+
+
+def read_block_size_for(byte_count):
+    """
+    Size of the read buffer for about byte_count bytes of data: SCAN_BLOCK_SIZE_BYTES, or less
+    for small inputs, since setting up a full-size buffer for each small file costs more than reading it.
+    """
+    return min(SCAN_BLOCK_SIZE_BYTES, max(64 * 1024, byte_count + 1))
+
+
+def iter_stream_blocks(binary_stream, block_size=None):
+    """
+    Reads a binary stream in large blocks and yields (buffer, 0, end) regions holding only
+    complete lines (plus the unterminated last line at EOF). Lines longer than a block are
+    carried over until their end is seen. The buffer is reused, so each region must be
+    consumed before the next one is requested.
+    """
+    read_size = block_size or SCAN_BLOCK_SIZE_BYTES
+    # readinto1 hands back data as soon as the stream has some, so if a corrupt or truncated
+    # compressed stream fails part-way through a block, the lines before the failure still get searched.
+    read_some_into = getattr(binary_stream, "readinto1", None) or binary_stream.readinto
+    pending = bytearray()
+    chunk = bytearray(read_size)
+    chunk_view = memoryview(chunk)
+    at_eof = False
+    while not at_eof:
+        filled = 0
+        read_error = None
+        try:
+            while filled < read_size:
+                bytes_read = read_some_into(chunk_view[filled:])
+                if not bytes_read:
+                    at_eof = True
+                    break
+                filled += bytes_read
+        except Exception as e_read:
+            read_error = e_read
+        pending += chunk_view[:filled]
+        cut = _line_aligned_cut(pending, 0, len(pending))
+        if cut:
+            yield pending, 0, cut
+            del pending[:cut]
+        if read_error is not None:
+            raise read_error
+    if pending:
+        yield pending, 0, len(pending)
+
+
+def iter_mmap_blocks(mapped_file, block_size=None, start_offset=0, end_offset=None):
+    """
+    Like iter_stream_blocks, but yields line-aligned windows of a memory-mapped file,
+    optionally limited to the byte range start_offset:end_offset.
+    """
+    window_size = block_size or SCAN_BLOCK_SIZE_BYTES
+    total_size = len(mapped_file) if end_offset is None else end_offset
+    window_start = start_offset
+    while window_start < total_size:
+        window_end = min(window_start + window_size, total_size)
+        cut = window_end
+        while cut < total_size:
+            cut = _line_aligned_cut(mapped_file, window_start, window_end)
+            if cut > window_start:
+                break
+            window_end = min(window_end + window_size, total_size)  # No line break yet: widen the window.
+            cut = window_end
+        yield mapped_file, window_start, cut
+        window_start = cut
+
+
+def _timed_blocks(blocks, stream_metrics):
+    """Passes blocks on, adding the time spent waiting for them (reading, decompressing) and their size to stream_metrics."""
+    block_iterator = iter(blocks)
+    while True:
+        wait_started_at = time.perf_counter()
+        block = next(block_iterator, None)
+        stream_metrics['read_seconds'] += time.perf_counter() - wait_started_at
+        if block is None:
+            return
+        stream_metrics['content_bytes'] += block[2] - block[1]
+        yield block
+
+
+def _is_valid_utf8(data):
+    if data.isascii():
+        return True
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _count_decode_fallback(line_bytes, stream_metrics):
+    if not _is_valid_utf8(line_bytes):
+        stream_metrics['decode_fallbacks'] += 1
+
+
+def iter_stream_hits(blocks, pattern_matcher, first_line_number=1, stream_metrics=None):
+    """
+    Searches line-aligned raw byte regions (from iter_stream_blocks or iter_mmap_blocks) and
+    yields (line_number, line_text, pattern_indices, line_offset) for every line that contains
+    a hit, where line_offset is where the line starts, counted in bytes from the first region.
+
+    Regions are case-folded as bytes and searched with the matcher's bytes prefilter, so only
+    lines around a candidate hit are split out, decoded (UTF-8, undecodable bytes ignored)
+    and confirmed with pattern_matcher.match_line. A region that is not valid UTF-8 has every
+    line decoded and checked instead, as dropping the undecodable bytes can join a string that
+    the raw bytes split. Line numbers count '\r\n', '\r' and '\n' line endings the same way
+    Python's text mode does.
+
+    If stream_metrics is a dict (see new_file_metrics), the time spent waiting for blocks, the
+    bytes and lines scanned and the hit lines that were not valid UTF-8 are added to it.
+    """
+    if stream_metrics is not None:
+        blocks = _timed_blocks(blocks, stream_metrics)
+    bytes_prefilter = pattern_matcher.bytes_prefilter
+    line_number = first_line_number
+    next_region_offset = 0
+    for data, start, end in blocks:
+        region = data[start:end]
+        region_offset = next_region_offset
+        next_region_offset += end - start
+        if bytes_prefilter is None or not _is_valid_utf8(region):
+            # Some pattern can only be checked on decoded text, or the region holds bytes that
+            # decoding drops (b"f\xffoo" reads as "foo"), so every line is a candidate.
+            line_start = 0
+            for line_break in _LINE_BREAK_BYTES_RE.finditer(region):
+                line_text = region[line_start:line_break.end()].decode("utf-8", errors="ignore")
+                pattern_indices = pattern_matcher.match_line(line_text)
+                if pattern_indices:
+                    if stream_metrics is not None:
+                        _count_decode_fallback(region[line_start:line_break.end()], stream_metrics)
+                    yield line_number, line_text, pattern_indices, region_offset + line_start
+                line_number += 1
+                line_start = line_break.end()
+            if line_start < len(region):
+                line_text = region[line_start:].decode("utf-8", errors="ignore")
+                pattern_indices = pattern_matcher.match_line(line_text)
+                if pattern_indices:
+                    if stream_metrics is not None:
+                        _count_decode_fallback(region[line_start:], stream_metrics)
+                    yield line_number, line_text, pattern_indices, region_offset + line_start
+                line_number += 1
+            continue
+
+        folded_region = region.lower()
+        counted_up_to = 0
+        search_from = 0
+        while True:
+            candidate = bytes_prefilter.search(folded_region, search_from)
+            if candidate is None:
+                break
+            hit_at = candidate.start()
+            line_start = max(folded_region.rfind(b"\n", 0, hit_at), folded_region.rfind(b"\r", 0, hit_at)) + 1
+            line_break = _LINE_BREAK_BYTES_RE.search(folded_region, hit_at)
+            line_end = line_break.end() if line_break else len(folded_region)
+
+            line_number += _count_line_breaks(folded_region, counted_up_to, line_start)
+            counted_up_to = line_start
+            line_text = region[line_start:line_end].decode("utf-8", errors="ignore")
+            pattern_indices = pattern_matcher.match_line(line_text)
+            if pattern_indices:
+                if stream_metrics is not None:
+                    _count_decode_fallback(region[line_start:line_end], stream_metrics)
+                yield line_number, line_text, pattern_indices, region_offset + line_start
+            search_from = line_end
+        line_number += _count_line_breaks(folded_region, counted_up_to, len(folded_region))
+    if stream_metrics is not None:
+        stream_metrics['lines'] += line_number - first_line_number
+
+
+# --- Files Split Into Shards ---
+def _last_line_break_end(data, start, end):
+    """
+    Returns the offset just after the last complete line break in data[start:end], or -1. A '\r'
+    at the very end does not count: it may be the first half of a '\r\n' that goes on in the
+    next block.
+    """
+    if end > start and data[end - 1:end] == b"\r":
+        end -= 1
+    last_break_at = max(data.rfind(b"\n", start, end), data.rfind(b"\r", start, end))
+    return last_break_at + 1 if last_break_at >= 0 else -1
+
+
+def _iter_shard_body_blocks(blocks, shard_summary, keep_head, keep_tail):
+    """
+    Filters the blocks of one shard of a file so that only whole lines reach the scanner.
+
+    A shard that does not start the file may begin mid-line, so with keep_head the bytes up
+    to and including its first line break are set aside as shard_summary['head']; with keep_tail
+    the bytes after its last line break are set aside as shard_summary['tail']. Line breaks are
+    '\n', '\r\n' and '\r', as for iter_stream_hits, so files with old Mac line endings are not
+    carried whole to the parent. The parent joins each tail with the next shard's head (see
+    ShardResultMerger). shard_summary['line_breaks'] counts the line breaks in what was passed
+    on, which is needed to number later shards.
+    """
+    shard_summary.update(head=b"", head_complete=not keep_head, tail=b"", line_breaks=0)
+    head = bytearray() if keep_head else None
+    held_tail = bytearray()
+    for data, start, end in blocks:
+        if head is not None:
+            if start == end:
+                continue
+            if head.endswith(b"\r"):
+                # The head's line break was a '\r' at the end of the last block; it may go on with a '\n'.
+                if data[start:start + 1] == b"\n":
+                    head += b"\n"
+                    start += 1
+                head_end = start
+            else:
+                line_break = _LINE_BREAK_BYTES_RE.search(data, start, end)
+                if line_break is None or (line_break.group() == b"\r" and line_break.end() == end):
+                    head += data[start:end]
+                    continue
+                head_end = line_break.end()
+                head += data[start:head_end]
+            shard_summary["head"] = bytes(head)
+            shard_summary["head_complete"] = True
+            head = None
+            start = head_end
+        if not keep_tail:
+            if start < end:
+                body = data[start:end]
+                shard_summary["line_breaks"] += _count_line_breaks(body, 0, len(body))
+                yield body, 0, len(body)
+            continue
+        body_end = _last_line_break_end(data, start, end)
+        if body_end < 0:
+            held_tail += data[start:end]
+            continue
+        body = held_tail + data[start:body_end]
+        held_tail = bytearray(data[body_end:end])
+        shard_summary["line_breaks"] += _count_line_breaks(body, 0, len(body))
+        yield body, 0, len(body)
+    if head is not None:
+        shard_summary["head"] = bytes(head)
+    shard_summary["tail"] = bytes(held_tail)
+
+
+class ShardResultMerger:
+    """
+    Puts the results of a file that was searched as several shards back together in order.
+
+    Shards report line numbers relative to their own first whole line, plus their partial
+    first/last lines (see _iter_shard_body_blocks). As shards finish, add() returns the
+    results that can now be numbered: those of every shard whose predecessors are all done,
+    with absolute line numbers and with hits from the lines spanning shard edges included.
+
+    lines_before_first_shard is the number of lines before the first shard's start (non-zero
+    when only the end of a file is searched). When end_offset, the byte offset where the last
+    shard ends, is given, resume_offset and resume_line_count are set once every shard has been
+    merged: the offset just after the last line break and the number of lines before it, i.e. where
+    a later search of data appended to the file can pick up. hit_counts counts, as
+    {pattern_index: hits}, the hits found here in those edge-spanning lines, which no worker sees.
+    """
+
+    def __init__(self, file_path, shard_count, first_sequence_number, pattern_matcher,
+                 lines_before_first_shard=0, end_offset=None):
+        self.file_path = file_path
+        self.shard_count = shard_count
+        self.first_sequence_number = first_sequence_number
+        self.pattern_matcher = pattern_matcher
+        self.end_offset = end_offset
+        self.failed_shard_index = None
+        self.finished = False
+        self.resume_offset = None
+        self.resume_line_count = None
+        self.hit_counts = {}
+        self._finished_shards = {}
+        self._next_shard_index = 0
+        self._lines_before_next_shard = lines_before_first_shard
+        self._carried_bytes = bytearray()
+
+    def add(self, shard_index, records, shard_summary, failed=False):
+        """
+        Stores a finished shard and returns a list of (sequence_number, records) pairs that
+        are ready to be written. A failed shard's results are kept as far as they can be
+        numbered (shard_summary may be None), but nothing after it can be.
+        """
+        self._finished_shards[shard_index] = (records, shard_summary, failed)
+        ready = []
+        while self._next_shard_index in self._finished_shards:
+            shard_records, summary, shard_failed = self._finished_shards.pop(self._next_shard_index)
+            ready.append((self.first_sequence_number + self._next_shard_index,
+                          self._merge_shard(self._next_shard_index, shard_records, summary, shard_failed)))
+            self._next_shard_index += 1
+        if self._next_shard_index == self.shard_count:
+            self.finished = True
+        return ready
+
+    def _scan_carried_bytes(self):
+        carried = bytes(self._carried_bytes)
+        self._carried_bytes = bytearray()
+        merged_records = []
+        for line_number, line_content, pattern_indices, _line_offset in iter_stream_hits(
+                [(carried, 0, len(carried))], self.pattern_matcher, self._lines_before_next_shard + 1):
+            _count_hits(self.hit_counts, pattern_indices)
+            context = line_content.strip()
+            merged_records.extend((line_number, pattern_index, context) for pattern_index in pattern_indices)
+        self._lines_before_next_shard += _count_line_breaks(carried, 0, len(carried))
+        return merged_records
+
+    def _merge_shard(self, shard_index, records, shard_summary, failed):
+        if self.failed_shard_index is not None:
+            return []  # Line numbers after a failed shard are unknown, so its successors are dropped.
+        if failed:
+            self.failed_shard_index = shard_index
+        if not shard_summary:
+            return []
+
+        merged_records = []
+        self._carried_bytes += shard_summary["head"]
+        if shard_summary["head_complete"]:
+            if self._carried_bytes:
+                merged_records.extend(self._scan_carried_bytes())
+            line_offset = self._lines_before_next_shard
+            merged_records.extend((line_offset + line_number, pattern_index, context)
+                                  for line_number, pattern_index, context in records)
+            self._lines_before_next_shard += shard_summary["line_breaks"]
+            self._carried_bytes += shard_summary["tail"]
+        if not failed and shard_index == self.shard_count - 1 and self.end_offset is not None:
+            # Whatever is still carried follows the file's last line break.
+            self.resume_offset = self.end_offset - len(self._carried_bytes)
+            self.resume_line_count = self._lines_before_next_shard
+        if (failed or shard_index == self.shard_count - 1) and self._carried_bytes:
+            merged_records.extend(self._scan_carried_bytes())
+        return merged_records
+
+
+# --- Decompression ---
+def _open_zstd_stream(raw_file):
+    if zstandard is None:
+        raise RuntimeError("zstd-compressed file; install the optional 'zstandard' package to search it")
+    return zstandard.ZstdDecompressor().stream_reader(raw_file, read_across_frames=True, closefd=False)
+
+
+def _looks_like_bz2(header):
+    # "BZh" + block size digit, followed by the magic of the first block (or of the end of an empty stream).
+    return (len(header) >= 10 and header[:3] == b"BZh" and header[3] in b"123456789"
+            and header[4:10] in (b"\x31\x41\x59\x26\x53\x59", b"\x17\x72\x45\x38\x50\x90"))
+
+
+def _looks_like_zstd(header):
+    # A zstd frame, or a skippable frame (magic 0x184D2A50-0x184D2A5F) in front of one.
+    return header.startswith(b"\x28\xb5\x2f\xfd") or (header[1:4] == b"\x2a\x4d\x18" and 0x50 <= header[0] <= 0x5F)
+
+
+# Supported compressed formats, checked in order: (name, magic-bytes test, opener).
+# The test gets the first 16 bytes of the file; opener(raw_binary_file) must return a
+# readable binary stream of the decompressed data. Add entries here to support more formats.
+DECOMPRESSION_FORMATS = [
+    ("gzip", lambda header: header.startswith(b"\x1f\x8b\x08"),
+     lambda raw_file: gzip.GzipFile(fileobj=raw_file, mode="rb")),
+    ("bz2", _looks_like_bz2, lambda raw_file: bz2.BZ2File(raw_file, mode="rb")),
+    ("xz", lambda header: header.startswith(b"\xfd7zXZ\x00"),
+     lambda raw_file: lzma.LZMAFile(raw_file, mode="rb")),
+    ("zstd", _looks_like_zstd, _open_zstd_stream),
+]
+# Extensions that promise a compressed format. Such a file without any known magic bytes is
+# reported as corrupted rather than searched as plain text.
+COMPRESSED_FILE_EXTENSIONS = {".gz": "gzip", ".tgz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+_DECOMPRESSION_ERRORS = (gzip.BadGzipFile, EOFError, zlib.error, lzma.LZMAError) + (
+    (zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def detect_compression(header_bytes):
+    """Returns the DECOMPRESSION_FORMATS name matching a file's leading bytes, or None for plain data."""
+    for format_name, matches_header, _opener in DECOMPRESSION_FORMATS:
+        if matches_header(header_bytes):
+            return format_name
+    return None
+
+
+def open_decompressed_stream(raw_file, compression):
+    """Wraps a raw binary file object in a reader that yields its decompressed bytes."""
+    if compression is None:
+        return raw_file
+    for format_name, _matches_header, opener in DECOMPRESSION_FORMATS:
+        if format_name == compression:
+            return opener(raw_file)
+    raise ValueError(f"Unknown compression format: {compression}")
+
+
+class _ByteRangeReader(io.RawIOBase):
+    """Read-only view of the next `length` bytes of an already positioned binary file."""
+
+    def __init__(self, raw_file, length):
+        self._raw_file = raw_file
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        with memoryview(buffer) as view:
+            bytes_read = self._raw_file.readinto(view[:self._remaining]) or 0
+        self._remaining -= bytes_read
+        return bytes_read
+
+
+def _iter_bgzf_member_offsets(raw_file):
+    """
+    Yields the start offset of each member of a BGZF-style gzip file (as written by bgzip and
+    many log shippers), whose headers record the compressed size of every member. Stops at
+    the first member without that information: ordinary gzip members can only be found by
+    decompressing everything in front of them.
+    """
+    offset = 0
+    while True:
+        raw_file.seek(offset)
+        header = raw_file.read(12)
+        if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+            return
+        extra_length = int.from_bytes(header[10:12], "little")
+        extra_field = raw_file.read(extra_length)
+        member_size = None
+        position = 0
+        while position + 4 <= len(extra_field):
+            subfield_length = int.from_bytes(extra_field[position + 2:position + 4], "little")
+            if extra_field[position:position + 2] == b"BC" and subfield_length == 2:
+                member_size = int.from_bytes(extra_field[position + 4:position + 6], "little") + 1
+                break
+            position += 4 + subfield_length
+        if member_size is None:
+            return
+        yield offset
+        offset += member_size
+
+
+def _iter_zstd_frame_offsets(raw_file):
+    """Yields the start offset of each zstd frame by walking the frame and block headers."""
+    offset = 0
+    while True:
+        raw_file.seek(offset)
+        magic = raw_file.read(4)
+        if len(magic) < 4:
+            return
+        magic_number = int.from_bytes(magic, "little")
+        if magic_number & 0xFFFFFFF0 == 0x184D2A50:  # Skippable frame.
+            frame_size = int.from_bytes(raw_file.read(4), "little")
+            offset += 8 + frame_size
+            continue
+        if magic_number != 0xFD2FB528:
+            return
+        yield offset
+        descriptor = raw_file.read(1)
+        if not descriptor:
+            return
+        descriptor = descriptor[0]
+        single_segment = (descriptor >> 5) & 1
+        header_size = (1 + (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 3]
+                       + ((1 if single_segment else 0), 2, 4, 8)[descriptor >> 6])
+        offset += 4 + header_size
+        while True:
+            raw_file.seek(offset)
+            block_header = raw_file.read(3)
+            if len(block_header) < 3:
+                return
+            block_header = int.from_bytes(block_header, "little")
+            block_type = (block_header >> 1) & 3
+            offset += 3 + (1 if block_type == 1 else block_header >> 3)
+            if block_header & 1:
+                break
+        if (descriptor >> 2) & 1:
+            offset += 4  # Content checksum.
+
+
+def _plan_plain_shard_ranges(raw_file, start_offset, end_offset, target_shard_bytes):
+    """
+    Cuts bytes start_offset to end_offset of an uncompressed file into byte ranges of about
+    target_shard_bytes, each moved forward to just after the next '\n' so that every shard
+    starts at a line start. If no '\n' turns up within one scan block, the cut is left
+    mid-line; the shard merger still joins such a split line back together.
+    """
+    shard_ranges = []
+    shard_start = start_offset
+    while shard_start + target_shard_bytes < end_offset:
+        cut = shard_start + target_shard_bytes
+        raw_file.seek(cut)
+        newline_at = raw_file.read(SCAN_BLOCK_SIZE_BYTES).find(b"\n")
+        if newline_at >= 0:
+            cut += newline_at + 1
+        if cut >= end_offset:
+            break
+        shard_ranges.append((shard_start, cut))
+        shard_start = cut
+    shard_ranges.append((shard_start, end_offset))
+    return shard_ranges
+
+
+def _plan_compressed_shard_ranges(raw_file, compression, file_size, target_shard_bytes):
+    if compression == "gzip":
+        member_offsets = _iter_bgzf_member_offsets(raw_file)
+    elif compression == "zstd" and zstandard is not None:
+        member_offsets = _iter_zstd_frame_offsets(raw_file)
+    else:
+        return [(0, file_size)]
+    shard_ranges = []
+    shard_start = 0
+    for member_offset in member_offsets:
+        if member_offset - shard_start >= target_shard_bytes:
+            shard_ranges.append((shard_start, member_offset))
+            shard_start = member_offset
+    shard_ranges.append((shard_start, file_size))
+    return shard_ranges
+
+
+def plan_file_shards(file_path, file_size):
+    """
+    Decides whether a file is big enough to be searched by several workers and, if so,
+    where to split it. Uncompressed files over MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES are cut
+    into line-aligned byte ranges; compressed files over COMPRESSED_SPLIT_THRESHOLD_BYTES
+    are cut at member/frame boundaries when their format allows it.
+    Returns (compression, [(start, end), ...]) with at least two ranges, or None.
+    """
+    if file_size < min(MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES, COMPRESSED_SPLIT_THRESHOLD_BYTES):
+        return None
+    with open(file_path, 'rb') as raw_file:
+        compression = detect_compression(raw_file.read(16))
+        if compression is None:
+            if file_size < MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES:
+                return None
+            shard_ranges = _plan_plain_shard_ranges(raw_file, 0, file_size, PLAIN_TEXT_SHARD_SIZE_BYTES)
+        else:
+            if file_size < COMPRESSED_SPLIT_THRESHOLD_BYTES:
+                return None
+            shard_ranges = _plan_compressed_shard_ranges(raw_file, compression, file_size, COMPRESSED_SPLIT_TARGET_BYTES)
+    if len(shard_ranges) < 2:
+        return None
+    return compression, shard_ranges
+
+
+def plan_incremental_shards(file_path, scan_plan):
+    """
+    Like plan_file_shards, for a file planned by IncrementalScanState.plan_file. Plain files
+    are always searched as shards then (a single one unless the part to search is huge),
+    starting at scan_plan['resume_offset'], because ShardResultMerger reports where the next
+    run can resume. Returns (compression, [(start, end), ...]), or None to search the file
+    with process_file_worker.
+    """
+    file_size = scan_plan['stat'].st_size
+    start_offset = scan_plan['resume_offset']
+    if scan_plan['compression'] is not None:
+        return plan_file_shards(file_path, file_size)
+    if os.path.splitext(file_path)[1].lower() in COMPRESSED_FILE_EXTENSIONS:
+        return None  # Not actually compressed; process_file_worker reports it as corrupted.
+    if file_size - start_offset < MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES:
+        return None, [(start_offset, file_size)]
+    with open(file_path, 'rb') as raw_file:
+        return None, _plan_plain_shard_ranges(raw_file, start_offset, file_size, PLAIN_TEXT_SHARD_SIZE_BYTES)
+
+
+# --- Binary Content Detection ---
+# Control characters that do not turn up in text files (everything below 0x20 except backspace, tab,
+# line feed, vertical tab, form feed, carriage return and escape, plus DEL).
+_NON_TEXT_CONTROL_BYTES = bytes(range(0x00, 0x08)) + bytes(range(0x0e, 0x1b)) + bytes(range(0x1c, 0x20)) + b"\x7f"
+_NON_PRINTABLE_RE = re.compile(r"[^\x20-\x7e]")
+
+
+def sniff_binary_content(sample):
+    """
+    Tells whether sample, the first bytes of a file's (decompressed) content, looks like binary
+    data. Returns a short reason if it does, else None. Only NUL and control bytes count as
+    non-text: bytes of 0x80 and above are left alone, as legacy 8-bit and multi-byte encodings
+    use them for ordinary text.
+    """
+    if not sample:
+        return None
+    if b"\0" in sample:
+        return "contains NUL bytes"
+    non_text_bytes = len(sample) - len(sample.translate(None, _NON_TEXT_CONTROL_BYTES))
+    if non_text_bytes > len(sample) * BINARY_NON_TEXT_RATIO:
+        return f"{non_text_bytes / len(sample):.0%} of its first {len(sample)} bytes are not text"
+    return None
+
+
+def read_content_sample(file_path, compression):
+    """Reads the first BINARY_SNIFF_BYTES of a file's content, decompressed if compression is set."""
+    with open(file_path, 'rb') as raw_file:
+        if compression is None:
+            return raw_file.read(BINARY_SNIFF_BYTES)
+        with open_decompressed_stream(raw_file, compression) as opened_file_stream:
+            return opened_file_stream.read(BINARY_SNIFF_BYTES)
+
+
+def binary_hit_context(line_text, pattern_matcher, pattern_index):
+    """
+    Cuts the "line" of a binary file that contains a hit down to BINARY_CONTEXT_CHARS on each
+    side of the hit, with everything but printable ASCII shown as '.'.
+    """
+    hit = pattern_matcher.patterns[pattern_index][1].search(line_text)
+    hit_start, hit_end = (hit.start(), hit.end()) if hit else (0, 0)
+    excerpt = line_text[max(0, hit_start - BINARY_CONTEXT_CHARS):hit_end + BINARY_CONTEXT_CHARS]
+    return _NON_PRINTABLE_RE.sub(".", excerpt).strip(".").strip()
+
+
+class _SampledStream(io.RawIOBase):
+    """Read-only stream that returns the bytes already read off a stream for sniffing, then the rest of it."""
+
+    def __init__(self, sample, binary_stream):
+        self._sample = memoryview(sample)
+        # Like iter_stream_blocks, prefer readinto1 so data before a corrupt part of the stream still arrives.
+        self._read_some_into = getattr(binary_stream, "readinto1", None) or binary_stream.readinto
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        with memoryview(buffer) as view:
+            if self._sample:
+                bytes_read = min(len(view), len(self._sample))
+                view[:bytes_read] = self._sample[:bytes_read]
+                self._sample = self._sample[bytes_read:]
+                return bytes_read
+            return self._read_some_into(view) or 0
+
+
+# --- Worker Function for Parallel Processing ---
+def _count_hits(hit_counts, pattern_indices):
+    for pattern_index in pattern_indices:
+        hit_counts[pattern_index] = hit_counts.get(pattern_index, 0) + 1
+
+
+def _collect_stream_records(blocks, pattern_matcher, found_results, first_line_number=1, binary_content=False,
+                            file_metrics=None, hit_counts=None, first_hit_only=False):
+    for line_number, line_content, pattern_indices, _line_offset in iter_stream_hits(blocks, pattern_matcher, first_line_number,
+                                                                                     file_metrics):
+        if hit_counts is not None:
+            _count_hits(hit_counts, pattern_indices)
+            if first_hit_only:
+                return
+            continue
+        if binary_content:
+            for pattern_index in pattern_indices:
+                found_results.append((line_number, pattern_index, binary_hit_context(line_content, pattern_matcher, pattern_index)))
+            continue
+        context = line_content.strip()
+        for pattern_index in pattern_indices:
+            found_results.append((line_number, pattern_index, context))
+
+
+def _binary_skip_reason(binary_reason):
+    return f"Binary content ({binary_reason}); not searched because BINARY_FILE_HANDLING is \"skip\""
+
+
+def _describe_read_error(file_path, compression, error):
+    if compression is not None and isinstance(error, _DECOMPRESSION_ERRORS):
+        return f"Corrupted/Invalid {compression} file: {error}"
+    return f"Error reading stream for {file_path}: {error}"
+
+
+def iter_file_hits(file_path, pattern_matcher, file_outcome, file_metrics=None):
+    """
+    Lazily searches a whole file and yields (line_number, line_text, pattern_indices, line_offset)
+    for every line with a hit, like iter_stream_hits. The file is opened (and decompressed) on the
+    first request and read block by block as hits are asked for, so a caller that stops early
+    leaves the rest of the file unread. Compression is detected from the file's magic bytes, and
+    the first BINARY_SNIFF_BYTES of content are checked for binary data (see BINARY_FILE_HANDLING).
+
+    Problems are reported in the file_outcome dict rather than raised: 'skip_reason' is set if
+    the file could not be searched (completely), and 'binary_reason' if it is binary content
+    searched in "raw" mode. Both are set before the hits they concern are yielded. If
+    file_metrics is a dict (see new_file_metrics), the reading is measured into it.
+    """
+    try:
+        raw_file = open(file_path, 'rb')
+    except Exception as e_open:
+        file_outcome['skip_reason'] = f"Error opening file for reading: {e_open}"
+        return
+
+    with raw_file:
+        header_bytes = raw_file.read(max(16, BINARY_SNIFF_BYTES))
+        if not header_bytes:
+            return  # Empty file: nothing to search.
+        raw_file.seek(0)
+        compression = detect_compression(header_bytes[:16])
+        if file_metrics is not None:
+            file_metrics['compression'] = compression
+        file_ext = os.path.splitext(file_path)[1].lower()
+        if compression is None and file_ext in COMPRESSED_FILE_EXTENSIONS:
+            file_outcome['skip_reason'] = f"Corrupted/Invalid {file_ext} file: not {COMPRESSED_FILE_EXTENSIONS[file_ext]} data"
+            return
+
+        try:
+            opened_file_stream = open_decompressed_stream(raw_file, compression)
+        except Exception as e_decompressor:
+            file_outcome['skip_reason'] = f"Error reading {compression} file: {e_decompressor}"
+            return
+
+        try:
+            with opened_file_stream:
+                content_stream = opened_file_stream
+                if BINARY_FILE_HANDLING != "text":
+                    if compression is None:
+                        content_sample = header_bytes[:BINARY_SNIFF_BYTES]
+                    else:
+                        content_sample = opened_file_stream.read(BINARY_SNIFF_BYTES)
+                        content_stream = _SampledStream(content_sample, opened_file_stream)
+                    binary_reason = sniff_binary_content(content_sample)
+                    if binary_reason is not None:
+                        if BINARY_FILE_HANDLING == "skip":
+                            file_outcome['skip_reason'] = _binary_skip_reason(binary_reason)
+                            return
+                        file_outcome['binary_reason'] = binary_reason
+                if compression is None and USE_MMAP_FOR_PLAIN_FILES:
+                    with mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                        yield from iter_stream_hits(iter_mmap_blocks(mapped_file), pattern_matcher, 1, file_metrics)
+                else:
+                    # Compressed data expands, so its buffer is sized for a few times the file size.
+                    expected_bytes = os.fstat(raw_file.fileno()).st_size * (1 if compression is None else 8)
+                    yield from iter_stream_hits(iter_stream_blocks(content_stream, read_block_size_for(expected_bytes)),
+                                                pattern_matcher, 1, file_metrics)
+        except Exception as e_stream_read:
+            file_outcome['skip_reason'] = _describe_read_error(file_path, compression, e_stream_read)
+
+
+def process_file_worker(file_path, pattern_matcher, file_metrics=None, hit_counts=None, first_hit_only=False):
+    """
+    Processes a single file: opens/decompresses it and searches it for the specified strings.
+    Files are read as raw bytes in SCAN_BLOCK_SIZE_BYTES blocks whatever their size; only
+    lines containing a hit are decoded. Each line is checked once by pattern_matcher
+    (a MultiPatternMatcher) for all strings. See iter_file_hits, which does the reading.
+
+    Returns (file_path, records, skip_reason). Each record is a compact
+    (line_number, pattern_index, context) tuple; the parent formats and writes them.
+    file_metrics, if given, is filled in as described in new_file_metrics.
+
+    If hit_counts is a dict, hits are only counted into it, as {pattern_index: hits}, and no
+    records are built; with first_hit_only the file is read no further than its first hit.
+    """
+    # This print indicates which file a worker is starting on.
+    # In parallel execution, output from different workers might interleave with tqdm.
+    # tqdm typically prints to stderr, print() to stdout.
+    # print(f"Worker starting on: {file_path}") # Keep this if you want per-worker start, or remove for cleaner tqdm output
+
+    found_results_for_this_file = []
+    file_outcome = {}
+
+    try:
+        for line_number, line_content, pattern_indices, _line_offset in iter_file_hits(file_path, pattern_matcher, file_outcome,
+                                                                                       file_metrics):
+            if hit_counts is not None:
+                _count_hits(hit_counts, pattern_indices)
+                if first_hit_only:
+                    break
+                continue
+            if 'binary_reason' in file_outcome:
+                for pattern_index in pattern_indices:
+                    found_results_for_this_file.append(
+                        (line_number, pattern_index, binary_hit_context(line_content, pattern_matcher, pattern_index)))
+                continue
+            context = line_content.strip()
+            for pattern_index in pattern_indices:
+                found_results_for_this_file.append((line_number, pattern_index, context))
+        return file_path, found_results_for_this_file, file_outcome.get('skip_reason')
+
+    except Exception as e_outer_worker: 
+        return file_path, [], f"Unexpected error in worker for file '{file_path}': {e_outer_worker} \n{traceback.format_exc()}"
+
+
+def process_shard_worker(file_path, pattern_matcher, shard, file_metrics=None, hit_counts=None):
+    """
+    Searches one shard of a file that was split across workers. shard is
+    (shard_index, shard_count, start_offset, end_offset, compression), where the offsets
+    are byte offsets in the file on disk and compression is a DECOMPRESSION_FORMATS name
+    or None. Line numbers in the returned records count from the shard's first whole
+    line; ShardResultMerger turns them into file line numbers. Every shard, the last one
+    included, sets aside the bytes after its last line break, so the merger also learns where the
+    file's last complete line ends. A file split into several shards is checked for binary
+    content once by SearchTaskPlanner; a single shard (a plain file searched from where an
+    earlier run stopped) is checked here, from the start of the file: with BINARY_FILE_HANDLING
+    "raw" the reason is returned as shard_summary['binary_reason'] and the parent cuts the contexts.
+
+    Returns (file_path, records, skip_reason, shard_summary). If the shard could not be
+    searched completely, skip_reason is set and shard_summary describes the part that was.
+    hit_counts works as in process_file_worker; a shard is always read to its end, as the
+    merger needs its line count and edges.
+    """
+    shard_index, shard_count, start_offset, end_offset, compression = shard
+    found_results_for_this_shard = []
+    shard_summary = {}
+    if file_metrics is not None:
+        file_metrics['compression'] = compression
+    try:
+        with open(file_path, 'rb') as raw_file:
+            if shard_count == 1 and BINARY_FILE_HANDLING != "text":
+                binary_reason = sniff_binary_content(raw_file.read(BINARY_SNIFF_BYTES))
+                if binary_reason is not None:
+                    if BINARY_FILE_HANDLING == "skip":
+                        return file_path, [], _binary_skip_reason(binary_reason), shard_summary
+                    shard_summary['binary_reason'] = binary_reason
+            starts_mid_line = shard_index > 0
+            if compression is None and starts_mid_line:
+                # Plain shards are normally cut right after a '\n', so no partial first line needs setting aside.
+                raw_file.seek(start_offset - 1)
+                starts_mid_line = raw_file.read(1) != b"\n"
+            raw_file.seek(start_offset)
+            if compression is None and USE_MMAP_FOR_PLAIN_FILES:
+                with mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    blocks = _iter_shard_body_blocks(iter_mmap_blocks(mapped_file, None, start_offset, end_offset),
+                                                     shard_summary, keep_head=starts_mid_line, keep_tail=True)
+                    _collect_stream_records(blocks, pattern_matcher, found_results_for_this_shard, file_metrics=file_metrics,
+                                            hit_counts=hit_counts)
+            else:
+                shard_bytes = _ByteRangeReader(raw_file, end_offset - start_offset)
+                read_block_size = read_block_size_for((end_offset - start_offset) * (1 if compression is None else 8))
+                with open_decompressed_stream(shard_bytes, compression) as opened_shard_stream:
+                    blocks = _iter_shard_body_blocks(iter_stream_blocks(opened_shard_stream, read_block_size), shard_summary,
+                                                     keep_head=starts_mid_line, keep_tail=True)
+                    _collect_stream_records(blocks, pattern_matcher, found_results_for_this_shard, file_metrics=file_metrics,
+                                            hit_counts=hit_counts)
+        return file_path, found_results_for_this_shard, None, shard_summary
+    except Exception as e_shard:
+        reason = _describe_read_error(file_path, compression, e_shard)
+        return (file_path, found_results_for_this_shard,
+                f"{reason} (in part {shard_index + 1} of {shard_count}, bytes {start_offset}-{end_offset})", shard_summary)
+
+
+# Content index connections opened by this worker process, by index path.
+_worker_content_index_connections = {}
+
+
+def _close_worker_content_index_connections():
+    """Closes the content index connections of this process, so the index files can be deleted or rebuilt."""
+    while _worker_content_index_connections:
+        _index_path, connection = _worker_content_index_connections.popitem()
+        connection.close()
+
+
+def process_indexed_file_worker(file_path, pattern_matcher, query_trigram_sets, index_lookup, file_metrics=None,
+                                hit_counts=None, first_hit_only=False):
+    """
+    Searches only the parts of an indexed file that may contain a search string, going by
+    query_trigram_sets (see query_trigram_sets_for). index_lookup is (index_path, window_start,
+    window_end, unindexed_start, unindexed_first_line_number): the file's indexed blocks starting
+    in window_start:window_end are checked against the query, and data from unindexed_start on (added since the index was
+    built) is searched in any case if it starts in the window. unindexed_start is None for
+    compressed files, which are searched whole if their filter matches. A file searched in a
+    single window is checked for binary content like process_file_worker does.
+
+    Returns (file_path, records, skip_reason) like process_file_worker, and takes hit_counts
+    and first_hit_only like it.
+    """
+    index_path, window_start, window_end, unindexed_start, unindexed_first_line_number = index_lookup
+    try:
+        connection = _worker_content_index_connections.get(index_path)
+        if connection is None:
+            connection = _worker_content_index_connections[index_path] = sqlite3.connect(index_path)
+        block_rows = connection.execute(
+            "SELECT start_offset, end_offset, first_line_number, trigram_filter FROM index_blocks "
+            "WHERE path = ? AND start_offset >= ? AND start_offset < ? ORDER BY start_offset",
+            (file_path, window_start, window_end)).fetchall()
+    except sqlite3.Error as e_index:
+        return file_path, [], f"Error reading content index '{index_path}': {e_index}"
+    candidate_ranges = []
+    for start_offset, end_offset, first_line_number, trigram_filter in block_rows:
+        if trigram_filter_may_contain(trigram_filter, query_trigram_sets):
+            if candidate_ranges and candidate_ranges[-1][1] == start_offset:
+                candidate_ranges[-1][1] = end_offset  # Adjacent blocks are read in one go.
+            else:
+                candidate_ranges.append([start_offset, end_offset, first_line_number])
+    if unindexed_start is None:
+        if not candidate_ranges:
+            return file_path, [], None
+        return process_file_worker(file_path, pattern_matcher, file_metrics, hit_counts, first_hit_only)
+    if window_start <= unindexed_start < window_end:
+        candidate_ranges.append([unindexed_start, None, unindexed_first_line_number])
+
+    if not candidate_ranges:
+        return file_path, [], None
+
+    found_results_for_this_file = []
+    try:
+        with open(file_path, 'rb') as raw_file:
+            binary_reason = None
+            # Files searched in several windows were checked for binary content when they were planned.
+            if (BINARY_FILE_HANDLING != "text" and window_start == 0
+                    and window_end > os.fstat(raw_file.fileno()).st_size):
+                binary_reason = sniff_binary_content(raw_file.read(BINARY_SNIFF_BYTES))
+                if binary_reason is not None and BINARY_FILE_HANDLING == "skip":
+                    return file_path, [], _binary_skip_reason(binary_reason)
+            for start_offset, end_offset, first_line_number in candidate_ranges:
+                raw_file.seek(start_offset)
+                if end_offset is None:
+                    range_stream, range_block_size = raw_file, None
+                else:
+                    range_stream = _ByteRangeReader(raw_file, end_offset - start_offset)
+                    range_block_size = read_block_size_for(end_offset - start_offset)
+                _collect_stream_records(iter_stream_blocks(range_stream, range_block_size), pattern_matcher,
+                                        found_results_for_this_file, first_line_number,
+                                        binary_content=binary_reason is not None, file_metrics=file_metrics,
+                                        hit_counts=hit_counts, first_hit_only=first_hit_only)
+                if first_hit_only and hit_counts:
+                    break
+    except Exception as e_stream_read:
+        return file_path, found_results_for_this_file, _describe_read_error(file_path, None, e_stream_read)
+    return file_path, found_results_for_this_file, None
+
+
+# --- Scheduling ---
+def search_worker_count():
+    """Number of worker processes: WORKER_PROCESS_COUNT, or all but two of the CPU cores."""
+    if WORKER_PROCESS_COUNT:
+        return max(1, WORKER_PROCESS_COUNT)
+    return max(1, os.cpu_count() - 2 if os.cpu_count() and os.cpu_count() > 2 else 1)
+
+
+# The pattern matcher, content index query, output mode and measurement settings of this worker process,
+# installed once by the pool initializer.
+_worker_pattern_matcher = None
+_worker_query_trigram_sets = None
+_worker_output_mode = "lines"
+_worker_collect_metrics = False
+_worker_profile_path = None
+_worker_profiler = None
+
+
+def _init_search_worker(pattern_matcher, collect_metrics=False, profile_path=None, output_mode="lines",
+                        query_trigram_sets=None):
+    global _worker_pattern_matcher, _worker_query_trigram_sets, _worker_output_mode
+    global _worker_collect_metrics, _worker_profile_path, _worker_profiler
+    _worker_pattern_matcher = pattern_matcher
+    _worker_query_trigram_sets = query_trigram_sets
+    _worker_output_mode = output_mode
+    _worker_collect_metrics = collect_metrics
+    _worker_profile_path = profile_path
+    _worker_profiler = cProfile.Profile() if profile_path else None
+    # Pool workers end through multiprocessing, which runs its finalizers but not atexit handlers.
+    if query_trigram_sets is not None:
+        multiprocessing.util.Finalize(None, _close_worker_content_index_connections, exitpriority=10)
+    if _worker_profiler is not None:
+        multiprocessing.util.Finalize(None, _save_worker_profile, exitpriority=10)
+
+
+def _save_worker_profile():
+    """Writes this worker's profile next to _worker_profile_path once, when the worker process exits."""
+    _worker_profiler.dump_stats(f"{_worker_profile_path}.worker-{os.getpid()}")
+
+
+def new_file_metrics():
+    """
+    The dict a worker fills in while searching a file (or part) when metrics are collected:
+    read_seconds (waiting for data: reading and decompressing), content_bytes (after
+    decompression), lines, decode_fallbacks (hit lines that were not valid UTF-8) and
+    compression. process_task_batch adds seconds, bytes_read, matches and skip_reason.
+    """
+    return {'read_seconds': 0.0, 'content_bytes': 0, 'lines': 0, 'decode_fallbacks': 0, 'compression': None}
+
+
+def process_task_batch(task_batch):
+    """
+    Runs a batch of search tasks, each (sequence_number, file_path, shard, index_lookup),
+    with the pattern matcher installed by _init_search_worker.
+
+    Returns (results, batch_hit_counts, batch_stats): the result of each task in batch order, as
+    returned by process_file_worker, process_shard_worker or process_indexed_file_worker; the
+    {pattern_index: hits} counts of each task; and (worker_pid, busy_seconds, bytes_searched,
+    batch_metrics) for the utilisation report. batch_metrics is None unless metrics are
+    collected; then it is (file_metrics of each task, time.time() when the batch finished).
+
+    In the "count" and "files" output modes (see OUTPUT_MODE) hits are only counted, so the
+    results hold no records; in "files" mode whole files are only read up to their first hit.
+    """
+    busy_started_at = time.perf_counter()
+    if _worker_profiler is not None:
+        _worker_profiler.enable()
+    results = []
+    batch_hit_counts = []
+    bytes_searched = 0
+    batch_file_metrics = [] if _worker_collect_metrics else None
+    counting_only = _worker_output_mode != "lines"
+    first_hit_only = _worker_output_mode == "files"
+    for _sequence_number, file_path, shard, index_lookup in task_batch:
+        file_metrics = new_file_metrics() if batch_file_metrics is not None else None
+        task_hit_counts = {}
+        worker_hit_counts = task_hit_counts if counting_only else None
+        task_started_at = time.perf_counter()
+        if index_lookup is not None:
+            results.append(process_indexed_file_worker(file_path, _worker_pattern_matcher, _worker_query_trigram_sets,
+                                                       index_lookup, file_metrics, worker_hit_counts, first_hit_only))
+        elif shard is None:
+            results.append(process_file_worker(file_path, _worker_pattern_matcher, file_metrics,
+                                               worker_hit_counts, first_hit_only))
+        else:
+            results.append(process_shard_worker(file_path, _worker_pattern_matcher, shard, file_metrics, worker_hit_counts))
+        if not counting_only:
+            for _line_number, pattern_index, _context in results[-1][1]:
+                task_hit_counts[pattern_index] = task_hit_counts.get(pattern_index, 0) + 1
+        batch_hit_counts.append(task_hit_counts)
+        task_bytes = 0
+        if shard is not None:
+            task_bytes = shard[3] - shard[2]
+        elif index_lookup is None:
+            try:
+                task_bytes = os.path.getsize(file_path)
+            except OSError:
+                pass
+        bytes_searched += task_bytes
+        if file_metrics is not None:
+            file_metrics.update(seconds=time.perf_counter() - task_started_at, matches=sum(task_hit_counts.values()),
+                                bytes_read=task_bytes if index_lookup is None else file_metrics['content_bytes'],
+                                skip_reason=results[-1][2])
+            batch_file_metrics.append(file_metrics)
+    if _worker_profiler is not None:
+        _worker_profiler.disable()
+    batch_metrics = None if batch_file_metrics is None else (batch_file_metrics, time.time())
+    return results, batch_hit_counts, (os.getpid(), time.perf_counter() - busy_started_at, bytes_searched, batch_metrics)
+
+
+def estimate_task_cost(file_path, file_size, shard, index_lookup):
+    """Estimates the work of a search task, in bytes to scan, for ordering and batching tasks."""
+    if shard is not None:
+        _shard_index, _shard_count, start_offset, end_offset, compression = shard
+        shard_size = end_offset - start_offset
+        return shard_size * SCHEDULER_COMPRESSED_SIZE_FACTOR if compression else shard_size
+    if index_lookup is not None and index_lookup[3] is not None:
+        # An upper bound: blocks the index rules out are not read.
+        return max(0, min(index_lookup[2], file_size) - index_lookup[1])
+    if os.path.splitext(file_path)[1].lower() in COMPRESSED_FILE_EXTENSIONS:
+        return file_size * SCHEDULER_COMPRESSED_SIZE_FACTOR
+    return file_size
+
+
+def schedule_task_batches(tasks, task_costs, worker_count, shrink_small_searches=True):
+    """
+    Groups search tasks into the batches handed to the worker processes.
+
+    With SCHEDULER_LARGEST_FIRST tasks are taken largest first (longest-processing-time-first),
+    so a big file never starts last and leaves the other workers idle at the end. Tasks of at
+    least the batch size get a batch of their own; smaller ones are packed together up to
+    SCHEDULER_BATCH_TARGET_BYTES or SCHEDULER_BATCH_MAX_FILES tasks per batch, so millions of
+    small files do not each cost a round trip to a worker. For small searches the batch size
+    shrinks so that every worker still gets several batches, unless shrink_small_searches is
+    False (the tasks are only part of the search).
+    """
+    batch_target = SCHEDULER_BATCH_TARGET_BYTES
+    if shrink_small_searches:
+        batch_target = max(1, min(batch_target, sum(task_costs) // (worker_count * 4)))
+    task_order = range(len(tasks))
+    if SCHEDULER_LARGEST_FIRST:
+        task_order = sorted(task_order, key=task_costs.__getitem__, reverse=True)
+    batches = []
+    open_batch = []
+    open_batch_cost = 0
+    for task_index in task_order:
+        task_cost = task_costs[task_index]
+        if task_cost >= batch_target:
+            batches.append([tasks[task_index]])
+            continue
+        open_batch.append(tasks[task_index])
+        open_batch_cost += task_cost
+        if open_batch_cost >= batch_target or len(open_batch) >= SCHEDULER_BATCH_MAX_FILES:
+            batches.append(open_batch)
+            open_batch = []
+            open_batch_cost = 0
+    if open_batch:
+        batches.append(open_batch)
+    return batches
+
+
+class TaskBatchScheduler:
+    """
+    Hands search tasks to a process pool in batches, keeping at most
+    SCHEDULER_BATCHES_IN_FLIGHT_PER_WORKER batches per worker submitted at a time so that memory
+    use does not grow with the number of files, and keeps track of how busy the workers were.
+
+    Tasks come from task_source(wait_seconds) while the search runs: it returns a list of
+    (task, task_cost) pairs planned since the last call ([] if none within wait_seconds), or
+    None once there will be no more. While tasks keep coming, small ones wait until they fill
+    a batch unless the workers are about to run out of work; once the source is done, whatever
+    is left is batched largest first in one go. The per-file metrics of finished batches (if the
+    workers collect them) are handed to search_metrics, a SearchMetrics.
+    """
+
+    def __init__(self, executor, worker_count, task_source, search_metrics=None):
+        self.executor = executor
+        self.search_metrics = search_metrics
+        self.worker_count = worker_count
+        self.max_batches_in_flight = max(1, worker_count * SCHEDULER_BATCHES_IN_FLIGHT_PER_WORKER)
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.worker_busy_seconds = {}
+        self.worker_task_counts = {}
+        self.bytes_searched = 0
+        self._task_source = task_source
+        self._task_source_finished = False
+        self._pending_tasks = []
+        self._pending_task_costs = []
+        self._pending_cost_total = 0
+        self._ready_batches = deque()
+        self._future_to_batch = {}
+
+    def _take_new_tasks(self, wait_seconds):
+        planned_tasks = self._task_source(wait_seconds)
+        if planned_tasks is None:
+            self._task_source_finished = True
+            return
+        for task, task_cost in planned_tasks:
+            self._pending_tasks.append(task)
+            self._pending_task_costs.append(task_cost)
+            self._pending_cost_total += task_cost
+
+    def submit_more(self):
+        while len(self._future_to_batch) < self.max_batches_in_flight:
+            if not self._ready_batches:
+                if not self._pending_tasks:
+                    break
+                if (not self._task_source_finished and len(self._future_to_batch) >= self.worker_count
+                        and self._pending_cost_total < SCHEDULER_BATCH_TARGET_BYTES
+                        and len(self._pending_tasks) < SCHEDULER_BATCH_MAX_FILES):
+                    break
+                self._ready_batches.extend(schedule_task_batches(
+                    self._pending_tasks, self._pending_task_costs, self.worker_count,
+                    shrink_small_searches=self._task_source_finished))
+                self._pending_tasks = []
+                self._pending_task_costs = []
+                self._pending_cost_total = 0
+            task_batch = self._ready_batches.popleft()
+            self._future_to_batch[self.executor.submit(process_task_batch, task_batch)] = task_batch
+
+    def iter_finished_tasks(self):
+        """
+        Yields (task, worker_result, hit_counts, batch_error) for every task as its batch
+        finishes, hit_counts being the task's {pattern_index: hits} counts. If a batch failed as a
+        whole (e.g. its worker process died), worker_result and hit_counts are None and
+        batch_error describes what happened.
+        """
+        while True:
+            if not self._task_source_finished:
+                self._take_new_tasks(0 if self._future_to_batch else None)
+            self.submit_more()
+            if not self._future_to_batch:
+                if self._task_source_finished and not self._pending_tasks and not self._ready_batches:
+                    break
+                continue
+            done_futures, _ = concurrent.futures.wait(
+                self._future_to_batch, timeout=None if self._task_source_finished else _FILE_WALKER_POLL_SECONDS,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done_futures:
+                task_batch = self._future_to_batch.pop(future)
+                try:
+                    batch_results, batch_hit_counts, (worker_pid, busy_seconds, bytes_searched, batch_metrics) = future.result()
+                    batch_error = None
+                    if batch_metrics is not None and self.search_metrics is not None:
+                        self.search_metrics.add_batch(task_batch, batch_metrics, time.time())
+                    self.worker_busy_seconds[worker_pid] = self.worker_busy_seconds.get(worker_pid, 0.0) + busy_seconds
+                    self.worker_task_counts[worker_pid] = self.worker_task_counts.get(worker_pid, 0) + len(task_batch)
+                    self.bytes_searched += bytes_searched
+                except Exception as exc:
+                    batch_results = batch_hit_counts = [None] * len(task_batch)
+                    batch_error = f"{exc} \n{traceback.format_exc()}"
+                self.submit_more()
+                for task, worker_result, hit_counts in zip(task_batch, batch_results, batch_hit_counts):
+                    yield task, worker_result, hit_counts, batch_error
+        self.finished_at = time.perf_counter()
+
+    def utilisation_report(self):
+        """Returns a few lines describing how busy each worker process was."""
+        elapsed_seconds = (self.finished_at or time.perf_counter()) - self.started_at
+        total_busy_seconds = sum(self.worker_busy_seconds.values())
+        utilisation = total_busy_seconds / (elapsed_seconds * self.worker_count) if elapsed_seconds > 0 else 0.0
+        report_lines = [
+            f"Worker utilisation: {utilisation:.0%} ({total_busy_seconds:.1f} s busy out of "
+            f"{elapsed_seconds:.1f} s x {self.worker_count} worker(s)), "
+            f"{self.bytes_searched / (1024 * 1024) / elapsed_seconds if elapsed_seconds > 0 else 0.0:.1f} MB/s of files read."]
+        for worker_pid, busy_seconds in sorted(self.worker_busy_seconds.items(), key=lambda item: -item[1]):
+            report_lines.append(f"  Worker {worker_pid}: busy {busy_seconds:.1f} s "
+                                f"({busy_seconds / elapsed_seconds if elapsed_seconds > 0 else 0.0:.0%}), "
+                                f"{self.worker_task_counts[worker_pid]} task(s)")
+        return report_lines
+
+
+# --- Search Metrics ---
+def _format_megabytes(byte_count):
+    return f"{byte_count / (1024 * 1024):.1f} MB"
+
+
+class SearchMetrics:
+    """
+    Adds up the per-file metrics the workers measure when COLLECT_FILE_METRICS is on: where the
+    time went (reading plain files, reading and decompressing compressed ones, scanning and
+    matching, handing results back), the slowest_count slowest files (or parts of split files)
+    and per-folder totals, from which the slowest folders are picked. Only the slowest files are
+    kept, so memory use does not grow with the number of files.
+    """
+
+    def __init__(self, slowest_count):
+        self.slowest_count = slowest_count
+        self.tasks = 0
+        self.skipped_tasks = 0
+        self.bytes_read = 0
+        self.content_bytes = 0
+        self.lines = 0
+        self.matches = 0
+        self.decode_fallbacks = 0
+        self.plain_read_seconds = 0.0
+        self.plain_read_bytes = 0
+        self.compressed_read_seconds = 0.0
+        self.compressed_read_bytes = 0
+        self.search_seconds = 0.0
+        self.handover_seconds = 0.0
+        self.longest_handover_seconds = 0.0
+        self.directory_totals = {}  # Folder -> [seconds, files, bytes_read].
+        self._slowest_tasks = []  # Min-heap of (seconds, tie_breaker, entry).
+
+    def add_batch(self, task_batch, batch_metrics, received_at):
+        """Adds the metrics of a finished batch; received_at is time.time() when the parent got it."""
+        batch_file_metrics, finished_at = batch_metrics
+        handover_seconds = max(0.0, received_at - finished_at)
+        self.handover_seconds += handover_seconds
+        self.longest_handover_seconds = max(self.longest_handover_seconds, handover_seconds)
+        for task, file_metrics in zip(task_batch, batch_file_metrics):
+            self.add_task(task, file_metrics)
+
+    def add_task(self, task, file_metrics):
+        _sequence_number, file_path, shard, _index_lookup = task
+        self.tasks += 1
+        self.skipped_tasks += 1 if file_metrics['skip_reason'] else 0
+        self.bytes_read += file_metrics['bytes_read']
+        self.content_bytes += file_metrics['content_bytes']
+        self.lines += file_metrics['lines']
+        self.matches += file_metrics['matches']
+        self.decode_fallbacks += file_metrics['decode_fallbacks']
+        if file_metrics['compression'] is None:
+            self.plain_read_seconds += file_metrics['read_seconds']
+            self.plain_read_bytes += file_metrics['bytes_read']
+        else:
+            self.compressed_read_seconds += file_metrics['read_seconds']
+            self.compressed_read_bytes += file_metrics['bytes_read']
+        self.search_seconds += max(0.0, file_metrics['seconds'] - file_metrics['read_seconds'])
+
+        directory_totals = self.directory_totals.setdefault(os.path.dirname(file_path), [0.0, 0, 0])
+        directory_totals[0] += file_metrics['seconds']
+        directory_totals[1] += 1 if shard is None or shard[0] == 0 else 0
+        directory_totals[2] += file_metrics['bytes_read']
+
+        if self.slowest_count <= 0:
+            return
+        heap_item = (file_metrics['seconds'], self.tasks,
+                     dict(file_metrics, path=file_path, part=None if shard is None else f"{shard[0] + 1} of {shard[1]}"))
+        if len(self._slowest_tasks) < self.slowest_count:
+            heapq.heappush(self._slowest_tasks, heap_item)
+        elif heap_item[0] > self._slowest_tasks[0][0]:
+            heapq.heapreplace(self._slowest_tasks, heap_item)
+
+    def slowest_tasks(self):
+        return [entry for _seconds, _tie_breaker, entry in sorted(self._slowest_tasks, key=lambda item: -item[0])]
+
+    def slowest_directories(self):
+        slowest = heapq.nlargest(self.slowest_count, self.directory_totals.items(), key=lambda item: item[1][0])
+        return [{'path': directory, 'seconds': seconds, 'files': files, 'bytes_read': bytes_read}
+                for directory, (seconds, files, bytes_read) in slowest]
+
+    def report_lines(self):
+        """Returns the lines of the report printed after the search."""
+        def rate(byte_count, seconds):
+            return f"{byte_count / (1024 * 1024) / seconds:.1f} MB/s" if seconds > 0 else "-"
+
+        report_lines = [
+            f"Searched {self.tasks} file(s) or part(s): {_format_megabytes(self.bytes_read)} read, "
+            f"{_format_megabytes(self.content_bytes)} of content, {self.lines:,} lines, {self.matches} hit(s).",
+            f"Time in the workers: {self.plain_read_seconds:.2f} s reading plain files "
+            f"({rate(self.plain_read_bytes, self.plain_read_seconds)}), "
+            f"{self.compressed_read_seconds:.2f} s reading and decompressing compressed files "
+            f"({rate(self.compressed_read_bytes, self.compressed_read_seconds)} of files), "
+            f"{self.search_seconds:.2f} s scanning and matching ({rate(self.content_bytes, self.search_seconds)}).",
+            f"Handing results back to the main process took {self.handover_seconds:.2f} s in total "
+            f"(longest {self.longest_handover_seconds:.3f} s).",
+        ]
+        if self.decode_fallbacks:
+            report_lines.append(f"{self.decode_fallbacks} hit line(s) were not valid UTF-8; "
+                                f"their undecodable bytes were left out of the context.")
+        if self.skipped_tasks:
+            report_lines.append(f"{self.skipped_tasks} file(s) or part(s) could not be searched (completely); see the skipped files log.")
+        slowest_tasks = self.slowest_tasks()
+        if slowest_tasks:
+            report_lines.append(f"Slowest {len(slowest_tasks)} file(s):")
+            for entry in slowest_tasks:
+                part_note = f" (part {entry['part']})" if entry['part'] else ""
+                compression_note = f" [{entry['compression']}]" if entry['compression'] else ""
+                report_lines.append(f"  {entry['seconds']:7.2f} s ({entry['read_seconds']:.2f} s reading)  "
+                                    f"{_format_megabytes(entry['bytes_read']):>10}  {entry['path']}{part_note}{compression_note}")
+        slowest_directories = self.slowest_directories()
+        if slowest_directories:
+            report_lines.append(f"Slowest {len(slowest_directories)} folder(s) (time summed over their files):")
+            for entry in slowest_directories:
+                report_lines.append(f"  {entry['seconds']:7.2f} s  {entry['files']:>6} file(s)  "
+                                    f"{_format_megabytes(entry['bytes_read']):>10}  {entry['path']}")
+        return report_lines
+
+    def write_json(self, json_path, elapsed_seconds):
+        report = {
+            'elapsed_seconds': elapsed_seconds,
+            'totals': {'tasks': self.tasks, 'skipped_tasks': self.skipped_tasks, 'bytes_read': self.bytes_read,
+                       'content_bytes': self.content_bytes, 'lines': self.lines, 'matches': self.matches,
+                       'decode_fallbacks': self.decode_fallbacks},
+            'stage_seconds': {'read_plain': self.plain_read_seconds, 'read_compressed': self.compressed_read_seconds,
+                              'search': self.search_seconds, 'handover': self.handover_seconds},
+            'slowest_files': self.slowest_tasks(),
+            'slowest_directories': self.slowest_directories(),
+        }
+        with open(json_path, 'w', encoding='utf-8') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+def save_search_profile(profiler, profile_path):
+    """Merges the main process's profile with those the workers saved next to profile_path and writes it there."""
+    profile_stats = pstats.Stats(profiler)
+    for worker_profile_path in glob.glob(f"{glob.escape(profile_path)}.worker-*"):
+        try:
+            profile_stats.add(worker_profile_path)
+            os.remove(worker_profile_path)
+        except (OSError, EOFError, TypeError, ValueError) as e_worker_profile:
+            print(f"Warning: Could not read worker profile '{worker_profile_path}': {e_worker_profile}")
+    profile_stats.dump_stats(profile_path)
+
+
+# --- Streaming Result Writer ---
+def format_result_line(timestamp, file_path, line_number, original_string, context):
+    return (f"[{timestamp}] File: {file_path} | Line: {line_number} | "
+            f"Found String: \"{original_string}\" | Context: {context}")
+
+
+def format_count_line(timestamp, file_path, original_string, hit_count):
+    return f"[{timestamp}] File: {file_path} | Found String: \"{original_string}\" | Count: {hit_count}"
+
+
+# Binary results files (OUTPUT_FORMAT "binary") start with this, then a table of the search strings.
+# Every frame after it is a one-byte tag and unsigned LEB128 varints; strings are a varint byte length
+# and UTF-8 (undecodable path characters kept with surrogateescape):
+#   S: string count, strings          (the search strings, in pattern_index order)
+#   P: path_id, path                  (before the first record of a file; path_ids count from 0)
+#   L: path_id, line, pattern_index, context
+#   C: path_id, pattern_index, count
+#   F: path_id                        (a file with at least one hit)
+_BINARY_RESULTS_MAGIC = b"PSSRES1\n"
+
+
+def _encode_varint(value):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _encode_binary_string(text):
+    encoded = text.encode('utf-8', 'surrogateescape')
+    return _encode_varint(len(encoded)) + encoded
+
+
+class StreamingResultWriter:
+    """
+    Appends result records to the output file from a background thread while the search runs.
+
+    Batches of (line_number, pattern_index, context) records - or (pattern_index, hit_count)
+    records in the "count" and "files" output modes - are handed over through a bounded queue,
+    so submit() blocks (and the search pauses) if writing falls behind, instead of the parent
+    piling up every result in memory. With in_file_order=True, batches are held back until
+    every batch with a lower sequence number has been written. output_format, output_mode and
+    path_dictionary are as OUTPUT_FORMAT, OUTPUT_MODE and OUTPUT_PATH_DICTIONARY describe.
+    """
+
+    def __init__(self, output_path, pattern_originals, in_file_order=False,
+                 max_pending_batches=None, buffer_bytes=None, output_format="text", output_mode="lines",
+                 path_dictionary=False):
+        self.output_path = output_path
+        self.pattern_originals = pattern_originals
+        self.in_file_order = in_file_order
+        self.output_format = output_format
+        self.output_mode = output_mode
+        self.path_dictionary = path_dictionary or output_format == "binary"
+        self.lines_written = 0
+        self.write_error = None
+        self._path_ids = {}
+        self._next_sequence_number = 0
+        self._held_batches = {}
+        self._queue = queue.Queue(maxsize=max_pending_batches or RESULT_WRITER_QUEUE_MAX_BATCHES)
+        if output_format == "binary":
+            self._out_f = open(output_path, 'ab', buffering=buffer_bytes or RESULT_WRITER_BUFFER_BYTES)
+            if self._out_f.tell() == 0:
+                self._out_f.write(_BINARY_RESULTS_MAGIC + b"S" + _encode_varint(len(pattern_originals))
+                                  + b"".join(_encode_binary_string(original) for original in pattern_originals))
+        else:
+            # backslashreplace: file names that are not valid UTF-8 must not stop the writer.
+            self._out_f = open(output_path, 'a', encoding='utf-8', errors='backslashreplace',
+                               buffering=buffer_bytes or RESULT_WRITER_BUFFER_BYTES)
+        self._thread = threading.Thread(target=self._write_loop, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sequence_number, file_path, records):
+        """Queues one file's records. sequence_number orders the output when in_file_order is set."""
+        if not self.in_file_order:
+            if records:
+                self._queue.put((file_path, records))
+            return
+        self._held_batches[sequence_number] = (file_path, records)
+        while self._next_sequence_number in self._held_batches:
+            held_path, held_records = self._held_batches.pop(self._next_sequence_number)
+            if held_records:
+                self._queue.put((held_path, held_records))
+            self._next_sequence_number += 1
+
+    def _path_id(self, file_path):
+        """Returns (path_id, whether the path is new and has to be written first)."""
+        path_id = self._path_ids.get(file_path)
+        if path_id is not None:
+            return path_id, False
+        path_id = self._path_ids[file_path] = len(self._path_ids)
+        return path_id, True
+
+    def _format_text_batch(self, file_path, records):
+        if self.output_mode == "files":
+            return f"{file_path}\n"
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.output_mode == "count":
+            return "".join(format_count_line(timestamp, file_path, self.pattern_originals[pattern_index], hit_count) + "\n"
+                           for pattern_index, hit_count in records)
+        return "".join(
+            format_result_line(timestamp, file_path, line_number, self.pattern_originals[pattern_index], context) + "\n"
+            for line_number, pattern_index, context in records)
+
+    def _format_jsonl_batch(self, file_path, records):
+        rows = []
+        if self.path_dictionary:
+            path_id, new_path = self._path_id(file_path)
+            if new_path:
+                rows.append(json.dumps({"path_id": path_id, "path": file_path}))
+            path_fields = {"path_id": path_id}
+        else:
+            path_fields = {"path": file_path}
+        if self.output_mode == "files":
+            rows.append(json.dumps(path_fields))
+        elif self.output_mode == "count":
+            rows.extend(json.dumps({**path_fields, "string": self.pattern_originals[pattern_index], "count": hit_count})
+                        for pattern_index, hit_count in records)
+        else:
+            rows.extend(json.dumps({**path_fields, "line": line_number, "string": self.pattern_originals[pattern_index],
+                                    "context": context})
+                        for line_number, pattern_index, context in records)
+        return "\n".join(rows) + "\n"
+
+    def _format_binary_batch(self, file_path, records):
+        path_id, new_path = self._path_id(file_path)
+        encoded_path_id = _encode_varint(path_id)
+        frames = [b"P" + encoded_path_id + _encode_binary_string(file_path)] if new_path else []
+        if self.output_mode == "files":
+            frames.append(b"F" + encoded_path_id)
+        elif self.output_mode == "count":
+            frames.extend(b"C" + encoded_path_id + _encode_varint(pattern_index) + _encode_varint(hit_count)
+                          for pattern_index, hit_count in records)
+        else:
+            frames.extend(b"L" + encoded_path_id + _encode_varint(line_number) + _encode_varint(pattern_index)
+                          + _encode_binary_string(context)
+                          for line_number, pattern_index, context in records)
+        return b"".join(frames)
+
+    def _write_loop(self):
+        format_batch = {"jsonl": self._format_jsonl_batch, "binary": self._format_binary_batch}.get(
+            self.output_format, self._format_text_batch)
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            if self.write_error is not None:
+                continue  # Keep draining so submit() never blocks forever.
+            file_path, records = batch
+            try:
+                self._out_f.write(format_batch(file_path, records))
+                self.lines_written += 1 if self.output_mode == "files" else len(records)
+            except Exception as e_write:  # The thread must survive, or submit() and close() would block forever.
+                self.write_error = e_write
+
+    def close(self):
+        """Writes anything still held back, waits for the writer thread and closes the file."""
+        for sequence_number in sorted(self._held_batches):
+            held_path, held_records = self._held_batches.pop(sequence_number)
+            if held_records:
+                self._queue.put((held_path, held_records))
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._out_f.close()
+        except (IOError, OSError) as e_close:
+            if self.write_error is None:
+                self.write_error = e_close
+
+
+# --- Incremental Scan State ---
+# Number of leading bytes hashed to notice a file that was replaced by one with the same name.
+_FILE_HEAD_HASH_BYTES = 4096
+
+
+def _hash_file_head(file_path, length):
+    with open(file_path, 'rb') as raw_file:
+        head_bytes = raw_file.read(length)
+    return head_bytes, hashlib.sha1(head_bytes).hexdigest()
+
+
+def classify_file_change(file_path, file_stat, recorded):
+    """
+    Compares a file with what was recorded when it was last read. recorded is
+    (device, inode, size, mtime_ns, head_length, head_hash, done_offset), where done_offset
+    is how far a plain file was read (the end of a complete line) and None for compressed
+    files, which are always read whole. Returns 'unchanged', 'appended' (the same file, grown
+    past done_offset and still starting with the same bytes, so reading can go on from
+    done_offset) or 'replaced' (new, rotated, truncated or rewritten: read it all again).
+    """
+    device, inode, size, mtime_ns, head_length, head_hash, done_offset = recorded
+    same_file = (device, inode) == (file_stat.st_dev, file_stat.st_ino)
+    if (same_file and (size, mtime_ns) == (file_stat.st_size, file_stat.st_mtime_ns)
+            and done_offset in (None, size)):
+        return 'unchanged'
+    if (same_file and done_offset is not None and done_offset < file_stat.st_size
+            and _hash_file_head(file_path, head_length)[1] == head_hash):
+        return 'appended'
+    return 'replaced'
+
+
+class IncrementalScanState:
+    """
+    What earlier runs found, kept in an SQLite file, so that a run with the same
+    strings_to_search only searches files that are new or changed since then.
+
+    For every file searched it stores the file's fingerprint (device, inode, size,
+    modification time and a hash of its first bytes), how far it was searched, the number of
+    lines up to there, and the hits found in that part. Plain files are searched up to the end
+    of their last complete line, so a file that was only appended to is searched again from
+    that point on; compressed files cannot be resumed and are searched again whenever they change.
+    Hits past the recorded line count are never reused, so an interrupted run cannot leave
+    duplicates behind.
+    """
+
+    COMMIT_EVERY_FILES = 500
+
+    def __init__(self, state_path, search_strings):
+        self.state_path = state_path
+        self.connection = sqlite3.connect(state_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS scan_meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS scan_files (
+                path TEXT PRIMARY KEY, device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER,
+                head_length INTEGER, head_hash TEXT, scanned_offset INTEGER, line_count INTEGER);
+            CREATE TABLE IF NOT EXISTS scan_hits (
+                path TEXT, line_number INTEGER, pattern_index INTEGER, context TEXT);
+            CREATE INDEX IF NOT EXISTS scan_hits_by_path ON scan_hits (path, line_number);
+        """)
+        # Hits are stored as pattern indices, so they are only valid for the exact same list of strings.
+        pattern_set_hash = hashlib.sha256("\0".join(search_strings).encode('utf-8')).hexdigest()
+        row = self.connection.execute("SELECT value FROM scan_meta WHERE key = 'pattern_set_hash'").fetchone()
+        self.pattern_set_changed = row is not None and row[0] != pattern_set_hash
+        if row is None or self.pattern_set_changed:
+            self.connection.execute("DELETE FROM scan_files")
+            self.connection.execute("DELETE FROM scan_hits")
+            self.connection.execute("INSERT OR REPLACE INTO scan_meta (key, value) VALUES ('pattern_set_hash', ?)",
+                                    (pattern_set_hash,))
+        self.connection.commit()
+        self._files_since_commit = 0
+
+    def plan_file(self, file_path):
+        """
+        Compares a file with what was recorded for it and decides how much of it to search.
+        Returns a dict whose 'action' is 'reuse' (unchanged: write the recorded hits, search
+        nothing), 'resume' (search from 'resume_offset' on, after 'resume_line_count' lines
+        whose hits are recorded) or 'full' (new, rotated, truncated or rewritten: search it all).
+        'stat', 'head_hash' and 'compression' describe the file as it is now; pass the plan
+        to record_scan() once the search is done. Raises OSError if the file cannot be read.
+        """
+        file_stat = os.stat(file_path)
+        scan_plan = {'action': 'full', 'stat': file_stat, 'resume_offset': 0, 'resume_line_count': 0,
+                     'head_length': 0, 'head_hash': None, 'compression': None}
+        row = self.connection.execute(
+            "SELECT device, inode, size, mtime_ns, head_length, head_hash, scanned_offset, line_count "
+            "FROM scan_files WHERE path = ?", (file_path,)).fetchone()
+        if row is not None:
+            scanned_offset, line_count = row[6], row[7]
+            file_change = classify_file_change(file_path, file_stat, row[:7])
+            if file_change == 'unchanged':
+                scan_plan.update(action='reuse', resume_offset=row[2], resume_line_count=line_count)
+                return scan_plan
+            if file_change == 'appended':
+                self.connection.execute("DELETE FROM scan_hits WHERE path = ? AND line_number > ?",
+                                        (file_path, line_count))
+                head_bytes, scan_plan['head_hash'] = _hash_file_head(file_path, _FILE_HEAD_HASH_BYTES)
+                scan_plan.update(action='resume', resume_offset=scanned_offset, resume_line_count=line_count,
+                                 head_length=len(head_bytes))
+                return scan_plan
+        # Also drops hits stored by a search of the file that failed or was interrupted before record_scan().
+        self.forget_file(file_path)
+        head_bytes, scan_plan['head_hash'] = _hash_file_head(file_path, _FILE_HEAD_HASH_BYTES)
+        scan_plan['head_length'] = len(head_bytes)
+        scan_plan['compression'] = detect_compression(head_bytes[:16])
+        return scan_plan
+
+    def recorded_hits(self, file_path, line_count):
+        """Returns the recorded (line_number, pattern_index, context) hits of a file, in file order."""
+        if line_count is None:
+            query, parameters = "WHERE path = ?", (file_path,)
+        else:
+            query, parameters = "WHERE path = ? AND line_number <= ?", (file_path, line_count)
+        return self.connection.execute(
+            "SELECT line_number, pattern_index, context FROM scan_hits " + query +
+            " ORDER BY line_number, pattern_index", parameters).fetchall()
+
+    def add_hits(self, file_path, records):
+        if records:
+            self.connection.executemany(
+                "INSERT INTO scan_hits (path, line_number, pattern_index, context) VALUES (?, ?, ?, ?)",
+                [(file_path, line_number, pattern_index, context) for line_number, pattern_index, context in records])
+
+    def record_scan(self, file_path, scan_plan, scanned_offset, line_count):
+        """
+        Records that a file was searched up to scanned_offset, the end of line line_count.
+        Both are None for compressed files, whose hits are then all reused while they stay unchanged.
+        """
+        file_stat = scan_plan['stat']
+        self.connection.execute(
+            "INSERT OR REPLACE INTO scan_files (path, device, inode, size, mtime_ns, head_length, head_hash, "
+            "scanned_offset, line_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_path, file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns,
+             scan_plan['head_length'], scan_plan['head_hash'], scanned_offset, line_count))
+        self._files_since_commit += 1
+        if self._files_since_commit >= self.COMMIT_EVERY_FILES:
+            self.connection.commit()
+            self._files_since_commit = 0
+
+    def forget_file(self, file_path):
+        self.connection.execute("DELETE FROM scan_files WHERE path = ?", (file_path,))
+        self.connection.execute("DELETE FROM scan_hits WHERE path = ?", (file_path,))
+
+    def forget_missing_files(self, root_directory, present_file_paths):
+        """Drops what is recorded for files under root_directory that no longer exist (or are now ignored)."""
+        present_file_paths = set(present_file_paths)
+        root_prefix = os.path.join(root_directory, "")
+        for (recorded_path,) in self.connection.execute("SELECT path FROM scan_files").fetchall():
+            if recorded_path.startswith(root_prefix) and recorded_path not in present_file_paths:
+                self.forget_file(recorded_path)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+# --- Content Index ---
+_NON_ASCII_BYTE_RE = re.compile(rb"[\x80-\xff]")
+_TRIGRAM_FILTER_MAX_BITS = 1 << 24
+
+
+def _fold_block_for_index(data):
+    """Case-folds raw bytes the way lines are folded before matching, so the index sees the same text."""
+    if not _NON_ASCII_BYTE_RE.search(data):
+        return bytes(data).lower()
+    return fold_case_for_matching(bytes(data).decode("utf-8", errors="ignore")).encode("utf-8")
+
+
+def _trigram_values(folded_bytes):
+    """
+    Returns the set of every 3-byte substring of folded_bytes as a little-endian integer.
+    Rather than slicing at every position, the data is viewed as 4-byte integers at each of
+    the four alignments (all done in C); each distinct 4-gram then yields its two trigrams.
+    """
+    trigrams = set()
+    if len(folded_bytes) == 3:
+        trigrams.add(int.from_bytes(folded_bytes, "little"))
+    four_grams = set()
+    with memoryview(folded_bytes) as view:
+        for alignment in range(4):
+            usable_length = (len(folded_bytes) - alignment) // 4 * 4
+            if usable_length > 0:
+                four_grams.update(view[alignment:alignment + usable_length].cast("I"))
+    if sys.byteorder == "big":
+        four_grams = {int.from_bytes(four_gram.to_bytes(4, "big"), "little") for four_gram in four_grams}
+    trigrams.update(four_gram & 0xFFFFFF for four_gram in four_grams)
+    trigrams.update(four_gram >> 8 for four_gram in four_grams)
+    return trigrams
+
 
-# List of specific strings to search for in the files.
-strings_to_search = [
-    "edge-services-qa.stgedge.com", 
-    "ERROR_CODE_XYZ",               
-    "UserLoginFailedEvent",         
-    "critical system alert",
-    "testtest.com"                  
-]
+def _trigram_filter_positions(trigram, bit_mask):
+    mixed = (trigram * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    return (mixed >> 40) & bit_mask, (mixed >> 16) & bit_mask
 
-# Define a threshold for "massive" plain text files (in bytes).
-MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES = 500 * 1024 * 1024
+
+def build_trigram_filter(trigrams):
+    """
+    Builds a Bloom filter (two bits per trigram, about four bits of filter per trigram)
+    holding a set of trigram values. Queries ask for every trigram of a search string, so a
+    fairly high per-trigram false positive rate still rules out almost all blocks without it.
+    """
+    bit_count = 512
+    while bit_count < len(trigrams) * 4 and bit_count < _TRIGRAM_FILTER_MAX_BITS:
+        bit_count *= 2
+    bit_mask = bit_count - 1
+    filter_bits = bytearray(bit_count // 8)
+    for trigram in trigrams:
+        for position in _trigram_filter_positions(trigram, bit_mask):
+            filter_bits[position >> 3] |= 1 << (position & 7)
+    return bytes(filter_bits)
 
 
-# --- Worker Function for Parallel Processing ---
-# (process_file_worker function remains the same as the last version)
-def process_file_worker(file_path, compiled_patterns_with_originals):
+def trigram_filter_may_contain(filter_bits, query_trigram_sets):
+    """True if, going by the filter, some entry of query_trigram_sets may be fully contained in the data."""
+    bit_mask = len(filter_bits) * 8 - 1
+    for trigram_set in query_trigram_sets:
+        for trigram in trigram_set:
+            first, second = _trigram_filter_positions(trigram, bit_mask)
+            if not (filter_bits[first >> 3] >> (first & 7)) & 1 or not (filter_bits[second >> 3] >> (second & 7)) & 1:
+                break
+        else:
+            return True
+    return False
+
+
+def query_trigram_sets_for(search_strings):
     """
-    Processes a single file: opens/decompresses, reads lines, and searches for specified strings.
-    For massive plain text files, it reads line by line to save memory.
+    Returns one set of trigram values per search string, or None if some string cannot be
+    looked up in the content index: strings shorter than three characters, and strings with
+    characters that do not fold to ASCII (their case variants can differ in UTF-8 bytes).
     """
-    # This print indicates which file a worker is starting on.
-    # In parallel execution, output from different workers might interleave with tqdm.
-    # tqdm typically prints to stderr, print() to stdout.
-    # print(f"Worker starting on: {file_path}") # Keep this if you want per-worker start, or remove for cleaner tqdm output
+    query_trigram_sets = []
+    for search_string in search_strings:
+        folded = fold_case_for_matching(search_string)
+        if len(folded) < 3 or not folded.isascii():
+            return None
+        query_trigram_sets.append(frozenset(_trigram_values(folded.encode("ascii"))))
+    return query_trigram_sets
 
-    found_results_for_this_file = []
-    is_gz_file = file_path.lower().endswith(".gz")
-    search_was_performed_on_actual_content = False 
 
+def build_index_worker(file_path, start_offset, end_offset, lines_before_start, block_size):
+    """
+    Reads a file for the content index. Plain files are read from start_offset (a line start:
+    0, or where the previous build stopped for a file that grew) to end_offset and cut into
+    line-aligned blocks of about block_size bytes, each with its own trigram filter; the bytes
+    after the last '\n' are left for a later build. Compressed files get a single filter.
+
+    Returns (file_path, blocks, indexed_offset, line_count, error), where blocks are
+    (start_offset, end_offset, first_line_number, trigram_filter) and indexed_offset and
+    line_count (None for compressed files) tell where the indexed part ends.
+    """
+    compression = None
+    try:
+        with open(file_path, 'rb') as raw_file:
+            if start_offset == 0:
+                compression = detect_compression(raw_file.read(16))
+                raw_file.seek(0)
+                file_ext = os.path.splitext(file_path)[1].lower()
+                if compression is None and file_ext in COMPRESSED_FILE_EXTENSIONS:
+                    return file_path, [], None, None, f"Corrupted/Invalid {file_ext} file: not {COMPRESSED_FILE_EXTENSIONS[file_ext]} data"
+            if compression is not None:
+                trigrams = set()
+                with open_decompressed_stream(raw_file, compression) as opened_file_stream:
+                    for data, start, end in iter_stream_blocks(opened_file_stream, block_size):
+                        trigrams |= _trigram_values(_fold_block_for_index(data[start:end]))
+                return file_path, [(0, end_offset, 1, build_trigram_filter(trigrams))], None, None, None
+
+            raw_file.seek(start_offset)
+            blocks = []
+            block_start = start_offset
+            first_line_number = lines_before_start + 1
+            body_blocks = _iter_shard_body_blocks(
+                iter_stream_blocks(_ByteRangeReader(raw_file, end_offset - start_offset), block_size),
+                {}, keep_head=False, keep_tail=True)
+            for body, _, body_length in body_blocks:
+                trigram_filter = build_trigram_filter(_trigram_values(_fold_block_for_index(body)))
+                blocks.append((block_start, block_start + body_length, first_line_number, trigram_filter))
+                block_start += body_length
+                first_line_number += _count_line_breaks(body, 0, body_length)
+            return file_path, blocks, block_start, first_line_number - 1, None
+    except Exception as e_index:
+        return file_path, [], None, None, _describe_read_error(file_path, compression, e_index)
+
+
+class ContentIndex:
+    """
+    A trigram index of the files under target_directory, kept in an SQLite file, that lets
+    searches for any strings skip the data that cannot contain them.
+
+    Plain files are indexed in line-aligned blocks of about CONTENT_INDEX_BLOCK_SIZE_BYTES,
+    each with a Bloom filter of the trigrams in its case-folded text, its byte range and the
+    number of its first line, so a search reads just the blocks whose filter has every trigram
+    of some search string and still reports correct line numbers. Compressed files cannot be
+    read from the middle and get one filter for the whole file. Rebuilding only reads new
+    files, data appended to plain files and files that were replaced.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS index_files (
+                path TEXT PRIMARY KEY, device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER,
+                head_length INTEGER, head_hash TEXT, indexed_offset INTEGER, line_count INTEGER);
+            CREATE TABLE IF NOT EXISTS index_blocks (
+                path TEXT, start_offset INTEGER, end_offset INTEGER, first_line_number INTEGER,
+                trigram_filter BLOB);
+            CREATE INDEX IF NOT EXISTS index_blocks_by_path ON index_blocks (path, start_offset);
+        """)
+        self.connection.commit()
+
+    def _recorded_file(self, file_path):
+        return self.connection.execute(
+            "SELECT device, inode, size, mtime_ns, head_length, head_hash, indexed_offset, line_count "
+            "FROM index_files WHERE path = ?", (file_path,)).fetchone()
+
+    def plan_build(self, file_path):
+        """
+        Decides what a build has to read of a file. Returns None if its index is up to date,
+        else a dict with 'stat', 'start_offset', 'line_count' (lines before start_offset) and
+        the 'head_length'/'head_hash' to record. Raises OSError if the file cannot be read.
+        """
+        file_stat = os.stat(file_path)
+        build_plan = {'stat': file_stat, 'start_offset': 0, 'line_count': 0}
+        row = self._recorded_file(file_path)
+        if row is not None:
+            file_change = classify_file_change(file_path, file_stat, row[:7])
+            if file_change == 'unchanged':
+                return None
+            if file_change == 'appended':
+                build_plan.update(start_offset=row[6], line_count=row[7])
+        head_bytes, build_plan['head_hash'] = _hash_file_head(file_path, _FILE_HEAD_HASH_BYTES)
+        build_plan['head_length'] = len(head_bytes)
+        return build_plan
+
+    def record_build(self, file_path, build_plan, blocks, indexed_offset, line_count):
+        if build_plan['start_offset'] == 0:
+            self.connection.execute("DELETE FROM index_blocks WHERE path = ?", (file_path,))
+        self.connection.executemany(
+            "INSERT INTO index_blocks (path, start_offset, end_offset, first_line_number, trigram_filter) "
+            "VALUES (?, ?, ?, ?, ?)", [(file_path,) + tuple(block) for block in blocks])
+        file_stat = build_plan['stat']
+        self.connection.execute(
+            "INSERT OR REPLACE INTO index_files (path, device, inode, size, mtime_ns, head_length, head_hash, "
+            "indexed_offset, line_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_path, file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns,
+             build_plan['head_length'], build_plan['head_hash'], indexed_offset, line_count))
+        self.connection.commit()
+
+    def plan_search(self, file_path):
+        """
+        Tells how a search can use the index for a file. Returns None if the file is not
+        indexed (or was replaced since), else (unindexed_start, lines_before_unindexed, file_size):
+        the file's blocks can be looked up in the index, and the data from unindexed_start on,
+        appended since the last build, has to be searched anyway. unindexed_start is None for
+        compressed files.
+        """
+        row = self._recorded_file(file_path)
+        if row is None:
+            return None
+        file_stat = os.stat(file_path)
+        if classify_file_change(file_path, file_stat, row[:7]) == 'replaced':
+            return None
+        return row[6], row[7], file_stat.st_size
+
+    def forget_missing_files(self, root_directory, present_file_paths):
+        """Drops the index of files under root_directory that no longer exist (or are now ignored)."""
+        present_file_paths = set(present_file_paths)
+        root_prefix = os.path.join(root_directory, "")
+        for (recorded_path,) in self.connection.execute("SELECT path FROM index_files").fetchall():
+            if recorded_path.startswith(root_prefix) and recorded_path not in present_file_paths:
+                self.connection.execute("DELETE FROM index_files WHERE path = ?", (recorded_path,))
+                self.connection.execute("DELETE FROM index_blocks WHERE path = ?", (recorded_path,))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def build_content_index():
+    """Builds or brings up to date the content index at CONTENT_INDEX_PATH for the files in target_directory."""
+    if not CONTENT_INDEX_PATH:
+        print("Error: Set CONTENT_INDEX_PATH to the file the content index should be written to.")
+        return
+    skipped_file_log = []
+    print(f"Indexing files in: {target_directory}")
+    files_to_process = find_files_to_search(skipped_file_log)
     try:
-        opened_file_stream = None 
-        lines_from_small_file = None 
+        content_index = ContentIndex(CONTENT_INDEX_PATH)
+    except (sqlite3.Error, OSError) as e_index:
+        print(f"CRITICAL ERROR: Could not open content index '{CONTENT_INDEX_PATH}': {e_index}. Exiting.")
+        return
 
-        if is_gz_file:
+    try:
+        build_plans = {}
+        for file_path in files_to_process:
             try:
-                opened_file_stream = gzip.open(file_path, 'rt', encoding='utf-8', errors='ignore')
-            except gzip.BadGzipFile as e_bad_gz:
-                return file_path, [], f"Corrupted/Invalid .gz file: {e_bad_gz}"
-            except Exception as e_gz: 
-                return file_path, [], f"Error reading gzipped file: {e_gz}"
+                build_plan = content_index.plan_build(file_path)
+            except OSError as e_stat:
+                skipped_file_log.append({'path': file_path, 'reason': f"Error opening file for indexing: {e_stat}"})
+                continue
+            if build_plan is not None:
+                build_plans[file_path] = build_plan
+        print(f"{len(files_to_process) - len(build_plans)} file(s) already indexed, {len(build_plans)} to (re)index.")
+
+        num_workers = search_worker_count()
+        indexed_bytes = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            future_to_path = {
+                executor.submit(build_index_worker, file_path, build_plan['start_offset'], build_plan['stat'].st_size,
+                                build_plan['line_count'], CONTENT_INDEX_BLOCK_SIZE_BYTES): file_path
+                for file_path, build_plan in build_plans.items()}
+            for future in tqdm(concurrent.futures.as_completed(future_to_path), total=len(future_to_path),
+                               desc="Indexing files", unit="file", ncols=100):
+                file_path = future_to_path.pop(future)
+                try:
+                    _fp_returned, blocks, indexed_offset, line_count, error = future.result()
+                except Exception as exc:
+                    error = f"Worker process CRASHED or unhandled error for {file_path}: {exc}"
+                if error:
+                    skipped_file_log.append({'path': file_path, 'reason': error})
+                    continue
+                build_plan = build_plans[file_path]
+                content_index.record_build(file_path, build_plan, blocks, indexed_offset, line_count)
+                indexed_bytes += build_plan['stat'].st_size - build_plan['start_offset']
+        content_index.forget_missing_files(target_directory, files_to_process)
+    finally:
+        content_index.close()
+
+    print(f"Indexed {indexed_bytes / (1024 * 1024):.1f} MB. Index saved to: {CONTENT_INDEX_PATH}")
+    for record in skipped_file_log:
+        print(f"Not indexed: {record['path']} | Reason: {record['reason']}")
+
+
+# --- Finding Files ---
+# How long the search loop waits for the file walker before checking on the workers again (in seconds).
+_FILE_WALKER_POLL_SECONDS = 0.05
+
+
+def _glob_matches(relative_path, name, globs):
+    for pattern in globs:
+        if fnmatch.fnmatch(relative_path if "/" in pattern else name, pattern):
+            return True
+    return False
+
+
+def directory_is_excluded(relative_path, directory_name):
+    return _glob_matches(relative_path, directory_name, exclude_directory_globs)
+
+
+def file_name_verdict(relative_path, file_name):
+    """
+    Checks a file's name against ignore_extensions and the include/exclude globs. relative_path
+    is its path relative to target_directory, written with "/". Returns None if the file is to be
+    searched, else the reason it is not: "Ignored extension: ..." or "filtered".
+    """
+    file_ext = os.path.splitext(file_name)[1].lower()
+    if file_ext in ignore_extensions:
+        return f"Ignored extension: {file_ext}"
+    if ((include_file_globs and not _glob_matches(relative_path, file_name, include_file_globs))
+            or _glob_matches(relative_path, file_name, exclude_file_globs)):
+        return "filtered"
+    return None
+
+
+def file_stat_is_selected(file_stat):
+    """Checks a file's size and modification time against the size and modification time limits."""
+    if min_file_size_bytes is not None and file_stat.st_size < min_file_size_bytes:
+        return False
+    if max_file_size_bytes is not None and file_stat.st_size > max_file_size_bytes:
+        return False
+    if modified_after is not None and file_stat.st_mtime <= modified_after.timestamp():
+        return False
+    if modified_before is not None and file_stat.st_mtime >= modified_before.timestamp():
+        return False
+    return True
+
+
+class FileWalker:
+    """
+    Lists the files to search under a directory with os.scandir in a background thread, so
+    searching can start with the first files found instead of waiting for the whole tree.
+
+    Files come out in the same order os.walk would list them, one directory at a time, as
+    (file_path, file_stat) pairs, with the stat data taken from the directory listing where the
+    platform provides it. Files with an extension in ignore_extensions are added to
+    skipped_file_log. Directories matching exclude_directory_globs are never entered, and files
+    outside include_file_globs / exclude_file_globs and the size and modification time limits are
+    left out without reading them. At most FILE_WALKER_QUEUE_MAX_DIRECTORIES listings wait to be
+    picked up, so the walk pauses rather than racing far ahead of the search.
+    """
+
+    def __init__(self, root_directory, recursive, skipped_file_log, max_queued_directories=None):
+        self.root_directory = root_directory
+        self.recursive = recursive
+        self.skipped_file_log = skipped_file_log
+        self.files_found = 0
+        self.files_ignored = 0
+        self.files_filtered_out = 0
+        self.directories_excluded = 0
+        self._queue = queue.Queue(maxsize=max_queued_directories or FILE_WALKER_QUEUE_MAX_DIRECTORIES)
+        self._finished = False
+        self._stop_requested = False
+        self._thread = None
+
+    def start(self):
+        """
+        Opens root_directory and starts listing it in the background. Returns False, after
+        printing and logging the problem, if root_directory cannot be read.
+        """
+        try:
+            root_entries = os.scandir(self.root_directory)
+        except FileNotFoundError:
+            err_msg = f"Target directory '{self.root_directory}' not found."
+        except Exception as e:
+            err_msg = f"Error accessing target directory '{self.root_directory}': {e}"
         else:
+            self._thread = threading.Thread(target=self._walk_loop, args=(root_entries,), name="file-walker", daemon=True)
+            self._thread.start()
+            return True
+        print(f"CRITICAL ERROR: {err_msg}")
+        self.skipped_file_log.append({'path': self.root_directory, 'reason': err_msg})
+        return False
+
+    def _walk_loop(self, root_entries):
+        try:
+            directories_to_list = [(self.root_directory, "", root_entries)]
+            while directories_to_list and not self._stop_requested:
+                directory_path, relative_directory, directory_entries = directories_to_list.pop()
+                if directory_entries is None:
+                    try:
+                        directory_entries = os.scandir(directory_path)
+                    except OSError as e:
+                        self.skipped_file_log.append({'path': directory_path, 'reason': f"Error listing directory: {e}"})
+                        continue
+                found_files, subdirectories = self._list_directory(directory_entries, relative_directory)
+                if found_files:
+                    self._queue.put(found_files)
+                # Reversed, so that subdirectories are listed in order, depth first, like os.walk does.
+                directories_to_list.extend(reversed(subdirectories))
+        except Exception as e:
+            self.skipped_file_log.append({'path': self.root_directory, 'reason': f"Error listing directory: {e}"})
+        finally:
+            self._queue.put(None)
+
+    def _list_directory(self, directory_entries, relative_directory):
+        found_files = []
+        subdirectories = []
+        with directory_entries:
+            for entry in directory_entries:
+                relative_path = relative_directory + entry.name
+                try:
+                    if entry.is_dir():
+                        # Like os.walk, symbolic links to directories are not followed.
+                        if not self.recursive or entry.is_symlink():
+                            continue
+                        if directory_is_excluded(relative_path, entry.name):
+                            self.directories_excluded += 1
+                            continue
+                        subdirectories.append((entry.path, relative_path + "/", None))
+                        continue
+                    if not entry.is_file():
+                        continue
+                    name_verdict = file_name_verdict(relative_path, entry.name)
+                    if name_verdict == "filtered":
+                        self.files_filtered_out += 1
+                        continue
+                    if name_verdict is not None:
+                        self.files_ignored += 1
+                        self.skipped_file_log.append({'path': entry.path, 'reason': name_verdict})
+                        continue
+                    file_stat = entry.stat()
+                except OSError as e:
+                    self.skipped_file_log.append({'path': entry.path, 'reason': f"Error reading file information: {e}"})
+                    continue
+                if not file_stat_is_selected(file_stat):
+                    self.files_filtered_out += 1
+                    continue
+                self.files_found += 1
+                found_files.append((entry.path, file_stat))
+        return found_files, subdirectories
+
+    def get_found_files(self, wait_seconds=None):
+        """
+        Returns the (file_path, file_stat) pairs found since the last call. Waits up to
+        wait_seconds (forever if None) for the next directory and returns [] if nothing turned
+        up in time; returns None once the walk is over and every file has been handed out.
+        """
+        if self._finished:
+            return None
+        found_files = []
+        try:
+            listing = self._queue.get(timeout=wait_seconds) if wait_seconds != 0 else self._queue.get_nowait()
+            while True:
+                if listing is None:
+                    self._finished = True
+                    return found_files or None
+                found_files.extend(listing)
+                listing = self._queue.get_nowait()
+        except queue.Empty:
+            return found_files
+
+    def iter_found_files(self):
+        """Yields every (file_path, file_stat) pair as it is found, until the walk is over."""
+        while True:
+            found_files = self.get_found_files()
+            if found_files is None:
+                return
+            yield from found_files
+
+    def stop(self):
+        """Ends the walk early, e.g. when the caller has all the results it wants, and waits for the thread."""
+        self._stop_requested = True
+        while self._thread is not None and self._thread.is_alive():
             try:
-                file_size = os.path.getsize(file_path)
-                if file_size <= MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES:
-                    lines_to_process_directly = []
-                    try: 
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f_text:
-                            lines_to_process_directly = f_text.readlines()
-                    except UnicodeDecodeError: 
-                        # print(f"Info (worker): UTF-8 decode failed for small file {file_path}, trying Latin-1.") # Can be noisy with tqdm
-                        try:
-                            with open(file_path, 'r', encoding='latin-1', errors='ignore') as f_text_latin:
-                                lines_to_process_directly = f_text_latin.readlines()
-                        except Exception as e_small_latin: 
-                            return file_path, [], f"Error opening/reading small text file with Latin-1: {e_small_latin}"
-                    except Exception as e_small_utf8: 
-                        return file_path, [], f"Error opening/reading small text file with UTF-8: {e_small_utf8}"
-                    
-                    if lines_to_process_directly: 
-                        search_was_performed_on_actual_content = True 
-                        for line_number, line_content in enumerate(lines_to_process_directly, 1):
-                            for original_string, compiled_pattern in compiled_patterns_with_originals:
-                                if compiled_pattern.search(line_content):
-                                    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                    result = (f"[{timestamp}] File: {file_path} | Line: {line_number} | "
-                                              f"Found String: \"{original_string}\" | Context: {line_content.strip()}")
-                                    found_results_for_this_file.append(result)
-                    
-                else: 
-                    # print(f"Info (worker): File '{file_path}' is massive (>{MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES / (1024*1024):.0f}MB), will read line-by-line.") # Can be noisy
-                    opened_file_stream = open(file_path, 'r', encoding='utf-8', errors='ignore')
+                self._queue.get(timeout=_FILE_WALKER_POLL_SECONDS)  # Makes room, should the thread wait to hand over a listing.
+            except queue.Empty:
+                pass
+        self._finished = True
+
+    def summary(self):
+        """Returns a line describing what the walk found and left out."""
+        summary_line = f"Found {self.files_found} file(s) to search"
+        if self.files_ignored:
+            summary_line += f", {self.files_ignored} ignored by extension"
+        if self.files_filtered_out:
+            summary_line += f", {self.files_filtered_out} left out by the name, size and date filters"
+        if self.directories_excluded:
+            summary_line += f", {self.directories_excluded} excluded folder(s) not entered"
+        return summary_line + "."
+
+
+# --- Main Script Logic ---
+def plan_index_windows(file_size, unindexed_start):
+    """
+    Splits an indexed file into byte windows searched by separate workers: huge plain files
+    get one per PLAIN_TEXT_SHARD_SIZE_BYTES, so they are still searched in parallel.
+    """
+    if unindexed_start is None or file_size < MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES:
+        return [(0, file_size + 1)]
+    window_starts = list(range(0, file_size, PLAIN_TEXT_SHARD_SIZE_BYTES))
+    return list(zip(window_starts, window_starts[1:] + [file_size + 1]))
+
+
+def find_files_to_search(skipped_file_log):
+    """
+    Lists the files in target_directory (and its subdirectories if include_subdirectories)
+    that FileWalker finds, for callers that need the whole list before they start. Ignored
+    files and problems reading the directory are added to skipped_file_log. Returns an empty
+    list if there is nothing to search.
+    """
+    file_walker = FileWalker(target_directory, include_subdirectories, skipped_file_log)
+    if not file_walker.start():
+        return []
+    files_to_process = [file_path for file_path, _file_stat in file_walker.iter_found_files()]
+    print(file_walker.summary())
+    if not files_to_process and not skipped_file_log:
+        print(f"No files found in '{target_directory}'.")
+    return files_to_process
 
-            except Exception as e_open_prepare: 
-                return file_path, [], f"Error preparing plain text file for reading: {e_open_prepare}"
-        
-        if opened_file_stream:
+
+class SearchTaskPlanner:
+    """
+    Turns the files found by a FileWalker into search tasks for the TaskBatchScheduler.
+
+    Each task is (sequence_number, file_path, shard, index_lookup): with both None the whole
+    file is searched by one worker. Every sequence number is one batch of results for the
+    writer. With the incremental scan state some batches are hits recorded by an earlier run
+    instead; those are handed to the result writer straight away, while the workers search
+    what is new.
+
+    Workers check a file for binary content when they search it in one task. A file searched as
+    several tasks is checked here instead, once: with BINARY_FILE_HANDLING "skip" it gets no
+    tasks and is added to skipped_file_log, with "raw" it is listed in binary_files so the
+    contexts of its hits can be cut down by binary_hit_context. binary_content_reasons keeps
+    every decision made here for the rest of the run. open_task_counts holds, for each file
+    searched as several tasks, how many of them have not finished yet.
+    """
+
+    def __init__(self, file_walker, pattern_matcher, result_writer, found_files_set, skipped_file_log,
+                 content_index=None, scan_state=None):
+        self.file_walker = file_walker
+        self.pattern_matcher = pattern_matcher
+        self.result_writer = result_writer
+        self.found_files_set = found_files_set
+        self.content_index = content_index
+        self.scan_state = scan_state
+        self.skipped_file_log = skipped_file_log
+        self.binary_content_reasons = {}
+        self.binary_files = set()
+        self.found_file_paths = []
+        self.shard_mergers = {}
+        self.open_task_counts = {}
+        self.scan_plans = {}
+        self.task_count = 0
+        self.indexed_file_count = 0
+        self._next_sequence_number = 0
+
+    def plan_found_files(self, wait_seconds):
+        """
+        Plans the files found since the last call; a task source for TaskBatchScheduler.
+        Returns a list of (task, task_cost) pairs, or None once every file has been planned.
+        """
+        found_files = self.file_walker.get_found_files(wait_seconds)
+        if found_files is None:
+            return None
+        planned_tasks = []
+        for file_path, file_stat in found_files:
+            self.found_file_paths.append(file_path)
+            planned_tasks.extend(self._plan_file(file_path, file_stat.st_size))
+        self.task_count += len(planned_tasks)
+        return planned_tasks
+
+    def _binary_content_reason(self, file_path, compression):
+        if file_path not in self.binary_content_reasons:
             try:
-                lines_iterated_from_stream = 0
-                for line_number, line_content in enumerate(opened_file_stream, 1):
-                    if lines_iterated_from_stream == 0: 
-                        search_was_performed_on_actual_content = True
-                    lines_iterated_from_stream += 1
-                    
-                    for original_string, compiled_pattern in compiled_patterns_with_originals:
-                        if compiled_pattern.search(line_content):
-                            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            result = (
-                                f"[{timestamp}] File: {file_path} | Line: {line_number} | "
-                                f"Found String: \"{original_string}\" | Context: {line_content.strip()}"
-                            )
-                            found_results_for_this_file.append(result)
-                # if lines_iterated_from_stream == 0 and os.path.getsize(file_path) > 0: 
-                #     print(f"Info (worker): Stream for '{file_path}' yielded no lines.") # Can be noisy
-
-            except UnicodeDecodeError: 
-                if not is_gz_file: 
-                    try:
-                        if opened_file_stream and not opened_file_stream.closed:
-                           opened_file_stream.close() 
-                        # print(f"Info (worker): Retrying massive plain text file '{file_path}' with Latin-1 encoding.") # Can be noisy
-                        with open(file_path, 'r', encoding='latin-1', errors='ignore') as f_latin_stream:
-                            lines_iterated_from_latin_stream = 0
-                            for line_number, line_content in enumerate(f_latin_stream, 1):
-                                if lines_iterated_from_latin_stream == 0:
-                                    search_was_performed_on_actual_content = True
-                                lines_iterated_from_latin_stream +=1
-                                for original_string, compiled_pattern in compiled_patterns_with_originals:
-                                    if compiled_pattern.search(line_content):
-                                        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                        result = (f"[{timestamp}] File: {file_path} | Line: {line_number} | "
-                                                  f"Found String: \"{original_string}\" | Context: {line_content.strip()}")
-                                        found_results_for_this_file.append(result)
-                            # if lines_iterated_from_latin_stream == 0 and os.path.getsize(file_path) > 0:
-                            #     print(f"Info (worker): Latin-1 stream for '{file_path}' yielded no lines.") # Can be noisy
-                    except Exception as e_latin_stream: 
-                        return file_path, found_results_for_this_file, f"Error in latin-1 stream for massive plain text: {e_latin_stream}"
-            except Exception as e_stream_read: 
-                 return file_path, found_results_for_this_file, f"Error reading stream for {file_path}: {e_stream_read}"
-            finally:
-                if opened_file_stream and not opened_file_stream.closed: 
-                    opened_file_stream.close()
-        
-        file_actually_has_size = os.path.getsize(file_path) > 0
-        if file_actually_has_size and not found_results_for_this_file:
-            if search_was_performed_on_actual_content:
-                # This specific print might still be useful if you want to know about files searched with no hits.
-                # However, it can be very noisy with tqdm if many files are like this.
-                # Consider commenting it out if the tqdm progress is enough.
-                # print(f"Info (worker): File '{file_path}' was read and searched, but no target strings were found.")
-                pass 
+                self.binary_content_reasons[file_path] = sniff_binary_content(read_content_sample(file_path, compression))
+            except Exception:
+                self.binary_content_reasons[file_path] = None  # The worker will report the problem when it opens the file.
+        return self.binary_content_reasons[file_path]
+
+    def _take_sequence_number(self):
+        self._next_sequence_number += 1
+        return self._next_sequence_number - 1
+
+    def _plan_file(self, file_path, file_size):
+        scan_plan = None
+        shard_plan = None
+        index_plan = None
+        try:
+            if self.content_index is not None:
+                index_plan = self.content_index.plan_search(file_path)
+            elif self.scan_state is not None:
+                scan_plan = self.scan_state.plan_file(file_path)
+                if scan_plan['action'] != 'reuse':
+                    shard_plan = plan_incremental_shards(file_path, scan_plan)
+            if index_plan is None and scan_plan is None:
+                shard_plan = plan_file_shards(file_path, file_size)
+        except Exception:
+            scan_plan = shard_plan = index_plan = None  # The worker will report the problem when it opens the file.
+
+        if BINARY_FILE_HANDLING != "text":
+            if shard_plan is not None and len(shard_plan[1]) > 1:
+                binary_reason = self._binary_content_reason(file_path, shard_plan[0])
+            elif index_plan is not None and len(plan_index_windows(index_plan[2], index_plan[0])) > 1:
+                binary_reason = self._binary_content_reason(file_path, None)
             else:
-                # print(f"Info (worker): File '{file_path}' has size but yielded no searchable text lines.") # Can be noisy
-                pass
-        # elif not file_actually_has_size and not found_results_for_this_file:
-        #      print(f"Info (worker): File '{file_path}' is empty (0 bytes).") # Can be noisy
+                binary_reason = None
+            if binary_reason is not None:
+                if BINARY_FILE_HANDLING == "skip":
+                    self.skipped_file_log.append({'path': file_path, 'reason': _binary_skip_reason(binary_reason)})
+                    return []
+                self.binary_files.add(file_path)
 
-        return file_path, found_results_for_this_file, None 
+        planned_tasks = []
+        if index_plan is not None:
+            self.indexed_file_count += 1
+            unindexed_start, lines_before_unindexed, file_size = index_plan
+            index_windows = plan_index_windows(file_size, unindexed_start)
+            if len(index_windows) > 1:
+                self.open_task_counts[file_path] = len(index_windows)
+            for window_start, window_end in index_windows:
+                index_lookup = (CONTENT_INDEX_PATH, window_start, window_end,
+                                unindexed_start, (lines_before_unindexed or 0) + 1)
+                planned_tasks.append(((self._take_sequence_number(), file_path, None, index_lookup),
+                                      estimate_task_cost(file_path, file_size, None, index_lookup)))
+            return planned_tasks
+        if scan_plan is not None:
+            self.scan_plans[file_path] = scan_plan
+            if scan_plan['action'] != 'full':
+                recorded_records = self.scan_state.recorded_hits(file_path, scan_plan['resume_line_count'])
+                if recorded_records:
+                    self.found_files_set.add(file_path)
+                self.result_writer.submit(self._take_sequence_number(), file_path, recorded_records)
+            if scan_plan['action'] == 'reuse':
+                return planned_tasks
+        if shard_plan is None:
+            planned_tasks.append(((self._take_sequence_number(), file_path, None, None),
+                                  estimate_task_cost(file_path, file_size, None, None)))
+            return planned_tasks
+        compression, shard_ranges = shard_plan
+        if scan_plan is not None:
+            self.shard_mergers[file_path] = ShardResultMerger(
+                file_path, len(shard_ranges), self._next_sequence_number, self.pattern_matcher,
+                lines_before_first_shard=scan_plan['resume_line_count'],
+                end_offset=shard_ranges[-1][1] if compression is None else None)
+        else:
+            self.shard_mergers[file_path] = ShardResultMerger(
+                file_path, len(shard_ranges), self._next_sequence_number, self.pattern_matcher)
+        self.open_task_counts[file_path] = len(shard_ranges)
+        for shard_index, (start_offset, end_offset) in enumerate(shard_ranges):
+            shard = (shard_index, len(shard_ranges), start_offset, end_offset, compression)
+            planned_tasks.append(((self._take_sequence_number(), file_path, shard, None),
+                                  estimate_task_cost(file_path, file_size, shard, None)))
+        return planned_tasks
 
-    except Exception as e_outer_worker: 
-        return file_path, [], f"Unexpected error in worker for file '{file_path}': {e_outer_worker} \n{traceback.format_exc()}"
+
+# Number of search strings the end-of-search summary lists the hits of, most hits first.
+_HITS_PER_STRING_LISTED = 20
+
+
+def hits_per_string_lines(pattern_originals, pattern_hit_totals):
+    """The end-of-search summary lines giving the number of hits of each search string."""
+    ranked = sorted(range(len(pattern_originals)), key=lambda pattern_index: -pattern_hit_totals[pattern_index])
+    summary_lines = ["Hits per string:"]
+    summary_lines.extend(f"- {pattern_originals[pattern_index]}: {pattern_hit_totals[pattern_index]}"
+                         for pattern_index in ranked[:_HITS_PER_STRING_LISTED])
+    if len(ranked) > _HITS_PER_STRING_LISTED:
+        not_found_count = pattern_hit_totals.count(0)
+        summary_lines.append(f"... and {len(ranked) - _HITS_PER_STRING_LISTED} more string(s), "
+                             f"{not_found_count} of all strings not found at all.")
+    return summary_lines
+
+
+def skipped_files_log_path():
+    """Where the skipped files log goes: the end of a "text" output file, or a file next to any other format."""
+    return output_file_path if OUTPUT_FORMAT == "text" else f"{output_file_path}.skipped.txt"
 
 
-# --- Main Script Logic ---
 def main_script_logic():
     if not strings_to_search:
         print("Error: The 'strings_to_search' list is empty. Please add strings to search for.")
@@ -181,6 +2701,7 @@ def main_script_logic():
     if not compiled_patterns: 
         print("Error: No valid strings to search for after attempting to compile patterns.")
         return
+    pattern_matcher = MultiPatternMatcher(compiled_patterns)
 
     initial_skipped_file_log = [] 
     print(f"Searching for specific strings in: {target_directory}")
@@ -188,16 +2709,20 @@ def main_script_logic():
     else: print("Only searching top-level directory.")
     print(f"Output will be saved to: {output_file_path}")
     if ignore_extensions: print(f"Ignoring files with extensions: {', '.join(ignore_extensions)}")
+    if include_file_globs: print(f"Only searching files matching: {', '.join(include_file_globs)}")
+    if exclude_file_globs: print(f"Not searching files matching: {', '.join(exclude_file_globs)}")
+    if exclude_directory_globs: print(f"Not entering folders matching: {', '.join(exclude_directory_globs)}")
     print("Strings being searched for (case-insensitive, literal match):")
     for s_original, _ in compiled_patterns: print(f"- {s_original}")
     print("---------------------------------------------------")
 
-    if os.path.exists(output_file_path):
-        try:
-            os.remove(output_file_path)
-            print(f"Cleared existing output file: {output_file_path}")
-        except OSError as e:
-            print(f"Warning: Could not clear existing output file '{output_file_path}': {e}")
+    for stale_output_path in dict.fromkeys([output_file_path, skipped_files_log_path()]):
+        if os.path.exists(stale_output_path):
+            try:
+                os.remove(stale_output_path)
+                print(f"Cleared existing output file: {stale_output_path}")
+            except OSError as e:
+                print(f"Warning: Could not clear existing output file '{stale_output_path}': {e}")
     
     try:
         output_dir_main = os.path.dirname(output_file_path)
@@ -208,116 +2733,242 @@ def main_script_logic():
         print(f"CRITICAL ERROR: Could not create output directory '{os.path.dirname(output_file_path)}': {e_dir_create}. Exiting.")
         return
 
-    files_to_consider = [] 
-    try:
-        if include_subdirectories:
-            for root, _, files in os.walk(target_directory):
-                for file_name in files:
-                    if not os.path.isdir(os.path.join(root, file_name)): 
-                        files_to_consider.append(os.path.join(root, file_name))
-        else: 
-            for file_name in os.listdir(target_directory):
-                full_path = os.path.join(target_directory, file_name)
-                if os.path.isfile(full_path): 
-                    files_to_consider.append(full_path)
-    except FileNotFoundError:
-        err_msg = f"Target directory '{target_directory}' not found."
-        print(f"CRITICAL ERROR: {err_msg}")
-        initial_skipped_file_log.append({'path': target_directory, 'reason': err_msg})
-    except Exception as e: 
-        err_msg = f"Error accessing target directory '{target_directory}': {e}"
-        print(f"CRITICAL ERROR: {err_msg}")
-        initial_skipped_file_log.append({'path': target_directory, 'reason': err_msg})
-
-    if not files_to_consider:
-        if not initial_skipped_file_log: 
-             print(f"No files found in '{target_directory}'.")
-        if initial_skipped_file_log: log_skipped_files(initial_skipped_file_log, output_file_path)
+    file_walker = FileWalker(target_directory, include_subdirectories, initial_skipped_file_log)
+    if not file_walker.start():
+        log_skipped_files(initial_skipped_file_log, skipped_files_log_path())
         return
 
-    print(f"Found {len(files_to_consider)} total file items. Filtering based on ignore_extensions...")
-
-    files_to_process_with_args = []
-    for file_path in files_to_consider:
-        file_ext = os.path.splitext(file_path)[1].lower()
-        if file_ext in ignore_extensions:
-            reason = f"Ignored extension: {file_ext}"
-            initial_skipped_file_log.append({'path': file_path, 'reason': reason})
-            continue 
-        files_to_process_with_args.append((file_path, compiled_patterns))
-
-    if not files_to_process_with_args: 
-        print(f"No files to process after applying ignore list.")
-        if initial_skipped_file_log: log_skipped_files(initial_skipped_file_log, output_file_path)
-        return
+    content_index = None
+    query_trigram_sets = None
+    if CONTENT_INDEX_PATH and os.path.exists(CONTENT_INDEX_PATH):
+        query_trigram_sets = query_trigram_sets_for(pattern_matcher.originals)
+        if query_trigram_sets is None:
+            print("Note: The content index is not used, because some search string is shorter than 3 characters "
+                  "or has characters that do not fold to ASCII.")
+        else:
+            try:
+                content_index = ContentIndex(CONTENT_INDEX_PATH)
+            except (sqlite3.Error, OSError) as e_index:
+                print(f"Warning: Could not open content index '{CONTENT_INDEX_PATH}': {e_index}. Searching all files in full.")
+            else:
+                print(f"Using content index: {CONTENT_INDEX_PATH}")
 
-    print(f"Submitting {len(files_to_process_with_args)} files to worker processes...")
+    scan_state = None
+    if INCREMENTAL_STATE_PATH and content_index is not None:
+        print("Note: INCREMENTAL_STATE_PATH is not used while searching with the content index.")
+    elif INCREMENTAL_STATE_PATH and OUTPUT_MODE != "lines":
+        print(f"Note: INCREMENTAL_STATE_PATH is only used with OUTPUT_MODE \"lines\", not \"{OUTPUT_MODE}\".")
+    elif INCREMENTAL_STATE_PATH:
+        try:
+            scan_state = IncrementalScanState(INCREMENTAL_STATE_PATH, pattern_matcher.originals)
+        except (sqlite3.Error, OSError) as e_state:
+            print(f"Warning: Could not open incremental scan state '{INCREMENTAL_STATE_PATH}': {e_state}. Searching all files in full.")
+        else:
+            print(f"Using incremental scan state: {INCREMENTAL_STATE_PATH}")
+            if scan_state.pattern_set_changed:
+                print("The strings to search for changed since the last run, so every file is searched again.")
 
-    all_found_result_lines = [] 
     worker_skipped_file_log = [] 
     found_files_set = set() 
+    pattern_hit_totals = [0] * len(pattern_matcher.originals)
 
-    num_workers = max(1, os.cpu_count() - 2 if os.cpu_count() and os.cpu_count() > 2 else 1)
+    num_workers = search_worker_count()
     print(f"Using up to {num_workers} worker processes.")
 
+    try:
+        result_writer = StreamingResultWriter(output_file_path, pattern_matcher.originals,
+                                              in_file_order=WRITE_RESULTS_IN_FILE_ORDER, output_format=OUTPUT_FORMAT,
+                                              output_mode=OUTPUT_MODE, path_dictionary=OUTPUT_PATH_DICTIONARY)
+    except (IOError, OSError) as e_open_output:
+        print(f"CRITICAL ERROR: Could not open '{output_file_path}' for writing results: {e_open_output}. Exiting.")
+        return
+    print("Files are searched as they are found; results are written to the output file as each file finishes.")
+
     # REMOVED: processed_count (tqdm will handle this)
-    total_files_to_process = len(files_to_process_with_args)
+    task_planner = SearchTaskPlanner(file_walker, pattern_matcher, result_writer, found_files_set, worker_skipped_file_log,
+                                     content_index=content_index, scan_state=scan_state)
+    search_metrics = SearchMetrics(METRICS_SLOWEST_COUNT) if COLLECT_FILE_METRICS or METRICS_OUTPUT_PATH else None
+    profiler = None
+    if PROFILE_OUTPUT_PATH:
+        for stale_worker_profile_path in glob.glob(f"{glob.escape(PROFILE_OUTPUT_PATH)}.worker-*"):
+            os.remove(stale_worker_profile_path)
+        profiler = cProfile.Profile()
+        profiler.enable()
+    # The pattern matcher and the content index query are sent to each worker process once, not with every task.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, initializer=_init_search_worker,
+                                                initargs=(pattern_matcher, search_metrics is not None,
+                                                          PROFILE_OUTPUT_PATH, OUTPUT_MODE,
+                                                          query_trigram_sets if content_index is not None else None)) as executor:
+        try:
+            scheduler = TaskBatchScheduler(executor, num_workers, task_planner.plan_found_files, search_metrics)
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
-        future_to_filepath = {
-            executor.submit(process_file_worker, *args_for_worker): args_for_worker[0] 
-            for args_for_worker in files_to_process_with_args
-        }
+            # MODIFIED: Wrap the finished tasks with tqdm for a progress bar
+            # The total grows while the directory is still being listed.
+            progress_bar = tqdm(scheduler.iter_finished_tasks(), 
+                                total=0, 
+                                desc="Processing files", 
+                                unit="task",
+                                ncols=100) # Optional: set progress bar width
+            rate_shown_at = 0.0
+            # Hits counted so far in files searched as several tasks, until their last task finishes.
+            pending_file_hit_counts = {}
+            for task, worker_result, hit_counts, batch_error in progress_bar:
+                if progress_bar.total != task_planner.task_count:
+                    progress_bar.total = task_planner.task_count
+                    progress_bar.refresh()
+                if time.perf_counter() - rate_shown_at >= 0.5:
+                    rate_shown_at = time.perf_counter()
+                    progress_bar.set_postfix_str(
+                        f"{scheduler.bytes_searched / (1024 * 1024) / max(rate_shown_at - scheduler.started_at, 1e-6):.1f} MB/s")
+                sequence_number, file_path_processed, shard, _index_lookup = task
+                # REMOVED: Manual progress printing logic replaced by tqdm
+
+                records_from_worker = []
+                shard_summary = None
+                skip_reason = None
+                if worker_result is not None:
+                    if shard is None:
+                        _fp_returned, records_from_worker, skip_reason = worker_result
+                    else:
+                        _fp_returned, records_from_worker, skip_reason, shard_summary = worker_result
+                        if shard_summary and shard_summary.get('binary_reason'):
+                            task_planner.binary_files.add(file_path_processed)
+                    if skip_reason: 
+                        worker_skipped_file_log.append({'path': file_path_processed, 'reason': skip_reason})
+                else: 
+                    reason = f"Worker process CRASHED or unhandled error for {file_path_processed}: {batch_error}"
+                    # tqdm might interfere with multi-line prints during its active bar updating.
+                    # For critical errors, it's good to have them print. tqdm handles this by printing above the bar.
+                    tqdm.write(f"\nERROR: {reason}") # Use tqdm.write to print messages without breaking the bar
+                    worker_skipped_file_log.append({'path': file_path_processed, 'reason': reason})
+                    skip_reason = reason
 
-        # MODIFIED: Wrap as_completed with tqdm for a progress bar
-        for future in tqdm(concurrent.futures.as_completed(future_to_filepath), 
-                           total=total_files_to_process, 
-                           desc="Processing files", 
-                           unit="file",
-                           ncols=100): # Optional: set progress bar width
-            file_path_processed = future_to_filepath[future]
-            # REMOVED: Manual progress printing logic replaced by tqdm
+                shard_merger = None
+                if shard is None:
+                    ready_batches = [(sequence_number, records_from_worker)]
+                else:
+                    shard_merger = task_planner.shard_mergers[file_path_processed]
+                    already_failed = shard_merger.failed_shard_index is not None
+                    ready_batches = shard_merger.add(shard[0], records_from_worker, shard_summary,
+                                                     failed=skip_reason is not None)
+                    if (not already_failed and shard_merger.failed_shard_index is not None
+                            and shard_merger.failed_shard_index < shard[1] - 1):
+                        worker_skipped_file_log.append({
+                            'path': file_path_processed,
+                            'reason': f"Results after part {shard_merger.failed_shard_index + 1} of {shard[1]} were dropped "
+                                      f"because their line numbers cannot be determined."})
+                file_hit_counts = hit_counts or {}
+                file_finished = True
+                if file_path_processed in task_planner.open_task_counts:
+                    pending_hit_counts = pending_file_hit_counts.setdefault(file_path_processed, {})
+                    for pattern_index, hit_count in file_hit_counts.items():
+                        pending_hit_counts[pattern_index] = pending_hit_counts.get(pattern_index, 0) + hit_count
+                    task_planner.open_task_counts[file_path_processed] -= 1
+                    file_finished = task_planner.open_task_counts[file_path_processed] == 0
+                    if file_finished:
+                        del task_planner.open_task_counts[file_path_processed]
+                        file_hit_counts = pending_file_hit_counts.pop(file_path_processed)
+                        if shard_merger is not None:
+                            for pattern_index, hit_count in shard_merger.hit_counts.items():
+                                file_hit_counts[pattern_index] = file_hit_counts.get(pattern_index, 0) + hit_count
+                if file_finished:
+                    for pattern_index, hit_count in file_hit_counts.items():
+                        pattern_hit_totals[pattern_index] += hit_count
+                if OUTPUT_MODE != "lines":
+                    # The only records left are the merger's, of lines spanning shard edges; it counted those too.
+                    ready_batches = [(ready_sequence_number, []) for ready_sequence_number, _ready_records in ready_batches]
+                    if file_finished and file_hit_counts:
+                        ready_batches[-1] = (ready_batches[-1][0], sorted(file_hit_counts.items()))
+                elif file_path_processed in task_planner.binary_files:
+                    ready_batches = [(ready_sequence_number,
+                                      [(line_number, pattern_index, binary_hit_context(context, pattern_matcher, pattern_index))
+                                       for line_number, pattern_index, context in ready_records])
+                                     for ready_sequence_number, ready_records in ready_batches]
+                # Submitted even when empty so that in-file-order output is not held up by this task.
+                for ready_sequence_number, ready_records in ready_batches:
+                    if ready_records:
+                        found_files_set.add(file_path_processed)
+                    result_writer.submit(ready_sequence_number, file_path_processed, ready_records)
 
-            try:
-                _fp_returned, result_lines_from_worker, skip_reason = future.result()
-                if skip_reason: 
-                    worker_skipped_file_log.append({'path': file_path_processed, 'reason': skip_reason})
-                if result_lines_from_worker: 
-                    all_found_result_lines.extend(result_lines_from_worker)
-                    found_files_set.add(file_path_processed) 
-            except Exception as exc: 
-                reason = f"Worker process CRASHED or unhandled error for {file_path_processed}: {exc} \n{traceback.format_exc()}"
-                # tqdm might interfere with multi-line prints during its active bar updating.
-                # For critical errors, it's good to have them print. tqdm handles this by printing above the bar.
-                tqdm.write(f"\nERROR: {reason}") # Use tqdm.write to print messages without breaking the bar
-                worker_skipped_file_log.append({'path': file_path_processed, 'reason': reason})
+                scan_plan = task_planner.scan_plans.get(file_path_processed)
+                if scan_plan is not None:
+                    for _ready_sequence_number, ready_records in ready_batches:
+                        scan_state.add_hits(file_path_processed, ready_records)
+                    # Only completely searched files are recorded; anything else is searched in full next time.
+                    if shard_merger is None:
+                        if skip_reason is None:
+                            scan_state.record_scan(file_path_processed, scan_plan, None, None)
+                    elif shard_merger.finished and shard_merger.failed_shard_index is None:
+                        scan_state.record_scan(file_path_processed, scan_plan,
+                                               shard_merger.resume_offset, shard_merger.resume_line_count)
+            progress_bar.close()
+
+            if scan_state is not None:
+                scan_state.forget_missing_files(target_directory, task_planner.found_file_paths)
+        finally:
+            # Runs on Ctrl-C or a crash too, so everything found so far reaches the output file.
+            result_writer.close()
+            if scan_state is not None:
+                scan_state.close()
+            if content_index is not None:
+                content_index.close()
     
     # The print("\nAll worker processes finished.") might not be needed as tqdm shows 100%
     # Or you can keep it for explicit confirmation.
     print("All worker processes finished processing tasks.") 
+    if profiler is not None:
+        profiler.disable()
+        save_search_profile(profiler, PROFILE_OUTPUT_PATH)
+        print(f"Profile saved to: {PROFILE_OUTPUT_PATH} (e.g. python -m pstats \"{PROFILE_OUTPUT_PATH}\")")
+    if SCHEDULER_REPORT_UTILISATION:
+        for report_line in scheduler.utilisation_report():
+            print(report_line)
+    if search_metrics is not None:
+        for report_line in search_metrics.report_lines():
+            print(report_line)
+        if METRICS_OUTPUT_PATH:
+            try:
+                search_metrics.write_json(METRICS_OUTPUT_PATH, (scheduler.finished_at or time.perf_counter()) - scheduler.started_at)
+                print(f"Metrics saved to: {METRICS_OUTPUT_PATH}")
+            except (IOError, OSError) as e_metrics:
+                print(f"Warning: Could not save metrics to '{METRICS_OUTPUT_PATH}': {e_metrics}")
+    print(file_walker.summary())
+    if not task_planner.found_file_paths and not initial_skipped_file_log:
+        print(f"No files found in '{target_directory}'.")
+    if content_index is not None:
+        print(f"{task_planner.indexed_file_count} file(s) were searched through the content index, "
+              f"{len(task_planner.found_file_paths) - task_planner.indexed_file_count} in full (not indexed yet or replaced since).")
+    if scan_state is not None:
+        planned_actions = [scan_plan['action'] for scan_plan in task_planner.scan_plans.values()]
+        print(f"{planned_actions.count('reuse')} file(s) unchanged since the last run, "
+              f"{planned_actions.count('resume')} searched from where the last run stopped, "
+              f"{len(task_planner.found_file_paths) - planned_actions.count('reuse') - planned_actions.count('resume')} searched in full.")
+    split_files = [merger for merger in task_planner.shard_mergers.values() if merger.shard_count > 1]
+    if split_files:
+        print(f"{len(split_files)} large file(s) split into {sum(merger.shard_count for merger in split_files)} parts.")
     final_skipped_log = initial_skipped_file_log + worker_skipped_file_log
 
-    # ... (rest of the main_script_logic: writing results, final summary, logging skipped files) ...
-    if all_found_result_lines:
-        print(f"\nAggregating and writing {len(all_found_result_lines)} found lines to output file...")
-        try:
-            with open(output_file_path, 'a', encoding='utf-8') as out_f:
-                for line in all_found_result_lines:
-                    out_f.write(line + "\n")
-            print("Finished writing results.")
-        except IOError as e_write:
-            print(f"CRITICAL ERROR: Could not write results to '{output_file_path}': {e_write}")
+    if result_writer.write_error is not None:
+        print(f"CRITICAL ERROR: Could not write results to '{output_file_path}': {result_writer.write_error}")
 
     print("---------------------------------------------------")
     print("Search complete!")
-    if all_found_result_lines:
+    if result_writer.lines_written:
         print(f"Results saved to: {output_file_path}")
-        print(f"Total matching lines found: {len(all_found_result_lines)} in {len(found_files_set)} file(s).")
+        if OUTPUT_MODE == "lines":
+            print(f"Total matching lines found: {result_writer.lines_written} in {len(found_files_set)} file(s).")
+        elif OUTPUT_MODE == "count":
+            print(f"Total hits found: {sum(pattern_hit_totals)} in {len(found_files_set)} file(s).")
+        else:
+            print(f"Files with matches: {len(found_files_set)}.")
+        if OUTPUT_MODE != "files":
+            for hits_line in hits_per_string_lines(pattern_matcher.originals, pattern_hit_totals):
+                print(hits_line)
     else:
         print("No occurrences of the specified strings were found in the searched files.")
     
     if final_skipped_log:
-        log_skipped_files(final_skipped_log, output_file_path)
+        log_skipped_files(final_skipped_log, skipped_files_log_path())
 
 
 # (log_skipped_files function remains the same)
@@ -338,7 +2989,7 @@ def log_skipped_files(skipped_records, output_file_path_param):
             except Exception:
                 pass 
 
-        with open(output_file_path_param, 'a', encoding='utf-8') as out_f:
+        with open(output_file_path_param, 'a', encoding='utf-8', errors='backslashreplace') as out_f:
             out_f.write(skipped_header + "\n")
             for record in skipped_records:
                 log_entry = f"File: {record['path']} | Reason: {record['reason']}"
@@ -348,13 +2999,723 @@ def log_skipped_files(skipped_records, output_file_path_param):
         print(f"Error: Could not write skipped files log to '{output_file_path_param}': {e}")
 
 
+# --- Library API ---
+class Match:
+    """
+    One hit of a search string, as yielded by search_file() and search().
+
+    path and line_number say where it is; byte_offset is where the line starts in the file's
+    content (after decompression); pattern_index is the string's position in the search list and
+    pattern the string itself; line is the decoded line without its line ending, and span the
+    (start, end) of the hit within it. A line with several different strings gives one Match per
+    string; a string found more than once in a line is reported once, with its first span.
+    """
+
+    __slots__ = ("path", "line_number", "byte_offset", "pattern_index", "pattern", "span", "line")
+
+    def __init__(self, path, line_number, byte_offset, pattern_index, pattern, span, line):
+        self.path = path
+        self.line_number = line_number
+        self.byte_offset = byte_offset
+        self.pattern_index = pattern_index
+        self.pattern = pattern
+        self.span = span
+        self.line = line
+
+    def __repr__(self):
+        return (f"Match(path={self.path!r}, line_number={self.line_number}, byte_offset={self.byte_offset}, "
+                f"pattern_index={self.pattern_index}, pattern={self.pattern!r}, span={self.span}, line={self.line!r})")
+
+
+def compile_search_strings(search_strings):
+    """Builds the MultiPatternMatcher for a list of literal, case-insensitive search strings."""
+    return MultiPatternMatcher([(s, re.compile(re.escape(s), re.IGNORECASE)) for s in search_strings])
+
+
+def _matches_for_hit(file_path, pattern_matcher, line_number, line_text, pattern_indices, line_offset, offset_base=0):
+    """Turns one hit from iter_stream_hits into a Match per string found in the line."""
+    line = line_text.rstrip("\r\n")
+    matches = []
+    for pattern_index in pattern_indices:
+        hit = pattern_matcher.patterns[pattern_index][1].search(line)
+        matches.append(Match(file_path, line_number, offset_base + line_offset, pattern_index,
+                             pattern_matcher.originals[pattern_index], hit.span() if hit else (0, 0), line))
+    return matches
+
+
+def search_file(file_path, search_strings, max_matches=None, skipped_file_log=None):
+    """
+    Lazily searches one file, plain or compressed, and yields a Match for every hit in file order.
+
+    search_strings is a list of strings or a MultiPatternMatcher from compile_search_strings
+    (build it once when searching many files). The file is read block by block while the
+    generator is consumed, so stopping early - or max_matches - leaves the rest of it unread.
+    Binary files are handled as BINARY_FILE_HANDLING says. If the file could not be searched
+    completely, a {'path', 'reason'} record is added to skipped_file_log, if given.
+    """
+    pattern_matcher = search_strings if isinstance(search_strings, MultiPatternMatcher) else compile_search_strings(search_strings)
+    if max_matches is not None and max_matches <= 0:
+        return
+    matches_found = 0
+    file_outcome = {}
+    file_hits = iter_file_hits(file_path, pattern_matcher, file_outcome)
+    try:
+        for hit in file_hits:
+            for match in _matches_for_hit(file_path, pattern_matcher, *hit):
+                yield match
+                matches_found += 1
+                if max_matches is not None and matches_found >= max_matches:
+                    return
+    finally:
+        file_hits.close()
+        if skipped_file_log is not None and file_outcome.get('skip_reason'):
+            skipped_file_log.append({'path': file_path, 'reason': file_outcome['skip_reason']})
+
+
+def search(target, search_strings, recursive=True, max_matches=None, max_matches_per_file=None, skipped_file_log=None):
+    """
+    Lazily searches files and yields a Match for every hit, one file after the other, in the
+    calling process. Nothing is written anywhere; stop iterating whenever you have enough.
+
+    target is a file, a directory (listed like the script does, with ignore_extensions and the
+    file filters of the configuration, into subdirectories if recursive), or an iterable of file
+    paths. max_matches stops the whole search after that many hits, max_matches_per_file moves on
+    to the next file after that many hits in one file (1 gives the first hit of every file). Files
+    that were skipped or could not be searched completely are added to skipped_file_log, if given.
+    """
+    pattern_matcher = search_strings if isinstance(search_strings, MultiPatternMatcher) else compile_search_strings(search_strings)
+    if skipped_file_log is None:
+        skipped_file_log = []
+    file_walker = None
+    if isinstance(target, (str, os.PathLike)) and os.path.isdir(target):
+        file_walker = FileWalker(os.fspath(target), recursive, skipped_file_log)
+        if not file_walker.start():
+            return
+        file_paths = (file_path for file_path, _file_stat in file_walker.iter_found_files())
+    elif isinstance(target, (str, os.PathLike)):
+        file_paths = [os.fspath(target)]
+    else:
+        file_paths = target
+
+    matches_found = 0
+    try:
+        for file_path in file_paths:
+            matches_left = None if max_matches is None else max_matches - matches_found
+            if max_matches_per_file is not None:
+                matches_left = max_matches_per_file if matches_left is None else min(matches_left, max_matches_per_file)
+            for match in search_file(file_path, pattern_matcher, matches_left, skipped_file_log):
+                matches_found += 1
+                yield match
+            if max_matches is not None and matches_found >= max_matches:
+                return
+    finally:
+        if file_walker is not None:
+            file_walker.stop()
+
+
+def _decode_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("Binary results file ends in the middle of a record.")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _decode_binary_string(data, position):
+    length, position = _decode_varint(data, position)
+    if position + length > len(data):
+        raise ValueError("Binary results file ends in the middle of a record.")
+    return data[position:position + length].decode('utf-8', 'surrogateescape'), position + length
+
+
+def iter_binary_results(results_path):
+    """
+    Reads a results file written with OUTPUT_FORMAT "binary" and yields one dict per result, with
+    the same keys as "jsonl" output without a path dictionary: {"path", "line", "string",
+    "context"} for hits, {"path", "string", "count"} in "count" mode and {"path"} in "files"
+    mode. Raises ValueError if the file is not a binary results file or is cut short.
+    """
+    with open(results_path, 'rb') as results_file:
+        if os.fstat(results_file.fileno()).st_size < len(_BINARY_RESULTS_MAGIC):
+            raise ValueError(f"'{results_path}' is not a binary results file.")
+        with mmap.mmap(results_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(_BINARY_RESULTS_MAGIC)] != _BINARY_RESULTS_MAGIC:
+                raise ValueError(f"'{results_path}' is not a binary results file.")
+            position = len(_BINARY_RESULTS_MAGIC)
+            pattern_originals = []
+            paths = []
+            while position < len(data):
+                tag_position = position
+                tag = data[position:position + 1]
+                if tag == b"S":
+                    string_count, position = _decode_varint(data, position + 1)
+                    for _ in range(string_count):
+                        original, position = _decode_binary_string(data, position)
+                        pattern_originals.append(original)
+                    continue
+                path_id, position = _decode_varint(data, position + 1)
+                if tag == b"P":
+                    file_path, position = _decode_binary_string(data, position)
+                    paths.append(file_path)
+                elif tag == b"L":
+                    line_number, position = _decode_varint(data, position)
+                    pattern_index, position = _decode_varint(data, position)
+                    context, position = _decode_binary_string(data, position)
+                    yield {"path": paths[path_id], "line": line_number, "string": pattern_originals[pattern_index],
+                           "context": context}
+                elif tag == b"C":
+                    pattern_index, position = _decode_varint(data, position)
+                    hit_count, position = _decode_varint(data, position)
+                    yield {"path": paths[path_id], "string": pattern_originals[pattern_index], "count": hit_count}
+                elif tag == b"F":
+                    yield {"path": paths[path_id]}
+                else:
+                    raise ValueError(f"Unknown record type {tag!r} at byte {tag_position} of '{results_path}'.")
+
+
+# --- Follow Mode ---
+# inotify(7) constants, from <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_WATCH_MASK = _IN_MODIFY | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+_INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyWatcher:
+    """
+    Watches directories for changes to the files in them through Linux inotify, called via
+    ctypes. One watch per directory (not per file) keeps the number of watches and file
+    descriptors independent of the number of files. Raises OSError if inotify is not available.
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libc_name is None:
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, f"inotify_init1 failed: {os.strerror(error_number)}")
+        self._directory_by_watch = {}
+
+    def add_watch(self, directory_path):
+        watch_descriptor = self._libc.inotify_add_watch(self.fd, os.fsencode(directory_path), _IN_WATCH_MASK)
+        if watch_descriptor < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, f"Cannot watch '{directory_path}': {os.strerror(error_number)}")
+        self._directory_by_watch[watch_descriptor] = directory_path
+
+    def read_events(self):
+        """
+        Returns the events that are waiting as (directory_path, name, mask) tuples, with
+        directory_path None for a queue overflow (changes were lost; everything must be checked).
+        """
+        events = []
+        while True:
+            try:
+                event_data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            position = 0
+            while position + _INOTIFY_EVENT_HEADER.size <= len(event_data):
+                watch_descriptor, mask, _cookie, name_length = _INOTIFY_EVENT_HEADER.unpack_from(event_data, position)
+                position += _INOTIFY_EVENT_HEADER.size
+                name = os.fsdecode(event_data[position:position + name_length].rstrip(b"\0"))
+                position += name_length
+                if mask & _IN_Q_OVERFLOW:
+                    events.append((None, "", mask))
+                elif mask & _IN_IGNORED:
+                    self._directory_by_watch.pop(watch_descriptor, None)  # The directory is gone.
+                elif watch_descriptor in self._directory_by_watch:
+                    events.append((self._directory_by_watch[watch_descriptor], name, mask))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _FollowedFile:
+    """What follow mode knows about one file: how far it has been searched and how many lines that was."""
+
+    __slots__ = ("path", "identity", "offset", "line_count", "size_seen", "head_length", "head_hash", "skip_reason",
+                 "binary_reason")
+
+    def __init__(self, path, identity, offset, line_count):
+        self.path = path
+        self.identity = identity
+        self.offset = offset
+        self.line_count = line_count  # None until counted: files followed from their end are only counted when they grow.
+        self.size_seen = offset
+        self.head_length = 0  # How many of the file's first bytes head_hash covers, to notice a file rewritten in place.
+        self.head_hash = None
+        self.skip_reason = None
+        self.binary_reason = None  # Set when BINARY_FILE_HANDLING is "raw" and the file holds binary content.
+
+
+class LogFollower:
+    """
+    Follows the files under a directory as they grow and yields a Match for every new hit, like
+    `tail -f` for many files at once. Use it as an asynchronous iterator:
+
+        async for match in LogFollower(directory, strings).iter_matches(): ...
+
+    Changes are picked up through inotify on Linux and by checking the tree every
+    FOLLOW_POLL_INTERVAL_SECONDS elsewhere (or if inotify runs out of watches). Only complete
+    lines appended since the last read are searched, with the same matcher and block scanner as
+    the rest of the script, and at most FOLLOW_MAX_READ_BYTES per file at a time. Files are
+    tracked by device and inode, so a log that is renamed away during rotation is read to its
+    end and the new file with its name is read from the start; a file that shrinks (copytruncate)
+    or is rewritten (its first bytes change) is read again from the start. Files are only opened
+    while they are read, so any number of files can be followed with a handful of file descriptors.
+
+    Compressed files are not followed (they are rotated copies of logs); they and binary files
+    are added to skipped_file_log once.
+    """
+
+    def __init__(self, root_directory, search_strings, recursive=True, from_start=None, skipped_file_log=None):
+        self.root_directory = root_directory
+        self.recursive = recursive
+        self.from_start = FOLLOW_FROM_START if from_start is None else from_start
+        self.skipped_file_log = skipped_file_log if skipped_file_log is not None else []
+        self.pattern_matcher = (search_strings if isinstance(search_strings, MultiPatternMatcher)
+                                else compile_search_strings(search_strings))
+        self.using_inotify = False
+        self._files_by_identity = {}
+        self._identity_by_path = {}
+        self._dirty_paths = {}  # Paths to look at, in the order their changes arrived.
+        self._full_check_due = False
+        self._wakeup = None
+        self._inotify_watcher = None
+
+    def _relative_path(self, path):
+        return os.path.relpath(path, self.root_directory).replace(os.sep, "/")
+
+    def _watch_directory_tree(self, directory_path, mark_files):
+        """
+        Adds an inotify watch to a directory and (if recursive) to the folders under it that are
+        not excluded. With mark_files, the files found are marked to be read: they may have been
+        written before the watch was in place.
+        """
+        directories_to_list = [directory_path]
+        while directories_to_list:
+            directory_path = directories_to_list.pop()
+            try:
+                self._inotify_watcher.add_watch(directory_path)
+                with os.scandir(directory_path) as directory_entries:
+                    for entry in directory_entries:
+                        relative_path = self._relative_path(entry.path)
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive and not directory_is_excluded(relative_path, entry.name):
+                                directories_to_list.append(entry.path)
+                        elif mark_files and file_name_verdict(relative_path, entry.name) is None:
+                            self._dirty_paths[entry.path] = None
+            except OSError as e_watch:
+                if e_watch.errno == errno.ENOSPC:
+                    raise  # Out of inotify watches (fs.inotify.max_user_watches): fall back to polling.
+                self.skipped_file_log.append({'path': directory_path, 'reason': f"Not followed: {e_watch}"})
+
+    def _list_files(self):
+        """Returns {path: stat} of the files to follow, as FileWalker finds them."""
+        file_walker = FileWalker(self.root_directory, self.recursive, [])
+        if not file_walker.start():
+            return {}
+        present_files = {}
+        for file_path, file_stat in file_walker.iter_found_files():
+            if file_stat.st_ino == 0:
+                # On Windows, os.DirEntry.stat() reports no device or inode, unlike the os.fstat() of a read.
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue  # Gone already; noticed as missing.
+            present_files[file_path] = file_stat
+        return present_files
+
+    def _start_following_existing_files(self):
+        for file_path, file_stat in self._list_files().items():
+            identity = (file_stat.st_dev, file_stat.st_ino)
+            if self.from_start:
+                self._files_by_identity[identity] = _FollowedFile(file_path, identity, 0, 0)
+                self._dirty_paths[file_path] = None
+            else:
+                self._files_by_identity[identity] = _FollowedFile(file_path, identity, file_stat.st_size, None)
+            self._identity_by_path[file_path] = identity
+
+    def _check_all_files(self):
+        """Marks every file that is new, gone or of a different size than last seen (polling, or after lost events)."""
+        present_files = self._list_files()
+        for file_path, file_stat in present_files.items():
+            followed = self._files_by_identity.get(self._identity_by_path.get(file_path))
+            if (followed is None or followed.identity != (file_stat.st_dev, file_stat.st_ino)
+                    or followed.size_seen != file_stat.st_size):
+                self._dirty_paths[file_path] = None
+        for file_path in list(self._identity_by_path):
+            if file_path not in present_files:
+                self._dirty_paths[file_path] = None
+
+    def _start_inotify_watches(self):
+        """Sets up inotify for the whole tree; returns False (and polling is used) if that is not possible."""
+        try:
+            self._inotify_watcher = _InotifyWatcher()
+            self._watch_directory_tree(self.root_directory, mark_files=False)
+        except OSError as e_inotify:
+            if self._inotify_watcher is not None:
+                self._inotify_watcher.close()
+                self._inotify_watcher = None
+            self.skipped_file_log.append({'path': self.root_directory,
+                                          'reason': f"Checking for changes every {FOLLOW_POLL_INTERVAL_SECONDS} s: {e_inotify}"})
+            return False
+        return True
+
+    def _on_inotify_events(self):
+        for directory_path, name, mask in self._inotify_watcher.read_events():
+            if directory_path is None:
+                self._full_check_due = True  # Events were lost.
+                continue
+            path = os.path.join(directory_path, name)
+            if mask & _IN_ISDIR:
+                if (mask & (_IN_CREATE | _IN_MOVED_TO) and self.recursive
+                        and not directory_is_excluded(self._relative_path(path), name)):
+                    try:
+                        self._watch_directory_tree(path, mark_files=True)
+                    except OSError:
+                        self._full_check_due = True
+            elif name and file_name_verdict(self._relative_path(path), name) is None:
+                self._dirty_paths[path] = None
+        self._wakeup.set()
+
+    def _forget_path(self, file_path):
+        identity = self._identity_by_path.pop(file_path, None)
+        if identity is not None and identity not in self._identity_by_path.values():
+            # Kept while it may still turn up under another name (rotation); dropped at the next full check.
+            followed = self._files_by_identity.get(identity)
+            if followed is not None and followed.path == file_path:
+                followed.path = None
+
+    def _read_appended_matches(self, file_path):
+        """Searches what was appended to a file since the last read; runs in a worker thread. Returns a list of Matches."""
+        try:
+            raw_file = open(file_path, 'rb')
+        except OSError:
+            self._forget_path(file_path)  # Deleted or renamed away; a rename shows up as a new path.
+            return []
+        with raw_file:
+            file_stat = os.fstat(raw_file.fileno())
+            identity = (file_stat.st_dev, file_stat.st_ino)
+            if self._identity_by_path.get(file_path) not in (None, identity):
+                self._forget_path(file_path)  # A new file took this name; the old one is followed under its new name.
+            followed = self._files_by_identity.get(identity)
+            if followed is None:
+                followed = self._files_by_identity[identity] = _FollowedFile(file_path, identity, 0, 0)
+            followed.path = file_path
+            self._identity_by_path[file_path] = identity
+            followed.size_seen = file_stat.st_size
+            if followed.skip_reason is not None or not file_stat_is_selected(file_stat):
+                return []
+            if file_stat.st_size < followed.offset or (
+                    followed.head_length and hashlib.sha1(raw_file.read(followed.head_length)).digest() != followed.head_hash):
+                # Truncated (e.g. copytruncate rotation) or rewritten: start over.
+                followed.offset, followed.line_count, followed.head_length = 0, 0, 0
+            if file_stat.st_size == followed.offset:
+                return []
+
+            if followed.offset == 0 or followed.line_count is None:
+                raw_file.seek(0)
+                header_bytes = raw_file.read(max(16, BINARY_SNIFF_BYTES))
+                binary_reason = None
+                if BINARY_FILE_HANDLING != "text":
+                    binary_reason = sniff_binary_content(header_bytes[:BINARY_SNIFF_BYTES])
+                followed.binary_reason = None
+                if detect_compression(header_bytes[:16]) is not None:
+                    followed.skip_reason = "Compressed file; not followed"
+                elif binary_reason is not None and BINARY_FILE_HANDLING == "skip":
+                    followed.skip_reason = _binary_skip_reason(binary_reason)
+                else:
+                    followed.binary_reason = binary_reason
+                if followed.skip_reason is not None:
+                    self.skipped_file_log.append({'path': file_path, 'reason': followed.skip_reason})
+                    return []
+            if followed.line_count is None:
+                # Followed from its end: count its lines first, up to the end of its last complete line.
+                raw_file.seek(0)
+                count_summary = {}
+                for _block in _iter_shard_body_blocks(
+                        iter_stream_blocks(_ByteRangeReader(raw_file, followed.offset)), count_summary,
+                        keep_head=False, keep_tail=True):
+                    pass
+                followed.offset -= len(count_summary["tail"])
+                followed.line_count = count_summary["line_breaks"]
+
+            read_start = followed.offset
+            read_length = min(file_stat.st_size - read_start, FOLLOW_MAX_READ_BYTES)
+            raw_file.seek(read_start)
+            read_summary = {}
+            blocks = _iter_shard_body_blocks(
+                iter_stream_blocks(_ByteRangeReader(raw_file, read_length), read_block_size_for(read_length)),
+                read_summary, keep_head=False, keep_tail=True)
+            hits = list(iter_stream_hits(blocks, self.pattern_matcher, followed.line_count + 1))
+            processed_length = read_length - len(read_summary["tail"])
+            if processed_length == 0 and read_length == FOLLOW_MAX_READ_BYTES:
+                # A single line longer than FOLLOW_MAX_READ_BYTES: search this much of it as it is.
+                hits = list(iter_stream_hits([(read_summary["tail"], 0, read_length)], self.pattern_matcher,
+                                             followed.line_count + 1))
+                processed_length = read_length
+            matches = [match for hit in hits
+                       for match in _matches_for_hit(file_path, self.pattern_matcher, *hit, offset_base=read_start)]
+            if followed.binary_reason is not None:
+                for match in matches:
+                    # Cut the contexts down like the search does for binary files handled as "raw".
+                    match.line = binary_hit_context(match.line, self.pattern_matcher, match.pattern_index)
+                    hit = self.pattern_matcher.patterns[match.pattern_index][1].search(match.line)
+                    match.span = hit.span() if hit else (0, 0)
+            followed.offset = read_start + processed_length
+            followed.line_count += read_summary["line_breaks"]
+            if followed.head_length < min(followed.offset, _FILE_HEAD_HASH_BYTES):
+                followed.head_length = min(followed.offset, _FILE_HEAD_HASH_BYTES)
+                raw_file.seek(0)
+                followed.head_hash = hashlib.sha1(raw_file.read(followed.head_length)).digest()
+            if read_start + read_length < file_stat.st_size:
+                self._dirty_paths[file_path] = None  # More than FOLLOW_MAX_READ_BYTES were added: read on next round.
+            return matches
+
+    def _drop_unreferenced_files(self):
+        referenced = set(self._identity_by_path.values())
+        for identity in [identity for identity in self._files_by_identity if identity not in referenced]:
+            del self._files_by_identity[identity]
+
+    async def iter_matches(self):
+        """Yields a Match for every hit in lines added to the followed files, until the caller stops."""
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # Watch first, then list: a file written in between is read again rather than missed.
+        self.using_inotify = await loop.run_in_executor(None, self._start_inotify_watches)
+        await loop.run_in_executor(None, self._start_following_existing_files)
+        if self.using_inotify:
+            loop.add_reader(self._inotify_watcher.fd, self._on_inotify_events)
+        next_full_check = loop.time() + FOLLOW_POLL_INTERVAL_SECONDS
+        try:
+            while True:
+                if self._full_check_due:
+                    self._full_check_due = False
+                    await loop.run_in_executor(None, self._check_all_files)
+                if not self._dirty_paths:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_full_check - loop.time()))
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                    if loop.time() >= next_full_check:
+                        self._full_check_due = not self.using_inotify
+                        self._drop_unreferenced_files()
+                        next_full_check = loop.time() + FOLLOW_POLL_INTERVAL_SECONDS
+                    continue
+                file_path = next(iter(self._dirty_paths))
+                del self._dirty_paths[file_path]
+                for match in await loop.run_in_executor(None, self._read_appended_matches, file_path):
+                    yield match
+        finally:
+            if self._inotify_watcher is not None:
+                if self.using_inotify:
+                    loop.remove_reader(self._inotify_watcher.fd)
+                self._inotify_watcher.close()
+                self._inotify_watcher = None
+
+
+# --- Command Line ---
+def build_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="Search files (plain or compressed) for literal strings, case-insensitively. "
+                    "Without arguments, the configuration at the top of the script is used.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_file_options(subparser):
+        subparser.add_argument("-d", "--directory", help="Directory to search (default: target_directory).")
+        subparser.add_argument("--no-subdirectories", action="store_true", help="Only search the top-level directory.")
+        subparser.add_argument("--include", action="append", metavar="GLOB", help="Only search files matching GLOB (repeatable).")
+        subparser.add_argument("--exclude", action="append", metavar="GLOB", help="Do not search files matching GLOB (repeatable).")
+        subparser.add_argument("--exclude-dir", action="append", metavar="GLOB", help="Do not enter folders matching GLOB (repeatable).")
+
+    def add_string_options(subparser):
+        subparser.add_argument("-s", "--string", action="append", metavar="STRING", help="String to search for (repeatable).")
+        subparser.add_argument("-f", "--strings-file", metavar="FILE", help="File with one string to search for per line.")
+
+    search_parser = subparsers.add_parser(
+        "search", help="Search with all worker processes and write the results to the output file.")
+    add_file_options(search_parser)
+    add_string_options(search_parser)
+    search_parser.add_argument("-o", "--output", help="Output file (default: output_file_path).")
+    search_parser.add_argument("--index", metavar="PATH", help="Use this content index (see CONTENT_INDEX_PATH).")
+    search_parser.add_argument("--state", metavar="PATH", help="Use this incremental scan state (see INCREMENTAL_STATE_PATH).")
+    search_parser.add_argument("-j", "--workers", type=int, metavar="N", help="Use N worker processes (see WORKER_PROCESS_COUNT).")
+    search_parser.add_argument("--metrics", action="store_true",
+                               help="Measure every file and report where the time went (see COLLECT_FILE_METRICS).")
+    search_parser.add_argument("--metrics-json", metavar="PATH", help="Also save that report as JSON (see METRICS_OUTPUT_PATH).")
+    search_parser.add_argument("--profile", metavar="PATH", help="Save a cProfile of the whole search (see PROFILE_OUTPUT_PATH).")
+    search_parser.add_argument("--format", choices=["text", "jsonl", "binary"], help="Output file format (see OUTPUT_FORMAT).")
+    search_parser.add_argument("--path-dictionary", action="store_true",
+                               help="Write each path once in jsonl output (see OUTPUT_PATH_DICTIONARY).")
+    output_mode_options = search_parser.add_mutually_exclusive_group()
+    output_mode_options.add_argument("-c", "--count", action="store_const", const="count", dest="output_mode",
+                                     help="Only write the number of hits of each string per file (OUTPUT_MODE \"count\").")
+    output_mode_options.add_argument("-l", "--files-with-matches", action="store_const", const="files", dest="output_mode",
+                                     help="Only write the paths of files with a hit (OUTPUT_MODE \"files\").")
+
+    matches_parser = subparsers.add_parser(
+        "matches", help="Print hits to standard output as they are found, one file after the other, and stop early if asked.")
+    add_file_options(matches_parser)
+    add_string_options(matches_parser)
+    matches_parser.add_argument("-m", "--max-count", type=int, metavar="N", help="Stop after N hits.")
+    matches_parser.add_argument("--max-per-file", type=int, metavar="N",
+                                help="Move on to the next file after N hits in a file (1: first hit per file).")
+
+    follow_parser = subparsers.add_parser(
+        "follow", help="Keep watching the directory and print hits in lines added to its files, until Ctrl+C.")
+    add_file_options(follow_parser)
+    add_string_options(follow_parser)
+    follow_parser.add_argument("--from-start", action="store_true",
+                               help="Also search what the files already hold (see FOLLOW_FROM_START).")
+
+    build_index_parser = subparsers.add_parser("build-index", help="Build or update the content index.")
+    add_file_options(build_index_parser)
+    build_index_parser.add_argument("--index", metavar="PATH", help="Index file (default: CONTENT_INDEX_PATH).")
+    build_index_parser.add_argument("-j", "--workers", type=int, metavar="N", help="Use N worker processes (see WORKER_PROCESS_COUNT).")
+    return parser
+
+
+def apply_command_line_options(args):
+    """Overrides the configuration at the top of the script with the options given on the command line."""
+    global target_directory, include_subdirectories, include_file_globs, exclude_file_globs, exclude_directory_globs
+    global strings_to_search, output_file_path, CONTENT_INDEX_PATH, INCREMENTAL_STATE_PATH, FOLLOW_FROM_START
+    global WORKER_PROCESS_COUNT, COLLECT_FILE_METRICS, METRICS_OUTPUT_PATH, PROFILE_OUTPUT_PATH
+    global OUTPUT_FORMAT, OUTPUT_PATH_DICTIONARY, OUTPUT_MODE
+    if args.directory:
+        target_directory = args.directory
+    if args.no_subdirectories:
+        include_subdirectories = False
+    if args.include:
+        include_file_globs = args.include
+    if args.exclude:
+        exclude_file_globs = args.exclude
+    if args.exclude_dir:
+        exclude_directory_globs = args.exclude_dir
+    if getattr(args, "string", None) or getattr(args, "strings_file", None):
+        strings_to_search = list(args.string or [])
+        if args.strings_file:
+            try:
+                with open(args.strings_file, encoding='utf-8') as strings_file:
+                    strings_to_search += [line.strip() for line in strings_file if line.strip()]
+            except OSError as e_strings_file:
+                sys.exit(f"Error: Could not read strings file '{args.strings_file}': {e_strings_file}")
+    if getattr(args, "output", None):
+        output_file_path = args.output
+    if getattr(args, "index", None):
+        CONTENT_INDEX_PATH = args.index
+    if getattr(args, "state", None):
+        INCREMENTAL_STATE_PATH = args.state
+    if getattr(args, "from_start", False):
+        FOLLOW_FROM_START = True
+    if getattr(args, "workers", None):
+        WORKER_PROCESS_COUNT = args.workers
+    if getattr(args, "metrics", False):
+        COLLECT_FILE_METRICS = True
+    if getattr(args, "metrics_json", None):
+        METRICS_OUTPUT_PATH = args.metrics_json
+    if getattr(args, "profile", None):
+        PROFILE_OUTPUT_PATH = args.profile
+    if getattr(args, "format", None):
+        OUTPUT_FORMAT = args.format
+    if getattr(args, "path_dictionary", False):
+        OUTPUT_PATH_DICTIONARY = True
+    if getattr(args, "output_mode", None):
+        OUTPUT_MODE = args.output_mode
+
+
+def print_matches(max_matches=None, max_matches_per_file=None):
+    """
+    Prints the hits of search() in target_directory as tab-separated path, line number, byte
+    offset, string and line, and skipped files to standard error. Returns the exit code:
+    0 if something was found, 1 if not, 2 if there was nothing to search for.
+    """
+    if not strings_to_search:
+        print("Error: No strings to search for. Use -s/--string or -f/--strings-file.", file=sys.stderr)
+        return 2
+    skipped_file_log = []
+    matches_found = 0
+    for match in search(target_directory, strings_to_search, recursive=include_subdirectories,
+                        max_matches=max_matches, max_matches_per_file=max_matches_per_file,
+                        skipped_file_log=skipped_file_log):
+        print(f"{match.path}\t{match.line_number}\t{match.byte_offset}\t{match.pattern}\t{match.line}")
+        matches_found += 1
+    for record in skipped_file_log:
+        print(f"Skipped: {record['path']} | Reason: {record['reason']}", file=sys.stderr)
+    return 0 if matches_found else 1
+
+
+async def _print_followed_matches(log_follower):
+    reported_skips = 0
+    async for match in log_follower.iter_matches():
+        print(f"{match.path}\t{match.line_number}\t{match.byte_offset}\t{match.pattern}\t{match.line}", flush=True)
+        for record in log_follower.skipped_file_log[reported_skips:]:
+            print(f"Skipped: {record['path']} | Reason: {record['reason']}", file=sys.stderr, flush=True)
+        reported_skips = len(log_follower.skipped_file_log)
+
+
+def print_followed_matches():
+    """
+    Follows target_directory and prints the hits in new lines as they are written, in the same
+    format as print_matches, until interrupted with Ctrl+C. Returns the exit code.
+    """
+    if not strings_to_search:
+        print("Error: No strings to search for. Use -s/--string or -f/--strings-file.", file=sys.stderr)
+        return 2
+    if not os.path.isdir(target_directory):
+        print(f"Error: Directory '{target_directory}' not found.", file=sys.stderr)
+        return 2
+    log_follower = LogFollower(target_directory, strings_to_search, recursive=include_subdirectories)
+    print(f"Following '{target_directory}' for {len(strings_to_search)} string(s). Press Ctrl+C to stop.", file=sys.stderr)
+    try:
+        asyncio.run(_print_followed_matches(log_follower))
+    except KeyboardInterrupt:
+        pass
+    print(f"Stopped following; changes were picked up {'through inotify' if log_follower.using_inotify else 'by polling'}.",
+          file=sys.stderr)
+    return 0
+
+
 # This guard is crucial for multiprocessing to work correctly on some platforms (like Windows).
 if __name__ == "__main__":
+    # Without arguments (e.g. when double-clicked) the configuration above is used, the output file is
+    # opened at the end and the window waits for Enter; with arguments, the script runs unattended.
+    command_line_args = build_argument_parser().parse_args() if sys.argv[1:] else None
+    if command_line_args is not None:
+        apply_command_line_options(command_line_args)
+        if command_line_args.command == "matches":
+            sys.exit(print_matches(command_line_args.max_count, command_line_args.max_per_file))
+        if command_line_args.command == "follow":
+            sys.exit(print_followed_matches())
+
     script_start_time = datetime.datetime.now()
     print(f"Script started at: {script_start_time.strftime('%Y-%m-%d %H:%M:%S')}")
     
     try:
-        main_script_logic()
+        if command_line_args is not None and command_line_args.command == "build-index":
+            build_content_index()
+        else:
+            main_script_logic()
     except Exception as e: 
         print("---------------------------------------------------")
         print("AN UNEXPECTED CRITICAL ERROR OCCURRED IN THE SCRIPT (MAIN BLOCK):")
@@ -365,27 +3726,28 @@ if __name__ == "__main__":
         print(f"Script finished at: {script_end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"Total execution time: {script_end_time - script_start_time}")
 
-        # --- Attempt to open the output file ---
-        # Check if the output file path is defined and the file actually exists
-        if 'output_file_path' in globals() and os.path.exists(output_file_path):
-            print(f"\nAttempting to open output file: {output_file_path}")
-            try:
-                os.startfile(output_file_path) # This is Windows-specific
-            except AttributeError:
-                # This might happen if 'os.startfile' is not available (e.g., not on Windows)
-                # or if the script is run in an environment where it's restricted.
-                print(f"Info: 'os.startfile()' not available on this system or failed. Please open the file manually.")
-                # You could add a fallback for other systems if needed, e.g., using webbrowser
-                # import webbrowser
-                # try:
-                #     webbrowser.open(os.path.realpath(output_file_path))
-                # except Exception as e_wb:
-                #      print(f"Info: Could not open file with webbrowser: {e_wb}")
-            except Exception as e_startfile:
-                print(f"Error: Could not automatically open the output file '{output_file_path}': {e_startfile}")
-        elif 'output_file_path' in globals():
-            print(f"\nInfo: Output file '{output_file_path}' not found or not created. Cannot open it automatically.")
-        # --- End of attempting to open the output file ---
-
-        print("\n--- Script execution finished or was interrupted ---")
-        input("Press Enter to exit...")
+        if command_line_args is None:
+            # --- Attempt to open the output file ---
+            # Check if the output file path is defined and the file actually exists
+            if 'output_file_path' in globals() and os.path.exists(output_file_path):
+                print(f"\nAttempting to open output file: {output_file_path}")
+                try:
+                    os.startfile(output_file_path) # This is Windows-specific
+                except AttributeError:
+                    # This might happen if 'os.startfile' is not available (e.g., not on Windows)
+                    # or if the script is run in an environment where it's restricted.
+                    print(f"Info: 'os.startfile()' not available on this system or failed. Please open the file manually.")
+                    # You could add a fallback for other systems if needed, e.g., using webbrowser
+                    # import webbrowser
+                    # try:
+                    #     webbrowser.open(os.path.realpath(output_file_path))
+                    # except Exception as e_wb:
+                    #      print(f"Info: Could not open file with webbrowser: {e_wb}")
+                except Exception as e_startfile:
+                    print(f"Error: Could not automatically open the output file '{output_file_path}': {e_startfile}")
+            elif 'output_file_path' in globals():
+                print(f"\nInfo: Output file '{output_file_path}' not found or not created. Cannot open it automatically.")
+            # --- End of attempting to open the output file ---
+
+            print("\n--- Script execution finished or was interrupted ---")
+            input("Press Enter to exit...")
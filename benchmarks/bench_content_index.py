@@ -0,0 +1,142 @@
+"""
+Benchmark: query latency with the trigram content index versus a brute-force search.
+
+Writes a synthetic corpus of log files (plain and gzip) to a temporary directory, builds a
+ContentIndex over it, then runs a few queries both ways in this process (one core, no pool)
+and checks that both report exactly the same hits. Run from the repository root:
+
+    python benchmarks/bench_content_index.py
+"""
+import os
+import re
+import sys
+import gzip
+import time
+import random
+import string
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PythonStringSearch as search  # noqa: E402
+
+# --- Benchmark Configuration ---
+NUMBER_OF_FILES = 40
+LINES_PER_FILE = 20000
+GZIP_EVERY_NTH_FILE = 5
+RARE_INDICATOR_FILES = 2  # The rare indicator only appears in this many files.
+RANDOM_SEED = 1234
+QUERIES = {
+    "rare indicator": ["c2-beacon.evil-domain.example"],
+    "absent string": ["NoSuchIndicatorAnywhere"],
+    "rare + absent (2 strings)": ["c2-beacon.evil-domain.example", "NoSuchIndicatorAnywhere"],
+    "common string": ["status=500"],
+}
+PATH_WORDS = ["users", "orders", "items", "search", "login", "cart", "checkout", "profile", "health",
+              "metrics", "static", "images", "v1", "v2", "admin", "reports", "export", "session"]
+
+
+def random_hex(rng, length):
+    return "".join(rng.choice(string.hexdigits[:16]) for _ in range(length))
+
+
+def write_corpus(directory, rng):
+    file_paths = []
+    for file_number in range(NUMBER_OF_FILES):
+        lines = []
+        for i in range(LINES_PER_FILE):
+            status = 500 if rng.random() < 0.01 else 200
+            lines.append(f"2024-05-21 12:{i % 60:02d}:{i % 59:02d} INFO [worker-{i % 16}] "
+                         f"request id={random_hex(rng, 16)} "
+                         f"path=/api/{rng.choice(PATH_WORDS)}/{rng.choice(PATH_WORDS)} status={status}\n")
+        if file_number < RARE_INDICATOR_FILES:
+            lines[rng.randrange(LINES_PER_FILE)] = "2024-05-21 12:00:00 WARN outbound to C2-Beacon.Evil-Domain.example\n"
+        data = "".join(lines).encode("utf-8")
+        if file_number % GZIP_EVERY_NTH_FILE == GZIP_EVERY_NTH_FILE - 1:
+            file_path = os.path.join(directory, f"app-{file_number}.log.gz")
+            with gzip.open(file_path, "wb") as out_file:
+                out_file.write(data)
+        else:
+            file_path = os.path.join(directory, f"app-{file_number}.log")
+            with open(file_path, "wb") as out_file:
+                out_file.write(data)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def build_index(index_path, file_paths):
+    content_index = search.ContentIndex(index_path)
+    for file_path in file_paths:
+        build_plan = content_index.plan_build(file_path)
+        _, blocks, indexed_offset, line_count, error = search.build_index_worker(
+            file_path, build_plan["start_offset"], build_plan["stat"].st_size, build_plan["line_count"],
+            search.CONTENT_INDEX_BLOCK_SIZE_BYTES)
+        if error:
+            raise RuntimeError(error)
+        content_index.record_build(file_path, build_plan, blocks, indexed_offset, line_count)
+    return content_index
+
+
+def make_matcher(strings):
+    return search.MultiPatternMatcher([(s, re.compile(re.escape(s), re.IGNORECASE)) for s in strings])
+
+
+def query_brute_force(file_paths, matcher):
+    hits = []
+    for file_path in file_paths:
+        _, records, _ = search.process_file_worker(file_path, matcher)
+        hits.extend((file_path, line_number, pattern_index) for line_number, pattern_index, _ in records)
+    return hits
+
+
+def query_indexed(file_paths, matcher, content_index, index_path):
+    trigram_sets = search.query_trigram_sets_for(matcher.originals)
+    hits = []
+    for file_path in file_paths:
+        unindexed_start, lines_before_unindexed, file_size = content_index.plan_search(file_path)
+        for window_start, window_end in search.plan_index_windows(file_size, unindexed_start):
+            index_lookup = (index_path, window_start, window_end, unindexed_start, (lines_before_unindexed or 0) + 1)
+            _, records, _ = search.process_indexed_file_worker(file_path, matcher, trigram_sets, index_lookup)
+            hits.extend((file_path, line_number, pattern_index) for line_number, pattern_index, _ in records)
+    return hits
+
+
+def main():
+    rng = random.Random(RANDOM_SEED)
+    corpus_directory = tempfile.mkdtemp(prefix="pss_index_bench_")
+    try:
+        file_paths = write_corpus(corpus_directory, rng)
+        corpus_mb = sum(os.path.getsize(path) for path in file_paths) / (1024 * 1024)
+        index_path = os.path.join(corpus_directory, "content_index.sqlite")
+
+        build_start = time.perf_counter()
+        build_index(index_path, file_paths).close()
+        build_seconds = time.perf_counter() - build_start
+        index_mb = os.path.getsize(index_path) / (1024 * 1024)
+        content_index = search.ContentIndex(index_path)
+        print(f"Corpus: {len(file_paths)} files, {corpus_mb:.1f} MB on disk. "
+              f"Index build: {build_seconds:.2f} s, index size {index_mb:.2f} MB.\n")
+
+        print(f"{'query':<28} | {'hits':>5} | {'brute force s':>13} | {'indexed s':>9} | {'speedup':>8}")
+        print("-" * 76)
+        for query_name, strings in QUERIES.items():
+            matcher = make_matcher(strings)
+            brute_start = time.perf_counter()
+            brute_hits = query_brute_force(file_paths, matcher)
+            brute_seconds = time.perf_counter() - brute_start
+            indexed_start = time.perf_counter()
+            indexed_hits = query_indexed(file_paths, matcher, content_index, index_path)
+            indexed_seconds = time.perf_counter() - indexed_start
+            if sorted(brute_hits) != sorted(indexed_hits):
+                print(f"MISMATCH for {query_name}: {len(brute_hits)} vs {len(indexed_hits)} hits")
+                sys.exit(1)
+            print(f"{query_name:<28} | {len(brute_hits):>5} | {brute_seconds:>13.3f} | {indexed_seconds:>9.3f} | "
+                  f"{brute_seconds / indexed_seconds:>7.1f}x")
+        content_index.close()
+        search._close_worker_content_index_connections()
+    finally:
+        shutil.rmtree(corpus_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: line throughput of the multi-pattern matcher as the number of search strings grows.
+
+Compares the original approach (one re.search per pattern per line) against
+MultiPatternMatcher on the same synthetic log lines, and checks that both report
+exactly the same hits. Run from the repository root:
+
+    python benchmarks/bench_multi_pattern.py
+"""
+import os
+import re
+import sys
+import time
+import random
+import string
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from PythonStringSearch import MultiPatternMatcher  # noqa: E402
+
+# --- Benchmark Configuration ---
+PATTERN_COUNTS = [1, 5, 50, 500, 5000]
+NUMBER_OF_LINES = 20000
+HIT_RATE = 0.01  # Fraction of lines that contain one of the search strings.
+# The per-pattern loop gets slow quickly; above this many patterns it is timed on a
+# sample of the patterns and the result is scaled up.
+LEGACY_MAX_TIMED_PATTERNS = 200
+RANDOM_SEED = 1234
+
+
+def random_token(rng, length):
+    return "".join(rng.choice(string.ascii_letters + string.digits + ".-_") for _ in range(length))
+
+
+def make_indicators(rng, count):
+    """Generates indicator-like strings: hostnames, error codes and event names."""
+    indicators = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            indicators.append(f"{random_token(rng, 8).lower()}.{random_token(rng, 5).lower()}.com")
+        elif kind == 1:
+            indicators.append(f"ERROR_CODE_{random_token(rng, 6).upper()}")
+        else:
+            indicators.append(f"{random_token(rng, 10)}Event")
+    return indicators
+
+
+def make_lines(rng, indicators):
+    lines = []
+    for i in range(NUMBER_OF_LINES):
+        line = (f"2024-05-21 12:{i % 60:02d}:{i % 59:02d} INFO [worker-{i % 16}] "
+                f"request id={random_token(rng, 12)} path=/api/{random_token(rng, 8)} status=200")
+        if rng.random() < HIT_RATE:
+            line += " " + rng.choice(indicators).swapcase()
+        lines.append(line + "\n")
+    return lines
+
+
+def time_legacy(lines, compiled_patterns):
+    timed_patterns = compiled_patterns[:LEGACY_MAX_TIMED_PATTERNS]
+    hits = []
+    start = time.perf_counter()
+    for line_number, line in enumerate(lines, 1):
+        for pattern_index, (_, compiled_pattern) in enumerate(timed_patterns):
+            if compiled_pattern.search(line):
+                hits.append((line_number, pattern_index))
+    elapsed = time.perf_counter() - start
+    return elapsed * len(compiled_patterns) / len(timed_patterns), hits
+
+
+def time_matcher(lines, matcher):
+    hits = []
+    start = time.perf_counter()
+    for line_number, line in enumerate(lines, 1):
+        for pattern_index in matcher.match_line(line):
+            hits.append((line_number, pattern_index))
+    return time.perf_counter() - start, hits
+
+
+def main():
+    rng = random.Random(RANDOM_SEED)
+    all_indicators = make_indicators(rng, max(PATTERN_COUNTS))
+    total_mb = None
+
+    print(f"{'patterns':>8} | {'build s':>8} | {'legacy lines/s':>15} | {'matcher lines/s':>15} | "
+          f"{'matcher MB/s':>12} | {'speedup':>8}")
+    print("-" * 82)
+    for pattern_count in PATTERN_COUNTS:
+        indicators = all_indicators[:pattern_count]
+        lines = make_lines(rng, indicators)
+        total_mb = sum(len(line) for line in lines) / (1024 * 1024)
+        compiled_patterns = [(s, re.compile(re.escape(s), re.IGNORECASE)) for s in indicators]
+
+        build_start = time.perf_counter()
+        matcher = MultiPatternMatcher(compiled_patterns)
+        build_seconds = time.perf_counter() - build_start
+
+        legacy_seconds, legacy_hits = time_legacy(lines, compiled_patterns)
+        matcher_seconds, matcher_hits = time_matcher(lines, matcher)
+        if pattern_count <= LEGACY_MAX_TIMED_PATTERNS and legacy_hits != matcher_hits:
+            print(f"MISMATCH at {pattern_count} patterns: {len(legacy_hits)} vs {len(matcher_hits)} hits")
+            sys.exit(1)
+
+        print(f"{pattern_count:>8} | {build_seconds:>8.3f} | {len(lines) / legacy_seconds:>15,.0f} | "
+              f"{len(lines) / matcher_seconds:>15,.0f} | {total_mb / matcher_seconds:>12.2f} | "
+              f"{legacy_seconds / matcher_seconds:>7.1f}x")
+
+    print(f"\n{NUMBER_OF_LINES} lines (~{total_mb:.1f} MB) per row, {HIT_RATE:.0%} of lines contain a hit.")
+    print(f"Legacy timings above {LEGACY_MAX_TIMED_PATTERNS} patterns are extrapolated from a sample.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Benchmark: throughput of the whole search pipeline on a synthetic log tree.
+
+Writes a corpus with benchmarks/synthetic_corpus.py (or uses an existing one), then:
+
+  * times each stage of the pipeline on its own, in this process: listing the tree, reading
+    plain files, decompressing gzip files, decoding (the whole content as UTF-8, for reference:
+    the scanner only decodes lines with a candidate hit), matching (block scanning with the
+    multi-pattern matcher) and writing the results;
+  * runs the full search (main_script_logic, with its process pool) for every combination of
+    pattern count and worker count, each in a fresh process so that peak memory is its own, and
+    checks that it found exactly the planted hits.
+
+It prints tables and writes everything, with the corpus settings and the machine it ran on, to
+a JSON file so that runs before and after a change can be compared. Run from the repository root:
+
+    python benchmarks/bench_search_pipeline.py --files 300 --patterns 1,100,1000 --workers 1,2,4 -o results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+import contextlib
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, ".."))
+sys.path.insert(0, BENCHMARK_DIRECTORY)
+import PythonStringSearch as search  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows: peak memory is reported as null.
+
+# --- Benchmark Configuration ---
+PATTERN_COUNTS = [1, 10, 100, 1000]
+WORKER_COUNTS = [1, 2, 4]
+DEFAULT_OUTPUT_PATH = "bench_search_pipeline.json"
+
+
+def peak_rss_mb(who):
+    """Peak resident memory of this process or (who="children") of its largest finished child process, in MB."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def make_matcher(strings):
+    return search.compile_search_strings(strings)
+
+
+def expected_hits(manifest, pattern_count):
+    return sum(manifest["planted_hits"][:pattern_count])
+
+
+def time_stages(manifest, search_strings, pattern_counts, scratch_directory):
+    """Times each pipeline stage over the whole corpus in this process. Returns one entry per pattern count."""
+    stage_seconds = {"walk": 0.0, "read": 0.0, "decompress": 0.0, "decode": 0.0}
+    match_seconds = {count: 0.0 for count in pattern_counts}
+    records_by_count = {count: [] for count in pattern_counts}
+    matchers = {count: make_matcher(search_strings[:count]) for count in pattern_counts}
+
+    walk_start = time.perf_counter()
+    file_walker = search.FileWalker(manifest["directory"], True, [])
+    file_walker.start()
+    file_paths = [file_path for file_path, _file_stat in file_walker.iter_found_files()]
+    stage_seconds["walk"] = time.perf_counter() - walk_start
+
+    for file_path in file_paths:
+        read_start = time.perf_counter()
+        with open(file_path, "rb") as raw_file:
+            compression = search.detect_compression(raw_file.read(16))
+            raw_file.seek(0)
+            content_stream = search.open_decompressed_stream(raw_file, compression)
+            regions = [bytes(data[start:end]) for data, start, end in search.iter_stream_blocks(content_stream)]
+        stage_seconds["decompress" if compression else "read"] += time.perf_counter() - read_start
+
+        decode_start = time.perf_counter()
+        for region in regions:
+            region.decode("utf-8", errors="ignore")
+        stage_seconds["decode"] += time.perf_counter() - decode_start
+
+        for count, matcher in matchers.items():
+            match_start = time.perf_counter()
+            records = [(line_number, pattern_index, line_text.strip())
+                       for line_number, line_text, pattern_indices, _ in
+                       search.iter_stream_hits([(region, 0, len(region)) for region in regions], matcher)
+                       for pattern_index in pattern_indices]
+            match_seconds[count] += time.perf_counter() - match_start
+            records_by_count[count].append((file_path, records))
+
+    stages = []
+    for count in pattern_counts:
+        output_path = os.path.join(scratch_directory, f"stage_output_{count}.txt")
+        write_start = time.perf_counter()
+        result_writer = search.StreamingResultWriter(output_path, matchers[count].originals)
+        for sequence_number, (file_path, records) in enumerate(records_by_count[count]):
+            result_writer.submit(sequence_number, file_path, records)
+        result_writer.close()
+        write_seconds = time.perf_counter() - write_start
+        os.remove(output_path)
+        hits = sum(len(records) for _, records in records_by_count[count])
+        stages.append({
+            "patterns": count,
+            "hits": hits,
+            "expected_hits": expected_hits(manifest, count),
+            "seconds": {**{name: round(seconds, 4) for name, seconds in stage_seconds.items()},
+                        "match": round(match_seconds[count], 4), "write": round(write_seconds, 4)},
+        })
+    return stages
+
+
+def run_search_once(run_settings):
+    """Runs main_script_logic with the given settings (in a fresh process) and returns its measurements."""
+    search.target_directory = run_settings["directory"]
+    search.include_subdirectories = True
+    search.output_file_path = run_settings["output_path"]
+    search.strings_to_search = run_settings["search_strings"]
+    search.WORKER_PROCESS_COUNT = run_settings["workers"]
+    search.INCREMENTAL_STATE_PATH = None
+    search.CONTENT_INDEX_PATH = None
+    search.OUTPUT_FORMAT = "text"
+    search.OUTPUT_MODE = "lines"
+    search.SCHEDULER_REPORT_UTILISATION = False
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        run_start = time.perf_counter()
+        search.main_script_logic()
+        seconds = time.perf_counter() - run_start
+    hits = 0
+    with open(run_settings["output_path"], encoding="utf-8") as output_file:
+        for line in output_file:
+            if line.startswith("[") and "] File: " in line and " | Found String: " in line:
+                hits += 1
+    os.remove(run_settings["output_path"])
+    return {"seconds": seconds, "hits": hits, "peak_rss_mb": peak_rss_mb("self"),
+            "peak_worker_rss_mb": peak_rss_mb("children")}
+
+
+def time_full_searches(manifest, search_strings, pattern_counts, worker_counts, scratch_directory):
+    runs = []
+    megabytes = manifest["disk_bytes"] / (1024 * 1024)
+    uncompressed_megabytes = manifest["uncompressed_bytes"] / (1024 * 1024)
+    for count in pattern_counts:
+        for workers in worker_counts:
+            run_settings = {"directory": manifest["directory"], "search_strings": search_strings[:count],
+                            "workers": workers, "output_path": os.path.join(scratch_directory, "search_output.txt")}
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--single-run", json.dumps(run_settings)],
+                                       capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"Search run failed ({count} patterns, {workers} workers):\n{completed.stderr}")
+            measured = json.loads(completed.stdout.strip().splitlines()[-1])
+            seconds = measured["seconds"]
+            runs.append({
+                "patterns": count,
+                "workers": workers,
+                "seconds": round(seconds, 4),
+                "mb_per_s": round(megabytes / seconds, 2),
+                "uncompressed_mb_per_s": round(uncompressed_megabytes / seconds, 2),
+                "lines_per_s": round(manifest["lines"] / seconds),
+                "files_per_s": round(manifest["files"] / seconds, 1),
+                "peak_rss_mb": measured["peak_rss_mb"],
+                "peak_worker_rss_mb": measured["peak_worker_rss_mb"],
+                "hits": measured["hits"],
+                "expected_hits": expected_hits(manifest, count),
+            })
+    return runs
+
+
+def print_tables(manifest, stages, runs):
+    print(f"Corpus: {manifest['files']} files ({manifest['gzip_files']} gzip), "
+          f"{manifest['disk_bytes'] / (1024 * 1024):.1f} MB on disk, "
+          f"{manifest['uncompressed_bytes'] / (1024 * 1024):.1f} MB uncompressed, {manifest['lines']:,} lines.\n")
+    stage_names = ["walk", "read", "decompress", "decode", "match", "write"]
+    print("Stages, one core (seconds; decode is a full-text reference, not part of the pipeline):")
+    print(f"{'patterns':>8} | " + " | ".join(f"{name:>10}" for name in stage_names) + f" | {'hits':>6}")
+    print("-" * (11 + 13 * len(stage_names) + 9))
+    for stage in stages:
+        print(f"{stage['patterns']:>8} | " + " | ".join(f"{stage['seconds'][name]:>10.3f}" for name in stage_names)
+              + f" | {stage['hits']:>6}")
+    if not runs:
+        return
+    print("\nFull search:")
+    print(f"{'patterns':>8} | {'workers':>7} | {'seconds':>8} | {'MB/s':>8} | {'lines/s':>11} | {'files/s':>8} | "
+          f"{'peak MB':>8} | {'worker MB':>9} | {'hits':>6}")
+    print("-" * 102)
+    for run in runs:
+        print(f"{run['patterns']:>8} | {run['workers']:>7} | {run['seconds']:>8.2f} | {run['mb_per_s']:>8.1f} | "
+              f"{run['lines_per_s']:>11,} | {run['files_per_s']:>8.1f} | {run['peak_rss_mb'] or 0:>8.1f} | "
+              f"{run['peak_worker_rss_mb'] or 0:>9.1f} | {run['hits']:>6}")
+
+
+def parse_counts(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search pipeline on a synthetic log tree.")
+    synthetic_corpus.add_corpus_arguments(parser)
+    parser.add_argument("--corpus", metavar="DIR",
+                        help="Write the corpus here and keep it (reused if its manifest.json matches the settings).")
+    parser.add_argument("--patterns", type=parse_counts, default=PATTERN_COUNTS, help="Comma-separated pattern counts.")
+    parser.add_argument("--workers", type=parse_counts, default=WORKER_COUNTS, help="Comma-separated worker counts.")
+    parser.add_argument("--stages-only", action="store_true", help="Only time the stages, not the full search.")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_PATH, help="JSON file for the results.")
+    parser.add_argument("--single-run", metavar="JSON", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_run:
+        print(json.dumps(run_search_once(json.loads(args.single_run))))
+        return
+
+    search_strings = synthetic_corpus.make_search_strings(max(args.patterns + [synthetic_corpus.PLANTED_STRING_COUNT]),
+                                                          args.seed)
+    planted_strings = search_strings[:synthetic_corpus.PLANTED_STRING_COUNT]
+    scratch_directory = tempfile.mkdtemp(prefix="pss_pipeline_bench_")
+    corpus_directory = args.corpus or os.path.join(scratch_directory, "corpus")
+    try:
+        manifest_path = os.path.join(corpus_directory, "manifest.json")
+        manifest = None
+        if args.corpus and os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+            manifest["directory"] = os.path.join(corpus_directory, "logs")
+            if manifest.get("settings") != synthetic_corpus.corpus_settings_from_arguments(args, planted_strings):
+                sys.exit(f"Error: The corpus in '{corpus_directory}' was written with other settings; "
+                         f"use another directory or delete it.")
+        if manifest is None:
+            generate_start = time.perf_counter()
+            # The manifest lists the search strings, so it is kept out of the tree that is searched.
+            manifest = synthetic_corpus.generate_corpus_from_arguments(os.path.join(corpus_directory, "logs"), args,
+                                                                        planted_strings)
+            print(f"Wrote the corpus in {time.perf_counter() - generate_start:.1f} s.")
+            with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+                json.dump(manifest, manifest_file, indent=2)
+
+        stages = time_stages(manifest, search_strings, args.patterns, scratch_directory)
+        runs = [] if args.stages_only else time_full_searches(manifest, search_strings, args.patterns, args.workers,
+                                                              scratch_directory)
+        print_tables(manifest, stages, runs)
+
+        mismatches = [entry for entry in stages + runs if entry["hits"] != entry["expected_hits"]]
+        results = {
+            "benchmark": "search_pipeline",
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": {key: value for key, value in manifest.items() if key != "directory"},
+            "stages": stages,
+            "runs": runs,
+        }
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"\nResults saved to: {args.output}")
+        if mismatches:
+            print(f"MISMATCH: {len(mismatches)} measurement(s) did not find exactly the planted hits.")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
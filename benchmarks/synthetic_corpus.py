@@ -0,0 +1,186 @@
+"""
+Synthetic log trees for the benchmarks.
+
+Writes a reproducible directory tree of log-like files: plain and gzip, in several text
+encodings, with sizes spread between a minimum and a maximum, and with search strings planted
+in a given share of the lines. The manifest it returns records how many lines hold each
+planted string, so a benchmark can check that a search found exactly those. Can also be run
+on its own to leave a corpus on disk:
+
+    python benchmarks/synthetic_corpus.py /tmp/corpus --files 500 --gzip-ratio 0.3
+"""
+import os
+import sys
+import gzip
+import json
+import math
+import random
+import string
+import argparse
+
+# --- Corpus Defaults ---
+NUMBER_OF_FILES = 200
+MIN_FILE_SIZE_BYTES = 16 * 1024
+MAX_FILE_SIZE_BYTES = 4 * 1024 * 1024
+GZIP_RATIO = 0.25  # Share of the files written gzip-compressed.
+# Encodings the files are written in, picked at random per file. "latin-1" and "cp1252" files hold
+# bytes that are not valid UTF-8, which the search has to skip over.
+ENCODINGS = ["utf-8"]
+HIT_DENSITY = 0.0005  # Share of the lines that hold one of the planted strings.
+PLANTED_STRING_COUNT = 10  # The first this many search strings are planted; the rest never occur.
+FILES_PER_DIRECTORY = 50
+RANDOM_SEED = 1234
+# Distinct filler lines the files are built from; keeps generating hundreds of MB fast.
+_FILLER_LINE_COUNT = 4096
+PATH_WORDS = ["users", "orders", "items", "search", "login", "cart", "checkout", "profile", "health",
+              "metrics", "static", "images", "v1", "v2", "admin", "reports", "export", "session"]
+# Non-ASCII text that ends up in some lines, so the encodings differ in more than their name.
+_ACCENTED_WORDS = ["café", "naïve", "Zürich", "São Paulo", "Ærøskøbing", "façade"]
+
+
+def random_token(rng, length):
+    return "".join(rng.choice(string.ascii_letters + string.digits + ".-_") for _ in range(length))
+
+
+def make_search_strings(count, seed=RANDOM_SEED):
+    """Generates indicator-like search strings: hostnames, error codes and event names."""
+    rng = random.Random(seed)
+    search_strings = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            search_strings.append(f"{random_token(rng, 8).lower()}.{random_token(rng, 5).lower()}.com")
+        elif kind == 1:
+            search_strings.append(f"ERROR_CODE_{random_token(rng, 6).upper()}")
+        else:
+            search_strings.append(f"{random_token(rng, 10)}Event")
+    return search_strings
+
+
+def _make_filler_lines(rng):
+    lines = []
+    for i in range(_FILLER_LINE_COUNT):
+        line = (f"2024-05-21 12:{i % 60:02d}:{i % 59:02d} INFO [worker-{i % 16}] request id={random_token(rng, 16)} "
+                f"path=/api/{rng.choice(PATH_WORDS)}/{rng.choice(PATH_WORDS)} status={rng.choice([200, 200, 200, 404, 500])}")
+        if i % 7 == 0:
+            line += f" user_city={rng.choice(_ACCENTED_WORDS)}"
+        lines.append(line)
+    return lines
+
+
+def _file_size_for(rng, min_size, max_size):
+    """Sizes are spread log-uniformly, so there are many small files and a few big ones, as in real log trees."""
+    if max_size <= min_size:
+        return min_size
+    return int(math.exp(rng.uniform(math.log(max(1, min_size)), math.log(max_size))))
+
+
+def generate_corpus(directory, file_count=NUMBER_OF_FILES, min_size=MIN_FILE_SIZE_BYTES, max_size=MAX_FILE_SIZE_BYTES,
+                    gzip_ratio=GZIP_RATIO, encodings=None, hit_density=HIT_DENSITY, search_strings=None,
+                    files_per_directory=FILES_PER_DIRECTORY, seed=RANDOM_SEED):
+    """
+    Writes the corpus into directory and returns its manifest: the settings it was written with,
+    the number of files, lines, bytes on disk and uncompressed, and planted_hits, the number of
+    lines holding each planted string (in the order of search_strings).
+    """
+    rng = random.Random(seed)
+    encodings = encodings or ENCODINGS
+    search_strings = search_strings or make_search_strings(PLANTED_STRING_COUNT, seed)
+    settings = {"files": file_count, "min_file_size_bytes": min_size, "max_file_size_bytes": max_size,
+                "gzip_ratio": gzip_ratio, "encodings": list(encodings), "hit_density": hit_density,
+                "search_strings": list(search_strings), "files_per_directory": files_per_directory, "seed": seed}
+    filler_lines = _make_filler_lines(rng)
+    planted_hits = [0] * len(search_strings)
+    total_lines = disk_bytes = uncompressed_bytes = gzip_files = 0
+    files_by_encoding = {encoding: 0 for encoding in encodings}
+
+    for file_number in range(file_count):
+        subdirectory = os.path.join(directory, f"host-{file_number // files_per_directory:03d}")
+        os.makedirs(subdirectory, exist_ok=True)
+        encoding = rng.choice(encodings)
+        target_size = _file_size_for(rng, min_size, max_size)
+        lines = []
+        size_so_far = 0
+        while size_so_far < target_size:
+            if rng.random() < hit_density:
+                string_index = rng.randrange(len(search_strings))
+                line = f"2024-05-21 12:00:00 WARN [worker-3] outbound to {search_strings[string_index].swapcase()} blocked"
+                planted_hits[string_index] += 1
+            else:
+                line = rng.choice(filler_lines)
+            lines.append(line)
+            size_so_far += len(line) + 1
+        data = ("\n".join(lines) + "\n").encode(encoding, errors="replace")
+        total_lines += len(lines)
+        uncompressed_bytes += len(data)
+        files_by_encoding[encoding] += 1
+
+        if rng.random() < gzip_ratio:
+            file_path = os.path.join(subdirectory, f"app-{file_number}.log.gz")
+            with gzip.open(file_path, "wb", compresslevel=6) as out_file:
+                out_file.write(data)
+            gzip_files += 1
+        else:
+            file_path = os.path.join(subdirectory, f"app-{file_number}.log")
+            with open(file_path, "wb") as out_file:
+                out_file.write(data)
+        disk_bytes += os.path.getsize(file_path)
+
+    return {
+        "directory": directory,
+        "settings": settings,
+        "files": file_count,
+        "gzip_files": gzip_files,
+        "files_by_encoding": files_by_encoding,
+        "lines": total_lines,
+        "disk_bytes": disk_bytes,
+        "uncompressed_bytes": uncompressed_bytes,
+        "planted_hits": planted_hits,
+    }
+
+
+def add_corpus_arguments(parser):
+    """Adds the corpus settings as command line options (shared with the benchmarks)."""
+    parser.add_argument("--files", type=int, default=NUMBER_OF_FILES, help="Number of files.")
+    parser.add_argument("--min-size-kb", type=int, default=MIN_FILE_SIZE_BYTES // 1024, help="Smallest file size (KB).")
+    parser.add_argument("--max-size-kb", type=int, default=MAX_FILE_SIZE_BYTES // 1024, help="Largest file size (KB).")
+    parser.add_argument("--gzip-ratio", type=float, default=GZIP_RATIO, help="Share of gzip-compressed files.")
+    parser.add_argument("--encodings", default=",".join(ENCODINGS),
+                        help="Comma-separated encodings picked per file, e.g. utf-8,latin-1,cp1252.")
+    parser.add_argument("--hit-density", type=float, default=HIT_DENSITY, help="Share of lines holding a planted string.")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED, help="Random seed; the same seed gives the same corpus.")
+
+
+def _corpus_keyword_arguments(args, search_strings):
+    return {"file_count": args.files, "min_size": args.min_size_kb * 1024, "max_size": args.max_size_kb * 1024,
+            "gzip_ratio": args.gzip_ratio,
+            "encodings": [encoding.strip() for encoding in args.encodings.split(",") if encoding.strip()],
+            "hit_density": args.hit_density, "search_strings": search_strings, "seed": args.seed}
+
+
+def generate_corpus_from_arguments(directory, args, search_strings=None):
+    return generate_corpus(directory, **_corpus_keyword_arguments(args, search_strings))
+
+
+def corpus_settings_from_arguments(args, search_strings=None):
+    """The settings a manifest would record for these options, to tell whether an existing corpus can be reused."""
+    keyword_arguments = _corpus_keyword_arguments(args, search_strings)
+    return {"files": keyword_arguments["file_count"], "min_file_size_bytes": keyword_arguments["min_size"],
+            "max_file_size_bytes": keyword_arguments["max_size"], "gzip_ratio": keyword_arguments["gzip_ratio"],
+            "encodings": keyword_arguments["encodings"], "hit_density": keyword_arguments["hit_density"],
+            "search_strings": list(search_strings or make_search_strings(PLANTED_STRING_COUNT, args.seed)),
+            "files_per_directory": FILES_PER_DIRECTORY, "seed": args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic log tree for benchmarking.")
+    parser.add_argument("directory", help="Directory to write the corpus into (created if needed).")
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    manifest = generate_corpus_from_arguments(args.directory, args)
+    json.dump(manifest, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Checks the search pipeline against plain, single-pass reference searches. Run from the
+repository root:
+
+    python -m pytest -q
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PythonStringSearch as search  # noqa: E402
+
+SEARCH_STRINGS = ["needle", "Error_Code"]
+
+
+def make_matcher(strings=SEARCH_STRINGS):
+    return search.MultiPatternMatcher([(s, re.compile(re.escape(s), re.IGNORECASE)) for s in strings])
+
+
+def reference_records(data, strings=SEARCH_STRINGS):
+    """(line_number, pattern_index, context) of every hit, counting '\\r\\n', '\\r' and '\\n' as text mode does."""
+    records = []
+    for line_number, line in enumerate(re.split(r"\r\n|\r|\n", data.decode("utf-8", errors="ignore")), 1):
+        for pattern_index, string in enumerate(strings):
+            if string.lower() in line.lower():
+                records.append((line_number, pattern_index, line.strip()))
+    return records
+
+
+def random_log_bytes(rng, line_count):
+    words = ["alpha", "beta", "needle", "ERROR_CODE", "x" * 90, "", "gamma delta"]
+    parts = []
+    for _ in range(line_count):
+        parts.append(" ".join(rng.choice(words) for _ in range(rng.randrange(0, 4))))
+        parts.append(rng.choice(["\n", "\r\n", "\r", "\n", "\n"]))
+    return "".join(parts).encode("utf-8")
+
+
+def read_jsonl_hits(results_path):
+    with open(results_path, encoding="utf-8") as results_file:
+        return sorted((row["path"], row["line"], row["string"], row["context"])
+                      for row in map(json.loads, results_file) if "line" in row)
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    """Tiny read blocks and shards, so that lines and hits straddle every kind of boundary."""
+    monkeypatch.setattr(search, "SCAN_BLOCK_SIZE_BYTES", 16)
+    monkeypatch.setattr(search, "MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES", 1)
+    monkeypatch.setattr(search, "PLAIN_TEXT_SHARD_SIZE_BYTES", 97)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_shards_and_blocks_give_single_pass_line_numbers(tmp_path, small_blocks, monkeypatch, use_mmap, seed):
+    monkeypatch.setattr(search, "USE_MMAP_FOR_PLAIN_FILES", use_mmap)
+    rng = random.Random(seed)
+    data = random_log_bytes(rng, 400)
+    if seed % 2:
+        data += b"unterminated needle"
+    file_path = str(tmp_path / "app.log")
+    with open(file_path, "wb") as out_file:
+        out_file.write(data)
+    matcher = make_matcher()
+    expected = reference_records(data)
+
+    _, records, skip_reason = search.process_file_worker(file_path, matcher)
+    assert skip_reason is None
+    assert sorted(records) == expected
+
+    compression, shard_ranges = search.plan_file_shards(file_path, len(data))
+    assert compression is None and len(shard_ranges) > 2
+    merger = search.ShardResultMerger(file_path, len(shard_ranges), 0, matcher, end_offset=len(data))
+    shard_results = [(shard_index, search.process_shard_worker(file_path, matcher,
+                                                               (shard_index, len(shard_ranges), start, end, None)))
+                     for shard_index, (start, end) in enumerate(shard_ranges)]
+    rng.shuffle(shard_results)  # Shards finish in any order.
+    merged = []
+    for shard_index, (_, shard_records, shard_skip_reason, shard_summary) in shard_results:
+        assert shard_skip_reason is None
+        for _sequence_number, ready_records in merger.add(shard_index, shard_records, shard_summary):
+            merged.extend(ready_records)
+    assert merger.finished
+    assert sorted(merged) == expected
+    # A later run resumes after a line break, with the number of lines before it.
+    assert 0 < merger.resume_offset <= max(data.rfind(b"\n"), data.rfind(b"\r")) + 1
+    assert data[merger.resume_offset - 1:merger.resume_offset] in (b"\n", b"\r")
+    assert merger.resume_line_count == search._count_line_breaks(data, 0, merger.resume_offset)
+
+
+def test_undecodable_bytes_do_not_hide_hits():
+    data = b"x\nne\xffedle\r\nERROR\xc3\xa9_CODE\rn\xc3\xa9edle\n"
+    hits = list(search.iter_stream_hits([(data, 0, len(data))], make_matcher()))
+    assert [(line_number, pattern_indices) for line_number, _text, pattern_indices, _offset in hits] == [(2, [0])]
+
+
+def run_search(monkeypatch, target_directory, output_path, state_path=None):
+    monkeypatch.setattr(search, "target_directory", str(target_directory))
+    monkeypatch.setattr(search, "output_file_path", str(output_path))
+    monkeypatch.setattr(search, "strings_to_search", SEARCH_STRINGS)
+    monkeypatch.setattr(search, "OUTPUT_FORMAT", "jsonl")
+    monkeypatch.setattr(search, "WORKER_PROCESS_COUNT", 2)
+    monkeypatch.setattr(search, "INCREMENTAL_STATE_PATH", None if state_path is None else str(state_path))
+    search.main_script_logic()
+    return read_jsonl_hits(output_path)
+
+
+@pytest.mark.parametrize("shard_size", [None, 97])
+def test_incremental_resume_matches_full_search(tmp_path, monkeypatch, capsys, shard_size):
+    if shard_size is not None:
+        monkeypatch.setattr(search, "MASSIVE_PLAIN_TEXT_THRESHOLD_BYTES", 1)
+        monkeypatch.setattr(search, "PLAIN_TEXT_SHARD_SIZE_BYTES", shard_size)
+    rng = random.Random(7)
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    (logs / "a.log").write_bytes(random_log_bytes(rng, 300) + b"unfinished needle")
+    # A file ending in '\r' is searched again from its last line, in case a '\n' follows.
+    (logs / "b.log").write_bytes(random_log_bytes(rng, 300) + b"\n")
+    (logs / "c.log").write_bytes(random_log_bytes(rng, 300) + b"\n")
+    with gzip.open(logs / "d.log.gz", "wb") as gz_file:
+        gz_file.write(random_log_bytes(rng, 300))
+    state_path = tmp_path / "state.sqlite"
+
+    def check_incremental_run(summary):
+        capsys.readouterr()
+        incremental_hits = run_search(monkeypatch, logs, tmp_path / "incremental.jsonl", state_path)
+        assert summary in capsys.readouterr().out
+        assert incremental_hits == run_search(monkeypatch, logs, tmp_path / "full.jsonl")
+
+    check_incremental_run("0 file(s) unchanged since the last run, 0 searched from where the last run stopped, "
+                          "4 searched in full.")
+    with open(logs / "a.log", "ab") as log_file:
+        log_file.write(b" continued\r\n" + random_log_bytes(rng, 100) + b"\n")  # Completes the unfinished line.
+    check_incremental_run("3 file(s) unchanged since the last run, 1 searched from where the last run stopped, "
+                          "0 searched in full.")
+    with open(logs / "b.log", "r+b") as log_file:
+        log_file.truncate(500)
+    check_incremental_run("3 file(s) unchanged since the last run, 0 searched from where the last run stopped, "
+                          "1 searched in full.")
+    with open(logs / "b.log", "ab") as log_file:
+        log_file.write(b"ends a needle line\nnew needle\n")
+    check_incremental_run("3 file(s) unchanged since the last run, 1 searched from where the last run stopped, "
+                          "0 searched in full.")
+
+
+def test_indexed_search_matches_brute_force(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "CONTENT_INDEX_BLOCK_SIZE_BYTES", 256)
+    rng = random.Random(11)
+    file_paths = []
+    for file_number in range(6):
+        data = random_log_bytes(rng, 200)
+        if file_number == 5:
+            file_path = str(tmp_path / f"app-{file_number}.log.gz")
+            with gzip.open(file_path, "wb") as gz_file:
+                gz_file.write(data)
+        else:
+            file_path = str(tmp_path / f"app-{file_number}.log")
+            with open(file_path, "wb") as out_file:
+                out_file.write(data.replace(b"needle", b"hay") if file_number < 2 else data)
+        file_paths.append(file_path)
+    index_path = str(tmp_path / "index.sqlite")
+    content_index = search.ContentIndex(index_path)
+    try:
+        for file_path in file_paths:
+            build_plan = content_index.plan_build(file_path)
+            _, blocks, indexed_offset, line_count, error = search.build_index_worker(
+                file_path, build_plan["start_offset"], build_plan["stat"].st_size, build_plan["line_count"],
+                search.CONTENT_INDEX_BLOCK_SIZE_BYTES)
+            assert error is None
+            content_index.record_build(file_path, build_plan, blocks, indexed_offset, line_count)
+        with open(file_paths[0], "ab") as out_file:
+            out_file.write(b"appended after indexing: NEEDLE\n")  # Searched as the file's unindexed tail.
+
+        for strings in (SEARCH_STRINGS, ["needle"], ["nothing like it"]):
+            matcher = make_matcher(strings)
+            trigram_sets = search.query_trigram_sets_for(matcher.originals)
+            brute_force_hits, indexed_hits = [], []
+            for file_path in file_paths:
+                _, records, skip_reason = search.process_file_worker(file_path, matcher)
+                assert skip_reason is None
+                brute_force_hits.extend((file_path, *record) for record in records)
+                unindexed_start, lines_before_unindexed, file_size = content_index.plan_search(file_path)
+                for window_start, window_end in search.plan_index_windows(file_size, unindexed_start):
+                    index_lookup = (index_path, window_start, window_end, unindexed_start,
+                                    (lines_before_unindexed or 0) + 1)
+                    _, records, skip_reason = search.process_indexed_file_worker(
+                        file_path, matcher, trigram_sets, index_lookup)
+                    assert skip_reason is None
+                    indexed_hits.extend((file_path, *record) for record in records)
+            assert sorted(indexed_hits) == sorted(brute_force_hits)
+    finally:
+        content_index.close()
+        search._close_worker_content_index_connections()
+
+
+@pytest.mark.parametrize("path_dictionary", [False, True])
+@pytest.mark.parametrize("output_mode", ["lines", "count", "files"])
+def test_binary_results_read_back_like_jsonl(tmp_path, output_mode, path_dictionary):
+    originals = ["needle", "Grüße", ""]
+    batches = [
+        ("/logs/a.log", [(1, 0, "a needle"), (70000, 1, "Grüße \\ \"quoted\""), (70000, 0, "")]),
+        ("/logs/ünïcode/b.log", [(2 ** 40, 2, "x" * 300)]),
+        ("/logs/a.log", [(70001, 0, "needle again")]),
+    ]
+    if output_mode != "lines":
+        batches = [(file_path, [(pattern_index, line_number) for line_number, pattern_index, _ in records])
+                   for file_path, records in batches]
+    rows_by_format = {}
+    for output_format in ("jsonl", "binary"):
+        results_path = str(tmp_path / f"results.{output_format}")
+        result_writer = search.StreamingResultWriter(results_path, originals, output_format=output_format,
+                                                     output_mode=output_mode, path_dictionary=path_dictionary)
+        for sequence_number, (file_path, records) in enumerate(batches):
+            result_writer.submit(sequence_number, file_path, records)
+        result_writer.close()
+        assert result_writer.write_error is None
+        if output_format == "binary":
+            rows_by_format[output_format] = list(search.iter_binary_results(results_path))
+            continue
+        paths_by_id = {}
+        rows = []
+        with open(results_path, encoding="utf-8") as results_file:
+            for row in map(json.loads, results_file):
+                if "path_id" in row:
+                    if "path" in row:
+                        paths_by_id[row["path_id"]] = row["path"]
+                        continue
+                    row = {"path": paths_by_id[row.pop("path_id")], **row}
+                rows.append(row)
+        rows_by_format[output_format] = rows
+    assert rows_by_format["binary"] == rows_by_format["jsonl"]
+    if output_mode == "lines":
+        assert rows_by_format["binary"] == [
+            {"path": file_path, "line": line_number, "string": originals[pattern_index], "context": context}
+            for file_path, records in batches for line_number, pattern_index, context in records]
+
+
+def test_truncated_binary_results_are_rejected(tmp_path):
+    results_path = str(tmp_path / "results.bin")
+    result_writer = search.StreamingResultWriter(results_path, ["needle"], output_format="binary")
+    result_writer.submit(0, "/logs/a.log", [(1, 0, "a needle")])
+    result_writer.close()
+    with open(results_path, "rb") as results_file:
+        data = results_file.read()
+    with open(results_path, "wb") as results_file:
+        results_file.write(data[:-3])
+    with pytest.raises(ValueError):
+        list(search.iter_binary_results(results_path))